@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import json
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# What a change to each top-level config section takes
+LIVE_KEYS = ("direct_mode", "side", "ntp_servers", "auth")  # Switched between races (auth is read at every login)
+REBUILD_KEYS = ("proxy", "direct", "delivery", "health", "log_server")  # New delivery and health monitor, built in the background
+RESTART_KEYS = ("trace", "log_store", "isolation", "realtime", "watchdog", "peer_clock", "state_board")  # Only read at startup
+
+
+def read_config(path):
+    """Load a config file, raising ValueError instead of falling back to defaults like load_config"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not read {path}: {e}")
+
+
+def is_port(value, allow_zero=False):
+    return isinstance(value, int) and not isinstance(value, bool) and (0 if allow_zero else 1) <= value <= 65535
+
+
+def is_number(value, minimum=0):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > minimum
+
+
+def validate(config):
+    """List of problems that would stop a config from being applied, empty if it is valid"""
+    if not isinstance(config, dict):
+        return ["Configuration must be a JSON object"]
+    errors = []
+
+    def section(name):
+        value = config.get(name, {})
+        if not isinstance(value, dict):
+            errors.append(f"{name} must be an object")
+            return {}
+        return value
+
+    if not isinstance(config.get("direct_mode", False), bool):
+        errors.append("direct_mode must be true or false")
+    if config.get("side", 1) not in (1, 2):
+        errors.append("side must be 1 (red) or 2 (blue)")
+    ntp_servers = config.get("ntp_servers", [])
+    if not isinstance(ntp_servers, list) or not all(isinstance(server, str) and server.strip() for server in ntp_servers):
+        errors.append("ntp_servers must be a list of host names")
+
+    auth = section("auth")
+    for key in ("username", "password"):
+        if key in auth and not (isinstance(auth[key], str) and auth[key]):
+            errors.append(f"auth.{key} must be a non-empty string")
+
+    proxy = section("proxy")
+    if "host" in proxy and not (isinstance(proxy["host"], str) and proxy["host"]):
+        errors.append("proxy.host must be a host name or address")
+    if "port" in proxy and not is_port(proxy["port"]):
+        errors.append("proxy.port must be a port number")
+    if "path" in proxy and not (isinstance(proxy["path"], str) and proxy["path"].startswith("/")):
+        errors.append("proxy.path must start with /")
+
+    direct = section("direct")
+    if "url" in direct:
+        parsed = urlparse(direct["url"]) if isinstance(direct["url"], str) else None
+        if parsed is None or parsed.scheme not in ("http", "https") or not parsed.netloc:
+            errors.append("direct.url must be an http or https URL")
+    for key in ("station_code", "secure_key"):
+        if key in direct and not isinstance(direct[key], str):
+            errors.append(f"direct.{key} must be a string")
+
+    log_server = section("log_server")
+    if "host" in log_server and not isinstance(log_server["host"], str):
+        errors.append("log_server.host must be a string (empty to disable)")
+    if "port" in log_server and not is_port(log_server["port"], allow_zero=True):
+        errors.append("log_server.port must be a port number (0 to disable)")
+
+    delivery_config = section("delivery")
+    if "mode" in delivery_config:
+        from delivery import DELIVERY_MODES
+        if delivery_config["mode"] not in DELIVERY_MODES:
+            errors.append(f"delivery.mode must be one of {', '.join(DELIVERY_MODES)}")
+    for key in ("deadline", "min_timeout", "initial_timeout", "max_timeout"):
+        if key in delivery_config and not is_number(delivery_config[key]):
+            errors.append(f"delivery.{key} must be a positive number of seconds")
+    for key in ("hedge_delay", "backoff_base", "backoff_max"):
+        if key in delivery_config and not (is_number(delivery_config[key]) or delivery_config[key] == 0):
+            errors.append(f"delivery.{key} must be a number of seconds")
+    for extra in delivery_config.get("extra_upstreams", []):
+        if not isinstance(extra, dict) or "name" not in extra or "url" not in extra:
+            errors.append("delivery.extra_upstreams entries need a name and a url")
+
+    health = section("health")
+    for key in ("interval", "probe_timeout", "reset_timeout", "journal_retry"):
+        if key in health and not is_number(health[key]):
+            errors.append(f"health.{key} must be a positive number of seconds")
+    if "failure_threshold" in health and not (isinstance(health["failure_threshold"], int) and health["failure_threshold"] > 0):
+        errors.append("health.failure_threshold must be a positive whole number")
+
+    peer_clock = section("peer_clock")
+    if peer_clock.get("role", "off") not in ("off", "reference", "follower"):
+        errors.append("peer_clock.role must be off, reference or follower")
+    if "port" in peer_clock and not is_port(peer_clock["port"]):
+        errors.append("peer_clock.port must be a port number")
+    if "interval" in peer_clock and not is_number(peer_clock["interval"]):
+        errors.append("peer_clock.interval must be a positive number of seconds")
+    for key in ("reference", "node"):
+        if key in peer_clock and not isinstance(peer_clock[key], str):
+            errors.append(f"peer_clock.{key} must be a string")
+
+    board = section("state_board")
+    if "heartbeat" in board and not is_number(board["heartbeat"]):
+        errors.append("state_board.heartbeat must be a positive number of seconds")
+    if "path" in board and not isinstance(board["path"], str):
+        errors.append("state_board.path must be a string")
+
+    return errors
+
+
+def merge_config(config, updates):
+    """Apply updates to config key by key, so a section sent with one setting keeps its other settings"""
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            merge_config(config[key], value)
+        else:
+            config[key] = value
+    return config
+
+
+def changed_keys(old, new, defaults):
+    """Top-level sections whose effective value differs, missing sections count as their default"""
+    keys = set(old) | set(new)
+    return sorted(key for key in keys if old.get(key, defaults.get(key)) != new.get(key, defaults.get(key)))
+
+
+def needs_rebuild(changed):
+    return any(key in REBUILD_KEYS for key in changed)
+
+
+def restart_required(changed):
+    return [key for key in changed if key in RESTART_KEYS]
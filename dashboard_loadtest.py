@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import types
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+START_PIN = 17
+FINISH_PIN = 27
+
+
+def install_simulated_gpio():
+    """Register an RPi.GPIO stand-in whose input levels the harness sets, returns its level table"""
+    levels = {}
+    gpio = types.ModuleType("RPi.GPIO")
+    gpio.BCM, gpio.IN, gpio.OUT, gpio.PUD_UP, gpio.HIGH, gpio.LOW = 11, 1, 0, 22, 1, 0
+    gpio.setmode = lambda mode: None
+    gpio.setwarnings = lambda flag: None
+    gpio.setup = lambda pin, direction, pull_up_down=None: levels.setdefault(pin, 1)
+    gpio.input = lambda pin: levels.get(pin, 1)
+    gpio.output = lambda pin, value: levels.__setitem__(pin, value)
+    gpio.cleanup = lambda: None
+    package = types.ModuleType("RPi")
+    package.GPIO = gpio
+    sys.modules["RPi"] = package
+    sys.modules["RPi.GPIO"] = gpio
+    return levels
+
+
+class UpstreamRecorder:
+    """Local stand-in for the proxy, noting when each event arrives"""
+
+    def __init__(self):
+        self.events = []
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received = time.time()
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                recorder.events.append((received, body.get("event_type")))
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="upstream", daemon=True).start()
+
+    def arrival(self, event_type, after):
+        """Arrival time of the first event of a type received after a moment"""
+        for received, received_type in list(self.events):
+            if received_type == event_type and received >= after:
+                return received
+        return None
+
+
+class DashboardClient:
+    """One logged-in dashboard: the live log stream plus the polling the web page does"""
+
+    def __init__(self, base_url, auth, stop, poll_interval, matches_interval):
+        self.base_url = base_url
+        self.auth = auth
+        self.stop = stop
+        self.poll_interval = poll_interval
+        self.matches_interval = matches_interval
+        self.latencies = []
+        self.errors = 0
+        self.stream_messages = 0
+
+    def start(self):
+        import requests
+        self.session = requests.Session()
+        self.session.post(f"{self.base_url}/login", data=self.auth, timeout=10)
+        for target, name in ((self.stream, "client-stream"), (self.poll, "client-poll")):
+            threading.Thread(target=target, name=name, daemon=True).start()
+        return self
+
+    def stream(self):
+        """Read /api/log_stream like the page's EventSource"""
+        import requests
+        session = requests.Session()
+        session.cookies.update(self.session.cookies)
+        while not self.stop.is_set():
+            try:
+                with session.get(f"{self.base_url}/api/log_stream", stream=True, timeout=10) as response:
+                    for line in response.iter_lines():
+                        if self.stop.is_set():
+                            break
+                        if line:
+                            self.stream_messages += 1
+            except Exception:
+                self.errors += 1
+                time.sleep(0.5)
+
+    def poll(self):
+        """/api/system_info every poll_interval and /api/matches every matches_interval"""
+        next_matches = 0.0
+        while not self.stop.is_set():
+            paths = ["/api/system_info"]
+            if time.time() >= next_matches:
+                paths.append("/api/matches")
+                next_matches = time.time() + self.matches_interval
+            for path in paths:
+                started = time.perf_counter()
+                try:
+                    response = self.session.get(f"{self.base_url}{path}", timeout=10)
+                    if response.status_code != 200:
+                        self.errors += 1
+                except Exception:
+                    self.errors += 1
+                self.latencies.append(time.perf_counter() - started)
+            self.stop.wait(self.poll_interval)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else None
+
+
+def milliseconds(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def start_system(options, workdir, upstream, web_port):
+    """The real SensorSystem and web_server.app, on temporary files and the local upstream"""
+    import main
+    import web_server
+    from werkzeug.serving import make_server
+
+    config = json.loads(json.dumps(main.DEFAULT_CONFIG))
+    config["proxy"] = {"host": "127.0.0.1", "port": upstream.port, "path": "/proxy"}
+    config["ntp_servers"] = []
+    config["log_server"] = {"host": "", "port": 0}
+    config["delivery"]["journal"] = False
+    config["trace"]["path"] = os.path.join(workdir, "trace.bin")
+    config["log_store"]["dir"] = os.path.join(workdir, "logs")
+    config["realtime"]["enabled"] = options.realtime
+    config_file = os.path.join(workdir, "config.json")
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+
+    main.CONFIG_FILE = config_file
+    main.DEBUG_MODE = False
+    main.START_DELAY = options.start_delay
+    web_server.CONFIG_FILE = config_file
+    web_server.DB_PATH = os.path.join(workdir, "matches.db")
+
+    server = make_server("127.0.0.1", web_port, web_server.app, threaded=True)
+    web_server.run_web_server = server.serve_forever
+
+    system = main.SensorSystem()
+    threading.Thread(target=system.run, name="sensor-loop", daemon=True).start()
+    system.startup_complete.wait(30)
+    return system, config["auth"], server.server_port
+
+
+def run_race(levels, options):
+    """Hold the start sensor past the start delay, release it, then tap the finish sensor; returns the two edge times"""
+    levels[START_PIN] = 0
+    time.sleep(options.start_delay + 0.2)
+    levels[START_PIN] = 1
+    take_off = time.time()
+    time.sleep(options.flight)
+    levels[FINISH_PIN] = 0
+    landing = time.time()
+    time.sleep(0.1)
+    levels[FINISH_PIN] = 1
+    time.sleep(1.3)  # The loop waits a second after a landing
+    return take_off, landing
+
+
+def run(options):
+    levels = install_simulated_gpio()
+    import realtime
+
+    workdir = tempfile.mkdtemp(prefix="dashboard-loadtest-")
+    # INFO like the timer itself, so the log stream carries its usual traffic
+    logging.basicConfig(
+        level=logging.INFO,
+        filename=os.path.join(workdir, "timer.log"),
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    print(f"Timer log: {os.path.join(workdir, 'timer.log')}")
+    upstream = UpstreamRecorder()
+    system, auth, web_port = start_system(options, workdir, upstream, options.port)
+    base_url = f"http://127.0.0.1:{web_port}"
+
+    stop = threading.Event()
+    clients = []
+    results = []
+    print(f"{'clients':>8} {'req/s':>7} {'req p99':>8} {'errors':>7} {'loop p99':>9} {'wake p99':>9} "
+          f"{'wake max':>9} {'dispatch p50':>13} {'dispatch p99':>13} {'dispatch max':>13}  result")
+    for count in options.clients:
+        while len(clients) < count:
+            clients.append(DashboardClient(base_url, {"username": auth["username"], "password": auth["password"]},
+                                           stop, options.poll_interval, options.matches_interval).start())
+        time.sleep(options.warmup)
+
+        # Fresh measurement window for this step
+        system.jitter = realtime.JitterMeter(system.jitter.periods.maxlen)
+        request_marks = [len(client.latencies) for client in clients]
+        error_marks = [client.errors for client in clients]
+        step_started = time.time()
+        dispatch = []
+        for _ in range(options.races):
+            take_off, landing = run_race(levels, options)
+            for event_type, edge in (("take_off", take_off), ("landing", landing)):
+                arrival = upstream.arrival(event_type, edge)
+                dispatch.append(arrival - edge if arrival else float("inf"))
+        step_elapsed = time.time() - step_started
+
+        latencies = [latency for client, mark in zip(clients, request_marks) for latency in client.latencies[mark:]]
+        errors = sum(client.errors - mark for client, mark in zip(clients, error_marks))
+        jitter = system.jitter
+        loop_p99 = percentile(list(jitter.periods), 0.99)
+        wake_p99 = percentile(list(jitter.wake_latencies), 0.99)
+        wake_max = max(jitter.wake_latencies, default=None)
+        dispatch_p99 = percentile(dispatch, 0.99)
+        passed = (errors == 0 and wake_p99 is not None and wake_p99 * 1000 <= options.max_jitter_ms
+                  and dispatch_p99 * 1000 <= options.max_dispatch_ms)
+        results.append((count, passed))
+        print(f"{count:>8} {len(latencies) / step_elapsed:>7.1f} {milliseconds(percentile(latencies, 0.99)):>8} {errors:>7} "
+              f"{milliseconds(loop_p99):>9} {milliseconds(wake_p99):>9} {milliseconds(wake_max):>9} "
+              f"{milliseconds(percentile(dispatch, 0.5)):>13} {milliseconds(dispatch_p99):>13} "
+              f"{milliseconds(max(dispatch)):>13}  {'ok' if passed else 'OVER'}", flush=True)
+
+    stop.set()
+    capacity = None
+    for count, passed in results:
+        if not passed:
+            break
+        capacity = count
+    print(f"Limits: sensor loop wake-up p99 <= {options.max_jitter_ms} ms, edge to dispatch p99 <= {options.max_dispatch_ms} ms, "
+          f"no dashboard errors")
+    if capacity is None:
+        print("Capacity: limits exceeded even at the first step")
+    elif capacity == options.clients[-1]:
+        print(f"Capacity: at least {capacity} dashboard clients (every step passed)")
+    else:
+        print(f"Capacity: {capacity} dashboard clients")
+    return capacity
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the web interface with dashboard clients while simulated races run")
+    parser.add_argument("--clients", default="0,1,2,5,10,20,40", help="Comma separated client counts, one step each")
+    parser.add_argument("--races", type=int, default=5, help="Races per step")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds between adding clients and measuring")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between /api/system_info polls per client")
+    parser.add_argument("--matches-interval", type=float, default=5.0, help="Seconds between /api/matches polls per client")
+    parser.add_argument("--start-delay", type=float, default=0.3, help="Start sensor hold time, shortened to keep races quick")
+    parser.add_argument("--flight", type=float, default=0.5, help="Seconds between take-off and landing")
+    parser.add_argument("--max-jitter-ms", type=float, default=5.0, help="Allowed p99 sensor loop wake-up latency")
+    parser.add_argument("--max-dispatch-ms", type=float, default=50.0, help="Allowed p99 sensor edge to upstream arrival")
+    parser.add_argument("--port", type=int, default=0, help="Web server port, a free one by default")
+    parser.add_argument("--realtime", action="store_true", help="Run the sensor loop in real-time mode")
+    args = parser.parse_args()
+    args.clients = sorted(int(count) for count in args.clients.split(","))
+    run(args)
+    os._exit(0)
@@ -0,0 +1,651 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Delivery modes
+MODE_SINGLE = "single"  # Only the upstream selected by direct_mode (original behaviour)
+MODE_ALL = "all"  # Send to every configured upstream at once, first acknowledgement wins
+MODE_HEDGED = "hedged"  # Send to the primary, add the next upstream after hedge_delay without an ack
+DELIVERY_MODES = (MODE_SINGLE, MODE_ALL, MODE_HEDGED)
+
+# Header carrying the per-event idempotency key
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# Events that could not be delivered are kept here until an upstream comes back
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal.db")
+
+
+class RetryPolicy:
+    """Deadline driven retry settings: jittered exponential backoff and adaptive attempt timeouts"""
+
+    def __init__(self, deadline=8.0, backoff_base=0.1, backoff_max=1.0,
+                 min_timeout=0.5, initial_timeout=2.0, max_timeout=5.0, failover=False):
+        self.deadline = deadline  # Total time budget for one event, across all attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_timeout = min_timeout
+        self.initial_timeout = initial_timeout
+        self.max_timeout = max_timeout
+        self.failover = failover  # In single mode, move to another upstream when a connect fails
+
+    @classmethod
+    def from_config(cls, delivery_config, min_timeout=0.5):
+        """Build a policy from the delivery section of config.json"""
+        return cls(
+            deadline=delivery_config.get("deadline", 8.0),
+            backoff_base=delivery_config.get("backoff_base", 0.1),
+            backoff_max=delivery_config.get("backoff_max", 1.0),
+            min_timeout=delivery_config.get("min_timeout", min_timeout),
+            initial_timeout=delivery_config.get("initial_timeout", 2.0),
+            max_timeout=delivery_config.get("max_timeout", 5.0),
+            failover=delivery_config.get("failover", False)
+        )
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff before the given retry number (1 = first retry)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+class LatencyEstimator:
+    """Smoothed round-trip estimate of an upstream, used to derive per-attempt timeouts"""
+
+    def __init__(self):
+        self.srtt = None  # Smoothed round-trip time
+        self.rttvar = None  # Round-trip time variation
+        self.penalty = 1  # Multiplier after timeouts, reset by the next good sample
+        self.lock = threading.Lock()
+
+    def observe(self, elapsed):
+        """Feed a measured round-trip time (seconds)"""
+        with self.lock:
+            if self.srtt is None:
+                self.srtt = elapsed
+                self.rttvar = elapsed / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - elapsed)
+                self.srtt = 0.875 * self.srtt + 0.125 * elapsed
+            self.penalty = 1
+
+    def timed_out(self):
+        """Back the timeout off after an attempt ran out of time"""
+        with self.lock:
+            self.penalty = min(self.penalty * 2, 8)
+
+    def timeout(self, policy):
+        """Timeout to use for the next attempt"""
+        with self.lock:
+            if self.srtt is None:
+                timeout = policy.initial_timeout
+            else:
+                timeout = self.srtt + 4 * self.rttvar
+            timeout *= self.penalty
+        return max(policy.min_timeout, min(policy.max_timeout, timeout))
+
+
+class DeliveryResult:
+    """Outcome of delivering one event to one upstream"""
+
+    __slots__ = ("upstream", "success", "response_text", "status_code", "elapsed", "attempts")
+
+    def __init__(self, upstream, success, response_text, status_code=None, elapsed=0.0, attempts=None):
+        self.upstream = upstream
+        self.success = success
+        self.response_text = response_text  # Response body, or what went wrong when there was no response
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.attempts = attempts if attempts is not None else []
+
+
+class PayloadTemplate:
+    """Pre-serialized request body with a slot for the event time"""
+
+    # Stands in for the event time while serializing the template
+    TIME_MARKER = "__EVENT_TIME__"
+
+    def __init__(self, json_data, time_field, time_digits):
+        json_data["event_body"][time_field] = self.TIME_MARKER
+        prefix, suffix = json.dumps(json_data).split(json.dumps(self.TIME_MARKER))
+        self.prefix = prefix.encode("utf-8")
+        self.suffix = suffix.encode("utf-8")
+        self.time_digits = time_digits
+
+    def fill(self, event_time):
+        """Body for the given event time, byte-identical to json.dumps of the full payload"""
+        return self.prefix + repr(round(event_time, self.time_digits)).encode("ascii") + self.suffix
+
+
+class PreparedEvent:
+    """Event whose key and payloads were built ahead of time, only the timestamp is missing"""
+
+    def __init__(self, side, event_type, primary, idempotency_key, templates):
+        self.side = side
+        self.event_type = event_type
+        self.primary = primary
+        self.idempotency_key = idempotency_key
+        self.templates = templates  # upstream name -> template with a fill(event_time) method
+
+
+class Upstream:
+    """A single destination (proxy or direct API) that timing events can be delivered to"""
+
+    def __init__(self, name, kind, url, event_types=None):
+        self.name = name
+        self.kind = kind  # "proxy" or "direct", decides the payload format
+        self.url = url
+        # Direct API only receives take_off events, landing goes through the proxy only
+        if event_types is None:
+            event_types = ("take_off",) if kind == "direct" else ("take_off", "landing")
+        self.event_types = tuple(event_types)
+        # Proxy takes millisecond time, the direct API whole seconds
+        self.time_field = "absolute_time" if kind == "direct" else "time"
+        self.time_digits = 0 if kind == "direct" else 3
+        self.session = requests.Session()
+        self.latency = LatencyEstimator()
+        self.breaker = None  # Set by the health monitor
+
+    def close(self):
+        """Release the keep-alive connections"""
+        self.session.close()
+
+    def is_available(self):
+        """Check the circuit breaker, if there is one"""
+        return self.breaker is None or self.breaker.allow()
+
+    def accepts(self, event_type):
+        """Check whether this upstream should receive the given event type"""
+        return event_type in self.event_types
+
+    def build_payload(self, station_code, secure_key, side, event_type, event_time):
+        """Build the JSON body in the format this upstream expects"""
+        return {
+            "station_code": station_code,
+            "secure_key": secure_key,
+            "event_type": event_type,
+            "event_body": {
+                "side": side,
+                self.time_field: round(event_time, self.time_digits)
+            }
+        }
+
+    def serialize(self, station_code, secure_key, side, event_type, event_time, idempotency_key):
+        """Encoded request body for an event"""
+        return json.dumps(self.build_payload(station_code, secure_key, side, event_type, event_time)).encode("utf-8")
+
+    def prepare(self, station_code, secure_key, side, event_type, idempotency_key):
+        """Template of the request body with only the event time left to fill in"""
+        return PayloadTemplate(
+            self.build_payload(station_code, secure_key, side, event_type, 0.0),
+            self.time_field,
+            self.time_digits
+        )
+
+    def warm(self):
+        """Open a keep-alive connection ahead of an expected event"""
+        try:
+            self.session.head(self.url, timeout=2)
+            logger.info(f"[{self.name}] Connection warmed up")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"[{self.name}] Could not warm up connection: {e}")
+
+    def deliver(self, payload, idempotency_key, cancelled, policy, started, deadline, attempts,
+                on_attempt=None):
+        """Send one event, retrying until it is acknowledged, the deadline passes or another upstream won"""
+        headers = {IDEMPOTENCY_HEADER: idempotency_key, "Content-Type": "application/json"}
+        result = DeliveryResult(self.name, False, "No response data")
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.warning(f"[{self.name}] Event deadline of {policy.deadline:.1f}s exceeded")
+                break
+
+            attempt += 1
+            timeout = min(self.latency.timeout(policy), remaining)
+            attempt_started = time.time()
+            record = {
+                "upstream": self.name,
+                "attempt": attempt,
+                "offset": round(attempt_started - started, 3),
+                "timeout": round(timeout, 3)
+            }
+
+            try:
+                if attempt > 1:
+                    logger.info("[%s] Retry attempt %d (%.2fs left)...", self.name, attempt - 1, remaining)
+                response = self.session.post(
+                    self.url,
+                    data=payload,
+                    headers=headers,
+                    timeout=timeout
+                )
+                elapsed = time.time() - attempt_started
+                self.latency.observe(elapsed)
+                record["elapsed"] = round(elapsed, 3)
+                record["status"] = response.status_code
+
+                # Logged after sending with lazy arguments, formatted by the log listener thread
+                logger.info("[%s] Sent data to %s: %s", self.name, self.url, payload.decode("utf-8"))
+
+                logger.info("[%s] Response Status: %s in %.3fs", self.name, response.status_code, elapsed)
+                logger.info("[%s] Response Body: %s", self.name, response.text)
+
+                # Store response for match tracking
+                result = DeliveryResult(
+                    self.name,
+                    response.status_code == 200,
+                    response.text,
+                    response.status_code,
+                    time.time() - started
+                )
+                attempts.append(record)
+
+                if result.success:
+                    logger.info("[%s] Request successful (200 OK)", self.name)
+                else:
+                    logger.warning(f"[{self.name}] Request failed! Non-200 response received: {response.status_code}")
+
+            except requests.exceptions.ConnectionError as e:
+                # Connect failures (refused, unreachable, connect timeout) mean this path is down right now
+                record["elapsed"] = round(time.time() - attempt_started, 3)
+                record["error"] = "connect"
+                attempts.append(record)
+                if isinstance(e, requests.exceptions.Timeout):
+                    self.latency.timed_out()
+                logger.error(f"[{self.name}] Connection error: {e}")
+                result = DeliveryResult(self.name, False, f"Connection error: {e}", None, time.time() - started)
+
+            except requests.exceptions.Timeout as e:
+                record["elapsed"] = round(time.time() - attempt_started, 3)
+                record["error"] = "timeout"
+                attempts.append(record)
+                self.latency.timed_out()
+                logger.error(f"[{self.name}] Request timed out after {timeout:.3f}s: {e}")
+                result = DeliveryResult(self.name, False, f"Timeout: {e}", None, time.time() - started)
+
+            except requests.exceptions.RequestException as e:
+                record["elapsed"] = round(time.time() - attempt_started, 3)
+                record["error"] = type(e).__name__
+                attempts.append(record)
+                logger.error(f"[{self.name}] Request error: {e}")
+                result = DeliveryResult(self.name, False, f"Connection error: {e}", None, time.time() - started)
+
+            if on_attempt:
+                on_attempt(self, record)
+            if result.success:
+                break
+
+            # Jittered exponential backoff, never sleeping past the deadline
+            delay = min(policy.backoff(attempt), max(0, deadline - time.time()))
+            if cancelled.wait(delay):
+                logger.info(f"[{self.name}] Event already delivered elsewhere, stopping retries")
+                break
+
+        result.attempts = attempts
+        return result
+
+
+class EventJournal:
+    """SQLite backed list of events waiting for an upstream to come back"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                side INTEGER NOT NULL,
+                event_type TEXT NOT NULL,
+                event_time REAL NOT NULL,
+                primary_upstream TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to initialize event journal at {self.path}: {e}")
+
+    def append(self, idempotency_key, side, event_type, event_time, primary):
+        """Keep an undelivered event for later replay"""
+        try:
+            with self.lock:
+                conn = sqlite3.connect(self.path)
+                conn.execute(
+                    "INSERT OR IGNORE INTO journal (idempotency_key, side, event_type, event_time, primary_upstream) VALUES (?, ?, ?, ?, ?)",
+                    (idempotency_key, side, event_type, event_time, primary)
+                )
+                conn.commit()
+                conn.close()
+            logger.warning(f"Event {event_type} (key {idempotency_key}) written to journal for later delivery")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to journal event {idempotency_key}: {e}")
+            return False
+
+    def pending(self):
+        """All journaled events, oldest first"""
+        try:
+            with self.lock:
+                conn = sqlite3.connect(self.path)
+                rows = conn.execute(
+                    "SELECT id, idempotency_key, side, event_type, event_time, primary_upstream FROM journal ORDER BY id"
+                ).fetchall()
+                conn.close()
+            return rows
+        except Exception as e:
+            logger.error(f"Failed to read event journal: {e}")
+            return []
+
+    def remove(self, entry_id):
+        """Drop an event after it was delivered"""
+        try:
+            with self.lock:
+                conn = sqlite3.connect(self.path)
+                conn.execute("DELETE FROM journal WHERE id = ?", (entry_id,))
+                conn.commit()
+                conn.close()
+        except Exception as e:
+            logger.error(f"Failed to remove journal entry {entry_id}: {e}")
+
+    def count(self):
+        """Number of events waiting for delivery"""
+        try:
+            with self.lock:
+                conn = sqlite3.connect(self.path)
+                count = conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+                conn.close()
+            return count
+        except Exception:
+            return 0
+
+
+class Delivery:
+    """Delivers timing events to one or more upstreams, serially or concurrently"""
+
+    def __init__(self, upstreams, station_code, secure_key, mode=MODE_SINGLE, hedge_delay=0.25, policy=None,
+                 journal=None):
+        if mode not in DELIVERY_MODES:
+            logger.warning(f"Unknown delivery mode '{mode}', falling back to '{MODE_SINGLE}'")
+            mode = MODE_SINGLE
+        self.upstreams = upstreams  # Ordered list, earlier entries are preferred
+        self.station_code = station_code
+        self.secure_key = secure_key
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.policy = policy or RetryPolicy()
+        self.journal = journal
+        self.health = None  # Set by the health monitor
+        self.replay_lock = threading.Lock()
+        # Losing attempts keep running in the background, so allow two rounds of workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(2, 2 * len(upstreams)),
+            thread_name_prefix="delivery"
+        )
+
+    def close(self):
+        """Wait for background attempts to finish, then release the upstreams, for a delivery replaced by a reload"""
+        self.executor.shutdown(wait=True)
+        for upstream in self.upstreams:
+            upstream.close()
+
+    def get_upstream(self, name):
+        """Find an upstream by name"""
+        for upstream in self.upstreams:
+            if upstream.name == name:
+                return upstream
+        return None
+
+    def select_upstreams(self, event_type, primary, check_health=False):
+        """Pick the upstreams to use for an event, primary first, optionally skipping those that are down"""
+        primary_upstream = self.get_upstream(primary)
+        if self.mode == MODE_SINGLE and not (primary_upstream and primary_upstream.accepts(event_type)):
+            return []
+        candidates = [u for u in self.upstreams if u is not primary_upstream]
+        if primary_upstream:
+            candidates.insert(0, primary_upstream)
+        if self.mode == MODE_SINGLE and not self.policy.failover:
+            # The datagram upstream keeps its HTTP path, the same proxy behind another transport
+            fallback = getattr(primary_upstream, "fallback", None)
+            candidates = candidates[:1] + [u for u in candidates[1:] if u.name == fallback]
+        candidates = [u for u in candidates if u.accepts(event_type)]
+        if check_health:
+            candidates = [u for u in candidates if u.is_available()]
+        return candidates
+
+    def accepts(self, event_type, primary):
+        """Check whether any selected upstream receives the given event type"""
+        return bool(self.select_upstreams(event_type, primary))
+
+    def launch_delays(self, count):
+        """Seconds after the start at which each selected upstream is tried (None = only on failover)"""
+        if self.mode == MODE_ALL:
+            return [0] * count
+        if self.mode == MODE_HEDGED:
+            return [index * self.hedge_delay for index in range(count)]
+        return [0] + [None] * (count - 1)
+
+    def on_attempt(self, upstream, record):
+        """Feed the outcome of an attempt into the health model"""
+        if self.health:
+            # Any HTTP response means the upstream is reachable
+            ok = "status" in record
+            self.health.record(upstream.name, ok, record.get("elapsed", 0), record.get("error"))
+
+    def prepare(self, side, event_type, primary):
+        """Build payload templates and warm up connections for an event that is expected soon"""
+        idempotency_key = uuid.uuid4().hex
+        templates = {}
+        for upstream in self.select_upstreams(event_type, primary):
+            try:
+                templates[upstream.name] = upstream.prepare(
+                    self.station_code, self.secure_key, side, event_type, idempotency_key
+                )
+                self.executor.submit(upstream.warm)
+            except Exception as e:
+                logger.warning(f"[{upstream.name}] Could not prepare {event_type}: {e}")
+        return PreparedEvent(side, event_type, primary, idempotency_key, templates)
+
+    def send(self, side, event_type, event_time, primary, idempotency_key=None, journal=True, prepared=None):
+        """Deliver an event and return the first successful result (or the last failure)"""
+        if prepared is not None:
+            idempotency_key = prepared.idempotency_key
+        if not self.select_upstreams(event_type, primary):
+            return DeliveryResult(None, False, f"No upstream configured for {event_type}")
+
+        # Same key for every upstream and every retry, so receivers can drop duplicates
+        idempotency_key = idempotency_key or uuid.uuid4().hex
+
+        # Upstreams with an open circuit are skipped, if none is left the event goes to the journal
+        targets = self.select_upstreams(event_type, primary, check_health=True)
+        if not targets:
+            logger.warning(f"All upstreams for {event_type} are down, skipping delivery")
+            result = DeliveryResult(None, False, "Upstream unavailable (circuit open)")
+            if journal and self.journal and self.journal.append(idempotency_key, side, event_type, event_time, primary):
+                result.response_text += ", event journaled for replay"
+            return result
+
+        logger.info("Delivering %s (key %s) via %s [%s]", event_type, idempotency_key,
+                    ", ".join(u.name for u in targets), self.mode)
+
+        started = time.time()
+        deadline = started + self.policy.deadline
+        attempts = []  # Shared by all upstreams, in the order attempts were made
+        cancelled = threading.Event()
+        results = queue.Queue()  # DeliveryResult per finished upstream, None when a connect failed
+
+        def on_attempt(upstream, record):
+            self.on_attempt(upstream, record)
+            # A failed connect (or an upstream asking for its fallback) moves on to the next upstream straight away
+            if record.get("error") == "connect" or record.get("fallback"):
+                results.put(None)
+
+        def run(upstream):
+            try:
+                template = prepared.templates.get(upstream.name) if prepared else None
+                if template is not None:
+                    payload = template.fill(event_time)
+                else:
+                    payload = upstream.serialize(
+                        self.station_code, self.secure_key, side, event_type, event_time, idempotency_key
+                    )
+                results.put(upstream.deliver(
+                    payload, idempotency_key, cancelled, self.policy, started, deadline, attempts,
+                    on_attempt=on_attempt
+                ))
+            except Exception as e:
+                results.put(DeliveryResult(upstream.name, False, f"Delivery error: {e}", attempts=attempts))
+
+        if len(targets) == 1:
+            run(targets[0])
+            result = results.get()
+            while result is None:
+                result = results.get()
+            return self.finish(result, side, event_type, event_time, primary, idempotency_key, journal)
+
+        launch_at = [started + delay if delay is not None else None for delay in self.launch_delays(len(targets))]
+        launched = 0
+        finished = 0
+        last_failure = None
+
+        while True:
+            now = time.time()
+            while launched < len(targets) and launch_at[launched] is not None and launch_at[launched] <= now < deadline:
+                if launched > 0 and self.mode != MODE_ALL:
+                    logger.info("No acknowledgement after %.3fs, trying %s", now - started, targets[launched].name)
+                self.executor.submit(run, targets[launched])
+                launched += 1
+
+            if finished == launched and (launched == len(targets) or now >= deadline):
+                break
+
+            # Upstreams give up by the deadline themselves, the grace period only guards against hangs
+            timeout = deadline - now + 1.0
+            if launched < len(targets) and launch_at[launched] is not None:
+                timeout = min(timeout, launch_at[launched] - now)
+            try:
+                result = results.get(timeout=max(0, timeout))
+            except queue.Empty:
+                if time.time() > deadline + 1.0:
+                    break
+                continue
+
+            if result is None:
+                # A failed connect moves on to the next upstream straight away
+                if launched < len(targets):
+                    launch_at[launched] = time.time()
+                continue
+
+            finished += 1
+            if result.success:
+                cancelled.set()
+                logger.info("Event acknowledged by %s after %.3fs", result.upstream, time.time() - started)
+                result.attempts = list(attempts)
+                return result
+
+            last_failure = result
+            # A failed upstream should not hold back the next one
+            if launched < len(targets):
+                launch_at[launched] = time.time()
+
+        cancelled.set()
+        if last_failure is None:
+            last_failure = DeliveryResult(None, False, f"No acknowledgement within {self.policy.deadline:.1f}s")
+        last_failure.attempts = list(attempts)
+        return self.finish(last_failure, side, event_type, event_time, primary, idempotency_key, journal)
+
+    def finish(self, result, side, event_type, event_time, primary, idempotency_key, journal):
+        """Journal an event that no upstream acknowledged before its deadline"""
+        if not result.success and journal and self.journal:
+            if self.journal.append(idempotency_key, side, event_type, event_time, primary):
+                result.response_text += "\n(event journaled for replay)"
+        return result
+
+    def replay_journal(self):
+        """Resend journaled events with their original idempotency keys, oldest first"""
+        if not self.journal or not self.replay_lock.acquire(blocking=False):
+            return
+        try:
+            entries = self.journal.pending()
+            if entries:
+                logger.info(f"Replaying {len(entries)} journaled event(s)")
+            for entry_id, idempotency_key, side, event_type, event_time, primary in entries:
+                result = self.send(side, event_type, event_time, primary, idempotency_key=idempotency_key, journal=False)
+                if not result.success and result.status_code is not None:
+                    # Answered with an error, this event stays journaled but does not hold back the ones after it
+                    logger.warning(f"Journaled {event_type} (key {idempotency_key}) refused with status {result.status_code}, kept")
+                    continue
+                if not result.success:
+                    logger.warning(f"Journal replay stopped, {event_type} (key {idempotency_key}) still undeliverable")
+                    break
+                self.journal.remove(entry_id)
+                logger.info(f"Journaled {event_type} (key {idempotency_key}) delivered via {result.upstream}")
+        finally:
+            self.replay_lock.release()
+
+
+def build_delivery(sensor_system, delivery_config, min_timeout=0.5, journal=None):
+    """Build a Delivery from the sensor system's proxy/direct settings and the delivery config, reusing an open journal if given"""
+    upstreams = [
+        Upstream(
+            "proxy",
+            "proxy",
+            f"http://{sensor_system.SERVER_HOST}:{sensor_system.SERVER_PORT}{sensor_system.SERVER_PATH}"
+        ),
+        Upstream("direct", "direct", sensor_system.DIRECT_SERVER_URL)
+    ]
+
+    # Extra upstreams, e.g. a second proxy on another machine
+    for extra in delivery_config.get("extra_upstreams", []):
+        try:
+            upstreams.append(Upstream(
+                extra["name"],
+                extra.get("kind", "proxy"),
+                extra["url"],
+                extra.get("event_types")
+            ))
+        except KeyError as e:
+            logger.error(f"Invalid extra upstream in delivery config, missing {e}: {extra}")
+
+    # Compact datagram transport to the proxy machine, HTTP proxy stays as the fallback
+    udp_config = delivery_config.get("udp", {})
+    if udp_config.get("enabled", False):
+        from udp_transport import UdpUpstream, DEFAULT_PORT
+        upstreams.insert(0, UdpUpstream(
+            "proxy_udp",
+            udp_config.get("host", sensor_system.SERVER_HOST),
+            udp_config.get("port", DEFAULT_PORT),
+            fallback_after=udp_config.get("fallback_after", 3),
+            min_timeout=udp_config.get("min_timeout", 0.05)
+        ))
+
+    # Restrict and order upstreams if the config lists them explicitly
+    names = delivery_config.get("upstreams")
+    if names:
+        by_name = {u.name: u for u in upstreams}
+        upstreams = [by_name[name] for name in names if name in by_name]
+
+    return Delivery(
+        upstreams,
+        sensor_system.STATION_CODE,
+        sensor_system.SECURE_KEY,
+        mode=delivery_config.get("mode", MODE_SINGLE),
+        hedge_delay=delivery_config.get("hedge_delay", 0.25),
+        policy=RetryPolicy.from_config(delivery_config, min_timeout),
+        journal=(journal or EventJournal()) if delivery_config.get("journal", True) else None
+    )
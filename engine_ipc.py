@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from types import SimpleNamespace
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+import log_pipeline
+import profiler
+
+logger = logging.getLogger(__name__)
+
+# Local socket between the sensor engine and the web process
+ENGINE_SOCKET = os.path.join(tempfile.gettempdir(), "sltimer-engine.sock")
+AUTHKEY_ENV = "SLTIMER_ENGINE_KEY"  # Passes the per-run key to the web process
+
+# Sensor system attributes the web interface may change
+SETTABLE = ("DIRECT_MODE", "NTP_SERVERS", "SIDE")
+
+STATE_INTERVAL = 1.0  # How often the web process refreshes its copy of the engine state
+# Commands that can take seconds (a profile capture, NTP queries, a whole delivery), each sent on a connection of its own
+LONG_COMMANDS = ("profile", "ntp_sync", "trigger_start", "trigger_finish", "logs_query")
+RESTART_DELAY = 2.0  # Wait before restarting a web process that exited
+
+
+class LogForwardHandler(logging.Handler):
+    """Sends formatted log lines to the subscribed web processes"""
+
+    def __init__(self):
+        super().__init__()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+
+    def add(self, conn):
+        with self.connections_lock:
+            self.connections.append(conn)
+
+    def emit(self, record):
+        if not self.connections:
+            return
+        line = self.format(record)
+        with self.connections_lock:
+            for conn in list(self.connections):
+                try:
+                    conn.send(line)
+                except Exception:
+                    self.connections.remove(conn)
+
+
+class EngineServer:
+    """Runs in the sensor process: serves state and commands to the web process, and keeps it running"""
+
+    def __init__(self, sensor_system, address=ENGINE_SOCKET):
+        self.sensor_system = sensor_system
+        self.address = address
+        self.authkey = os.urandom(16)
+        self.listener = None
+        self.process = None
+        self.stopping = False
+
+        # Log lines reach the web process from the log listener thread, not the sensor loop
+        self.log_forwarder = LogForwardHandler()
+        self.log_forwarder.setLevel(logging.INFO)
+        self.log_forwarder.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        log_pipeline.add_handler(self.log_forwarder)
+
+    def start(self):
+        """Listen on the local socket and start the web process"""
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        for target, name in ((self.accept_loop, "engine-ipc"), (self.supervise, "web-supervisor")):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+        self.spawn_web()
+
+    def spawn_web(self):
+        """Start the web interface as a separate Python process"""
+        env = dict(os.environ)
+        env[AUTHKEY_ENV] = self.authkey.hex()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--socket", self.address],
+            env=env
+        )
+        logger.info(f"Web server process started (pid {self.process.pid})")
+
+    def supervise(self):
+        """Restart the web process if it exits"""
+        while not self.stopping:
+            time.sleep(RESTART_DELAY)
+            if self.process is not None and self.process.poll() is not None and not self.stopping:
+                logger.warning(f"Web server process exited with code {self.process.returncode}, restarting")
+                self.spawn_web()
+
+    def stop(self):
+        """Stop the web process"""
+        self.stopping = True
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected engine connection with a wrong key")
+                continue
+            except OSError:
+                break
+            thread = threading.Thread(target=self.handle, args=(conn,), name="engine-ipc-conn")
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, conn):
+        """Answer requests from one connection until it closes"""
+        while True:
+            try:
+                command, args = conn.recv()
+            except (EOFError, OSError):
+                break
+            if command == "subscribe_logs":
+                # From now on this connection only receives log lines
+                self.log_forwarder.add(conn)
+                return
+            try:
+                conn.send(("ok", self.dispatch(command, args)))
+            except Exception as e:
+                try:
+                    conn.send(("error", str(e)))
+                except OSError:
+                    break
+        conn.close()
+
+    def dispatch(self, command, args):
+        """Run one command against the sensor system"""
+        system = self.sensor_system
+        if command == "state":
+            return self.state()
+        if command == "set":
+            name, value = args
+            if name not in SETTABLE:
+                raise ValueError(f"{name} cannot be changed remotely")
+            setattr(system, name, value)
+            return None
+        if command == "trigger_start":
+            return system.trigger_start_event()
+        if command == "trigger_finish":
+            return system.trigger_finish_event()
+        if command == "ntp_sync":
+            response = system.try_ntp_sync()
+            return {"tx_time": response.tx_time, "server": getattr(response, "server", "Unknown")}
+        if command == "health":
+            return system.health_info()
+        if command == "realtime":
+            return system.realtime_info()
+        if command == "watchdog":
+            return system.watchdog_info(*args)
+        if command == "reload_config":
+            return system.reload_config(*args)
+        if command == "peer_clock":
+            return system.peer_clock_info()
+        if command == "local_time":
+            return system.local_time(*args)
+        if command == "profile":
+            return system.profile(*args)
+        if command == "trace_window":
+            return system.trace.window(*args)
+        if command == "logs_tail":
+            return system.log_store.tail(*args)
+        if command == "logs_query":
+            return system.log_store.query(*args)
+        if command == "logs_flush":
+            log_pipeline.drain()
+            return system.log_store.flush()
+        if command == "exit":
+            threading.Thread(target=self.exit_process, daemon=True).start()
+            return None
+        raise ValueError(f"Unknown command {command}")
+
+    def exit_process(self):
+        """Stop both processes, used by the web interface's kill script action"""
+        time.sleep(0.5)
+        self.stop()
+        log_pipeline.drain()
+        if self.sensor_system.log_store:
+            self.sensor_system.log_store.flush()
+        os._exit(0)
+
+    def state(self):
+        """Snapshot of the live state shown by the web interface"""
+        import web_server
+        system = self.sensor_system
+        return {
+            "SIDE": system.SIDE,
+            "DIRECT_MODE": system.DIRECT_MODE,
+            "DEBUG_MODE": system.DEBUG_MODE,
+            "NTP_SERVERS": list(system.NTP_SERVERS),
+            "last_ntp_sync_time": web_server.last_ntp_sync_time,
+            "last_ntp_sync_server": web_server.last_ntp_sync_server,
+            "sensor_states": dict(system.sensor_states),
+            "match_in_progress": system.match_in_progress,
+            "has_trace": system.trace is not None,
+            "has_log_store": system.log_store is not None,
+            "matches_version": web_server.match_cache.version
+        }
+
+
+class RemoteTrace:
+    """Sensor trace of the engine process"""
+
+    def __init__(self, remote):
+        self.remote = remote
+
+    def window(self, start, end):
+        return self.remote.call("trace_window", start, end)
+
+
+class RemoteLogStore:
+    """Log store of the engine process"""
+
+    def __init__(self, remote):
+        self.remote = remote
+
+    def tail(self, count=200):
+        return self.remote.call("logs_tail", count)
+
+    def query(self, start=None, end=None, text=None, limit=1000):
+        return self.remote.call("logs_query", start, end, text, limit)
+
+    def flush(self):
+        return self.remote.call("logs_flush")
+
+
+def remote_setting(name):
+    """Property reading the cached engine state and writing through to the engine"""
+    def getter(self):
+        return self.state[name]
+
+    def setter(self, value):
+        self.call("set", name, value)
+        self.state[name] = value
+    return property(getter, setter)
+
+
+class RemoteSensorSystem:
+    """Stands in for SensorSystem in the web process, forwarding to the engine over the local socket"""
+
+    SIDE = remote_setting("SIDE")
+    DIRECT_MODE = remote_setting("DIRECT_MODE")
+    NTP_SERVERS = remote_setting("NTP_SERVERS")
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.conn = None
+        self.lock = threading.Lock()
+        self.state = {}
+        self.refresh()
+
+        for target, name in ((self.sync_state, "engine-state"), (self.receive_logs, "engine-logs")):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+
+    def connect(self):
+        return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    def call(self, command, *args):
+        """Send a command to the engine and wait for its result, reconnecting once if needed"""
+        if command in LONG_COMMANDS:
+            return self.call_alone(command, *args)
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.conn is None:
+                        self.conn = self.connect()
+                    self.conn.send((command, args))
+                    status, result = self.conn.recv()
+                    break
+                except (EOFError, OSError):
+                    self.conn = None
+                    if attempt:
+                        raise
+        if status == "error":
+            raise RuntimeError(result)
+        return result
+
+    def call_alone(self, command, *args):
+        """Send a long-running command on a connection of its own, so the state sync and other requests are not held up"""
+        conn = self.connect()
+        try:
+            conn.send((command, args))
+            status, result = conn.recv()
+        finally:
+            conn.close()
+        if status == "error":
+            raise RuntimeError(result)
+        return result
+
+    def refresh(self):
+        """Fetch the engine state and mirror the NTP status into the web server module"""
+        import web_server
+        self.state = self.call("state")
+        web_server.last_ntp_sync_time = self.state["last_ntp_sync_time"]
+        web_server.last_ntp_sync_server = self.state["last_ntp_sync_server"]
+        # Matches saved by the engine drop this process's cached match list
+        if web_server.match_cache.follow(self.state.get("matches_version")):
+            web_server.publish_stream("matches")
+
+    def sync_state(self):
+        while True:
+            time.sleep(STATE_INTERVAL)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh engine state: {e}")
+
+    def receive_logs(self):
+        """Feed the engine's log lines into this process's log buffer and stream"""
+        import web_server
+        while True:
+            try:
+                conn = self.connect()
+                conn.send(("subscribe_logs", ()))
+                while True:
+                    web_server.publish_log_line(conn.recv())
+            except Exception as e:
+                logger.warning(f"Engine log stream interrupted: {e}")
+                time.sleep(1)
+
+    @property
+    def DEBUG_MODE(self):
+        return self.state["DEBUG_MODE"]
+
+    @property
+    def sensor_states(self):
+        return self.state["sensor_states"]
+
+    @property
+    def match_in_progress(self):
+        return self.state["match_in_progress"]
+
+    @property
+    def trace(self):
+        return RemoteTrace(self) if self.state.get("has_trace") else None
+
+    @property
+    def log_store(self):
+        return RemoteLogStore(self) if self.state.get("has_log_store") else None
+
+    def try_ntp_sync(self):
+        return SimpleNamespace(**self.call("ntp_sync"))
+
+    def local_time(self, event_time):
+        return self.call("local_time", event_time)
+
+    def trigger_start_event(self):
+        self.call("trigger_start")
+
+    def trigger_finish_event(self):
+        self.call("trigger_finish")
+
+    def health_info(self):
+        return self.call("health")
+
+    def realtime_info(self):
+        return self.call("realtime")
+
+    def watchdog_info(self, stacks=False):
+        return self.call("watchdog", stacks)
+
+    def reload_config(self, config=None):
+        return self.call("reload_config", config)
+
+    def peer_clock_info(self):
+        return self.call("peer_clock")
+
+    def profile(self, mode, target, seconds, interval=None, output=None):
+        return self.call("profile", mode, target, seconds, interval or profiler.DEFAULT_INTERVAL, output)
+
+    def exit_engine(self):
+        self.call("exit")
+
+
+def run_web_process(address):
+    """Entry point of the web process"""
+    import web_server
+    authkey = bytes.fromhex(os.environ[AUTHKEY_ENV])
+    sensor_system = RemoteSensorSystem(address, authkey)
+    web_server.initialize_web_server(sensor_system)
+    logger.info("Web server process connected to the sensor engine")
+    web_server.run_web_server()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Web interface process of the isolated mode")
+    parser.add_argument("--socket", default=ENGINE_SOCKET, help="Engine socket path")
+    options = parser.parse_args()
+    run_web_process(options.socket)
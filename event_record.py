@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import zlib
+from datetime import datetime
+
+RESPONSE_LIMIT = 512  # Characters of a response body kept with a match
+COMPRESS_MIN = 96  # Bodies shorter than this (in bytes) are stored as plain text
+
+LOG_LINES = {
+    "take_off": "Starting take-off event at {time}, side: {side}",
+    "landing": "Landing event at {time}, side: {side}"
+}
+
+
+def format_time(event_time):
+    return datetime.fromtimestamp(event_time).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def log_line(event_type, event_time, side):
+    """The log line of an event, derived from its fields rather than stored"""
+    return LOG_LINES[event_type].format(time=format_time(event_time), side=side)
+
+
+def pack_response(text):
+    """Response text as stored with a match: cut to RESPONSE_LIMIT, zlib-compressed (bytes) when that is smaller"""
+    if text is None:
+        return None
+    if len(text) > RESPONSE_LIMIT:
+        text = f"{text[:RESPONSE_LIMIT]}... ({len(text) - RESPONSE_LIMIT} more characters)"
+    encoded = text.encode("utf-8")
+    if len(encoded) >= COMPRESS_MIN:
+        compressed = zlib.compress(encoded, 9)
+        if len(compressed) < len(encoded):
+            return compressed
+    return text
+
+
+def unpack_response(value):
+    """Stored response back to text, plain text (older rows) passes through"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8", "replace")
+    return value
+
+
+def response_text(status, value):
+    """Response as shown with a match, the status line comes from its own column"""
+    body = unpack_response(value)
+    if status is None:
+        return body  # Errors, skipped requests, and rows stored before the status column
+    return f"Status: {status}\nBody: {body}"
+
+
+class EventRecord:
+    """One take-off or landing and how its delivery went, from the sensor loop to the matches table"""
+
+    __slots__ = ("side", "event_type", "event_time", "upstream", "success", "status", "latency", "response", "attempts")
+
+    def __init__(self, side, event_type, event_time, upstream=None, success=False, status=None, latency=None,
+                 response=None, attempts=()):
+        self.side = side
+        self.event_type = event_type
+        self.event_time = event_time
+        self.upstream = upstream  # Name of the upstream that answered last
+        self.success = success
+        self.status = status  # HTTP status (or UDP ACK status), None without an answer
+        self.latency = latency  # Seconds from the first attempt to the answer
+        self.response = response  # Response body, or the error when there was none
+        self.attempts = attempts  # Delivery attempt records, in the order they were made
+
+    @classmethod
+    def delivered(cls, side, event_type, event_time, result):
+        """Record of an event sent by Delivery.send"""
+        return cls(side, event_type, event_time, result.upstream, result.success, result.status_code,
+                   result.elapsed or None, result.response_text, tuple(result.attempts))
+
+    def log_line(self):
+        return log_line(self.event_type, self.event_time, self.side)
+
+    def __repr__(self):
+        return f"EventRecord({self.event_type}, side {self.side}, {self.event_time:.3f}, status {self.status})"
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states
+STATE_CLOSED = "closed"  # Upstream healthy, events flow normally
+STATE_OPEN = "open"  # Upstream down, events skip it
+STATE_HALF_OPEN = "half_open"  # Cooldown over, the next event is a trial
+
+
+class CircuitBreaker:
+    """Stops sending to an upstream after repeated failures until it recovers"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=15.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None  # When the half-open trial was let through, None while none is in flight
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Check whether a request may be sent now, only one trial at a time while half open"""
+        with self.lock:
+            now = time.time()
+            if self.state == STATE_OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+                self.trial_started = now
+                return True
+            if self.state == STATE_HALF_OPEN:
+                # A trial that was let through but never reported back (say, a failover slot that was not used) expires
+                if self.trial_started is not None and now - self.trial_started < self.reset_timeout:
+                    return False
+                self.trial_started = now
+                return True
+            return self.state != STATE_OPEN
+
+    def is_open(self):
+        """Check the state without triggering a half-open trial"""
+        with self.lock:
+            return self.state == STATE_OPEN
+
+    def record_success(self):
+        """Close the breaker after a successful request or probe, returns True if it was not closed"""
+        with self.lock:
+            changed = self.state != STATE_CLOSED
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started = None
+            return changed
+
+    def record_failure(self):
+        """Count a failure, opening the breaker once the threshold is reached, returns True if it opened"""
+        with self.lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN or (self.state == STATE_CLOSED and self.failures >= self.failure_threshold):
+                self.state = STATE_OPEN
+                self.opened_at = time.time()
+                self.trial_started = None
+                return True
+            return False
+
+
+class EndpointHealth:
+    """Rolling latency and availability of one endpoint"""
+
+    def __init__(self, name, host, port, breaker, window=60, probe_fn=None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.breaker = breaker
+        self.probe_fn = probe_fn  # Custom probe returning the latency, TCP connect if not set
+        self.samples = deque(maxlen=window)  # (timestamp, ok, latency seconds)
+        self.last_error = None
+        self.last_probe = None
+
+    def add_sample(self, ok, latency, error=None):
+        """Record the outcome of a probe or a real request"""
+        self.samples.append((time.time(), ok, latency))
+        self.last_probe = time.time()
+        if ok:
+            self.last_error = None
+        else:
+            self.last_error = error
+
+    def snapshot(self):
+        """Summary for the web interface"""
+        samples = list(self.samples)
+        latencies = sorted(latency for _, ok, latency in samples if ok)
+        availability = (sum(1 for _, ok, _ in samples if ok) / len(samples) * 100) if samples else None
+        return {
+            "name": self.name,
+            "host": self.host,
+            "port": self.port,
+            "state": self.breaker.state,
+            "availability": round(availability, 1) if availability is not None else None,
+            "latency_avg_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None,
+            "samples": len(samples),
+            "last_error": self.last_error,
+            "last_probe": self.last_probe
+        }
+
+
+def endpoint_from_url(url):
+    """Extract host and port from an upstream URL"""
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    return parsed.hostname, port
+
+
+class HealthMonitor:
+    """Background thread probing the upstreams and the log server, driving their circuit breakers"""
+
+    def __init__(self, delivery, log_server_host=None, log_server_port=None, health_config=None):
+        health_config = health_config or {}
+        self.interval = health_config.get("interval", 5.0)
+        self.probe_timeout = health_config.get("probe_timeout", 2.0)
+        self.window = health_config.get("window", 60)
+        self.failure_threshold = health_config.get("failure_threshold", 3)
+        self.reset_timeout = health_config.get("reset_timeout", 15.0)
+        self.replay_journal = health_config.get("replay_journal", True)
+        self.journal_retry = health_config.get("journal_retry", 30.0)
+        self.next_replay = 0.0  # The first pass replays, so events journaled before a restart go out at startup
+
+        self.delivery = delivery
+        self.endpoints = {}
+        for upstream in delivery.upstreams:
+            host, port = endpoint_from_url(upstream.url)
+            upstream.breaker = self.new_breaker()
+            self.endpoints[upstream.name] = EndpointHealth(
+                upstream.name, host, port, upstream.breaker, self.window, getattr(upstream, "probe", None)
+            )
+        if log_server_host and log_server_port:
+            self.endpoints["log_server"] = EndpointHealth(
+                "log_server", log_server_host, log_server_port, self.new_breaker(), self.window
+            )
+
+        # Real requests feed the same model as the probes
+        delivery.health = self
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def new_breaker(self):
+        """Create a breaker with the configured thresholds"""
+        return CircuitBreaker(self.failure_threshold, self.reset_timeout)
+
+    def start(self):
+        """Start probing in a daemon thread"""
+        self.thread = threading.Thread(target=self.run, name="health-monitor")
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Health monitor started, probing {', '.join(self.endpoints)} every {self.interval:.0f}s")
+
+    def stop(self):
+        """Stop the probing thread"""
+        self.stop_event.set()
+
+    def is_available(self, name):
+        """Check whether events should be sent to the named endpoint right now"""
+        endpoint = self.endpoints.get(name)
+        return endpoint is None or endpoint.breaker.allow()
+
+    def record(self, name, ok, latency, error=None):
+        """Record the outcome of a real request to an endpoint"""
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            return
+        endpoint.add_sample(ok, latency, error)
+        self.update_breaker(endpoint, ok)
+
+    def update_breaker(self, endpoint, ok):
+        """Feed an outcome into the endpoint's breaker and log state changes"""
+        if ok:
+            if endpoint.breaker.record_success():
+                logger.info(f"Upstream {endpoint.name} is reachable again, circuit closed")
+                if self.replay_journal and endpoint.name != "log_server":
+                    self.start_replay()
+        elif endpoint.breaker.record_failure():
+            logger.warning(f"Upstream {endpoint.name} is down ({endpoint.last_error}), circuit opened")
+
+    def start_replay(self):
+        """Resend the journal in the background, a replay already running makes this a no-op"""
+        self.next_replay = time.time() + self.journal_retry
+        replay_thread = threading.Thread(target=self.delivery.replay_journal, name="journal-replay")
+        replay_thread.daemon = True
+        replay_thread.start()
+
+    def replay_pending(self):
+        """Replay the journal every journal_retry seconds while it holds events and an upstream is up
+
+        Events journaled after an error reply or a few timeouts never open a circuit, so waiting
+        for one to close would leave them in the journal.
+        """
+        journal = self.delivery.journal
+        if not self.replay_journal or journal is None or time.time() < self.next_replay:
+            return
+        if journal.count() == 0:
+            return
+        if any(upstream.breaker is None or not upstream.breaker.is_open() for upstream in self.delivery.upstreams):
+            self.start_replay()
+
+    def probe(self, endpoint):
+        """Measure the TCP connect time (or custom probe round trip) of an endpoint"""
+        started = time.time()
+        try:
+            if endpoint.probe_fn:
+                latency = endpoint.probe_fn(self.probe_timeout)
+            else:
+                conn = socket.create_connection((endpoint.host, endpoint.port), timeout=self.probe_timeout)
+                conn.close()
+                latency = time.time() - started
+            endpoint.add_sample(True, latency)
+            self.update_breaker(endpoint, True)
+        except Exception as e:
+            endpoint.add_sample(False, time.time() - started, str(e))
+            self.update_breaker(endpoint, False)
+
+    def run(self):
+        """Probe every endpoint once per interval"""
+        while not self.stop_event.is_set():
+            for endpoint in list(self.endpoints.values()):
+                try:
+                    self.probe(endpoint)
+                except Exception as e:
+                    logger.error(f"Health probe of {endpoint.name} failed unexpectedly: {e}")
+            try:
+                self.replay_pending()
+            except Exception as e:
+                logger.error(f"Journal replay check failed: {e}")
+            self.stop_event.wait(self.interval)
+
+    def snapshot(self):
+        """Health of every endpoint for /api/system_info"""
+        return [endpoint.snapshot() for endpoint in self.endpoints.values()]
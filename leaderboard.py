@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+import time
+
+WHOLE_SESSION = 0  # heat_id of the leaderboard rows covering every heat of a session
+
+
+def create_tables(cursor):
+    """Create the session, heat and pilot tables and the materialized leaderboard"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS heats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL REFERENCES sessions(id),
+        name TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pilots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        created_at REAL NOT NULL
+    )
+    ''')
+    # Who races next on each side, stamped onto the match when it is saved
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS assignments (
+        side INTEGER PRIMARY KEY,
+        session_id INTEGER,
+        heat_id INTEGER,
+        pilot_id INTEGER
+    )
+    ''')
+    # One row per pilot for the whole session (heat_id 0) and per heat
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS leaderboard (
+        session_id INTEGER NOT NULL,
+        heat_id INTEGER NOT NULL,
+        pilot_id INTEGER NOT NULL,
+        best_time REAL NOT NULL,
+        best_match_id INTEGER NOT NULL,
+        runs INTEGER NOT NULL,
+        total_time REAL NOT NULL,
+        last_time REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (session_id, heat_id, pilot_id)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_leaderboard_rank ON leaderboard (session_id, heat_id, best_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_heats_session ON heats (session_id)')
+
+
+def create_indexes(cursor):
+    """Indexes on the matches columns used to refresh a pilot's leaderboard rows"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_session_pilot ON matches (session_id, pilot_id)')
+
+
+def create_session(cursor, name):
+    """Add a session, returns its id"""
+    cursor.execute('INSERT INTO sessions (name, created_at) VALUES (?, ?)', (name, time.time()))
+    return cursor.lastrowid
+
+
+def create_heat(cursor, session_id, name):
+    """Add a heat to a session, returns its id"""
+    cursor.execute('INSERT INTO heats (session_id, name, created_at) VALUES (?, ?, ?)', (session_id, name, time.time()))
+    return cursor.lastrowid
+
+
+def create_pilot(cursor, name):
+    """Add a pilot (or find the existing one with that name), returns its id"""
+    cursor.execute('INSERT OR IGNORE INTO pilots (name, created_at) VALUES (?, ?)', (name, time.time()))
+    cursor.execute('SELECT id FROM pilots WHERE name = ?', (name,))
+    return cursor.fetchone()[0]
+
+
+def list_sessions(cursor):
+    """Sessions with their heats, newest first"""
+    cursor.execute('SELECT id, name, created_at FROM sessions ORDER BY id DESC')
+    sessions = [{"id": row[0], "name": row[1], "created_at": row[2], "heats": []} for row in cursor.fetchall()]
+    by_id = {session["id"]: session for session in sessions}
+    cursor.execute('SELECT id, session_id, name FROM heats ORDER BY id')
+    for heat_id, session_id, name in cursor.fetchall():
+        if session_id in by_id:
+            by_id[session_id]["heats"].append({"id": heat_id, "name": name})
+    return sessions
+
+
+def list_pilots(cursor):
+    """All pilots by name"""
+    cursor.execute('SELECT id, name FROM pilots ORDER BY name')
+    return [{"id": row[0], "name": row[1]} for row in cursor.fetchall()]
+
+
+def get_assignments(cursor):
+    """Current session, heat and pilot of each side"""
+    cursor.execute('SELECT side, session_id, heat_id, pilot_id FROM assignments ORDER BY side')
+    return {str(row[0]): {"session_id": row[1], "heat_id": row[2], "pilot_id": row[3]} for row in cursor.fetchall()}
+
+
+def set_assignment(cursor, side, session_id, heat_id, pilot_id):
+    """Set who races next on a side"""
+    cursor.execute('INSERT OR REPLACE INTO assignments (side, session_id, heat_id, pilot_id) VALUES (?, ?, ?, ?)',
+                   (side, session_id, heat_id, pilot_id))
+
+
+def refresh(cursor, session_id, pilot_id):
+    """Recompute a pilot's leaderboard rows for a session from their matches (an index lookup)"""
+    if session_id is None or pilot_id is None:
+        return
+    cursor.execute('DELETE FROM leaderboard WHERE session_id = ? AND pilot_id = ?', (session_id, pilot_id))
+    cursor.execute('''
+    SELECT COALESCE(heat_id, 0), id, match_time FROM matches
+    WHERE session_id = ? AND pilot_id = ? AND completed = 1
+    ORDER BY id
+    ''', (session_id, pilot_id))
+    rows = {}
+    for heat_id, match_id, match_time in cursor.fetchall():
+        for key in {WHOLE_SESSION, heat_id}:
+            row = rows.get(key)
+            if row is None:
+                rows[key] = [match_time, match_id, 1, match_time, match_time]
+                continue
+            if match_time < row[0]:
+                row[0], row[1] = match_time, match_id
+            row[2] += 1
+            row[3] += match_time
+            row[4] = match_time
+    now = time.time()
+    cursor.executemany('''
+    INSERT INTO leaderboard (session_id, heat_id, pilot_id, best_time, best_match_id, runs, total_time, last_time, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(session_id, heat_id, pilot_id, *row, now) for heat_id, row in rows.items()])
+
+
+def assign_match(cursor, match_id, session_id, heat_id, pilot_id):
+    """Attach a match to a session, heat and pilot, keeping the leaderboards of the old and new pilot current"""
+    cursor.execute('SELECT session_id, pilot_id FROM matches WHERE id = ?', (match_id,))
+    previous = cursor.fetchone()
+    if previous is None:
+        return False
+    cursor.execute('UPDATE matches SET session_id = ?, heat_id = ?, pilot_id = ? WHERE id = ?',
+                   (session_id, heat_id, pilot_id, match_id))
+    refresh(cursor, *previous)
+    if tuple(previous) != (session_id, pilot_id):
+        refresh(cursor, session_id, pilot_id)
+    return True
+
+
+def stamp_match(cursor, side, match_id):
+    """Attach a newly saved match to the side's current assignment, then free the pilot slot; returns the session id
+
+    A run without a pilot stays unfiled: it would never reach a leaderboard, and filed matches are not pruned.
+    """
+    cursor.execute('SELECT session_id, heat_id, pilot_id FROM assignments WHERE side = ?', (side,))
+    assignment = cursor.fetchone()
+    if assignment is None or assignment[0] is None or assignment[2] is None:
+        return None
+    assign_match(cursor, match_id, *assignment)
+    # Each run is one pilot, the next one has to be picked again
+    cursor.execute('UPDATE assignments SET pilot_id = NULL WHERE side = ?', (side,))
+    return assignment[0]
+
+
+def get_leaderboard(cursor, session_id, heat_id=WHOLE_SESSION, limit=50):
+    """Ranked pilots of a session or one of its heats, read straight from the materialized table"""
+    cursor.execute('''
+    SELECT l.pilot_id, p.name, l.best_time, l.best_match_id, l.runs, l.total_time, l.last_time
+    FROM leaderboard l JOIN pilots p ON p.id = l.pilot_id
+    WHERE l.session_id = ? AND l.heat_id = ?
+    ORDER BY l.best_time
+    LIMIT ?
+    ''', (session_id, heat_id, limit))
+    return [{
+        "rank": rank,
+        "pilot_id": pilot_id,
+        "pilot": name,
+        "best_time": round(best_time, 3),
+        "best_match_id": best_match_id,
+        "runs": runs,
+        "mean_time": round(total_time / runs, 3),
+        "last_time": round(last_time, 3)
+    } for rank, (pilot_id, name, best_time, best_match_id, runs, total_time, last_time)
+        in enumerate(cursor.fetchall(), 1)]
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# Records waiting for the listener thread
+log_records = queue.Queue(-1)
+listener = None
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues the record as it is, message formatting is left to the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+def start():
+    """Move the root logger's handlers behind a queue served by a background thread"""
+    global listener
+    if listener is not None:
+        return listener
+    root = logging.getLogger()
+    handlers = tuple(root.handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(RecordQueueHandler(log_records))
+
+    listener = logging.handlers.QueueListener(log_records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop)
+    return listener
+
+
+def add_handler(handler):
+    """Attach a handler after the pipeline has started"""
+    if listener is None:
+        logging.getLogger().addHandler(handler)
+    else:
+        listener.handlers = listener.handlers + (handler,)
+
+
+def drain(timeout=2.0):
+    """Wait until the listener has handled everything queued so far"""
+    deadline = time.time() + timeout
+    while listener is not None and log_records.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def stop():
+    """Handle the remaining records and stop the listener thread"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+import os
+import sys
+import zlib
+import struct
+import atexit
+import logging
+import threading
+
+# Directory holding the log segments, next to the script like the databases
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+# Sparse index entry, one per written block: first and last timestamp, offset, length, compressed flag
+BLOCK = struct.Struct("<ddQIB3x")
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class LogStore:
+    """Size-rotated log segments written in blocks, with a per-block time index for tail and range reads"""
+
+    def __init__(self, directory=LOG_DIR, segment_bytes=1024 * 1024, max_bytes=16 * 1024 * 1024,
+                 compress=True, flush_interval=5.0, block_bytes=64 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.block_bytes = block_bytes
+        self.lock = threading.Lock()
+
+        # Lines not written yet, flushed as one block to keep SD card writes few and large
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_first = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.index = {}  # segment name -> list of block entries
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".log"):
+                self.index[name[:-4]] = self.load_index(name[:-4])
+        self.active = None
+        if self.index:
+            newest = max(self.index)
+            if os.path.getsize(self.data_path(newest)) < segment_bytes:
+                self.active = newest
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="log-store")
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def data_path(self, segment):
+        return os.path.join(self.directory, f"{segment}.log")
+
+    def index_path(self, segment):
+        return os.path.join(self.directory, f"{segment}.idx")
+
+    def load_index(self, segment):
+        """Read the block index of a segment, ignoring a torn last entry"""
+        try:
+            with open(self.index_path(segment), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        usable = len(data) - len(data) % BLOCK.size
+        return list(BLOCK.iter_unpack(data[:usable]))
+
+    def append(self, timestamp, line):
+        """Queue one formatted log line, written with the next block"""
+        # One line per entry, multi-line messages (tracebacks) are escaped
+        line = line.replace("\n", "\\n")
+        entry = f"{timestamp:.6f} {line}\n"
+        with self.lock:
+            if self.pending_first is None:
+                self.pending_first = timestamp
+            self.pending.append(entry)
+            self.pending_bytes += len(entry)
+            if self.pending_bytes >= self.block_bytes:
+                self.write_block()
+
+    def flush(self):
+        """Write out the pending lines now"""
+        with self.lock:
+            self.write_block()
+
+    def write_block(self):
+        """Append the pending lines as one (compressed) block and its index entry, caller holds the lock"""
+        if not self.pending:
+            return
+        data = "".join(self.pending).encode("utf-8")
+        last = float(self.pending[-1].split(" ", 1)[0])
+        first = self.pending_first
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_first = None
+
+        compressed = 0
+        if self.compress:
+            packed = zlib.compress(data, 6)
+            if len(packed) < len(data):
+                data = packed
+                compressed = 1
+
+        if self.active is None:
+            self.active = f"{int(first * 1000):013d}"
+            self.index[self.active] = []
+        path = self.data_path(self.active)
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        entry = (first, last, offset, len(data), compressed)
+        with open(self.index_path(self.active), "ab") as f:
+            f.write(BLOCK.pack(*entry))
+        self.index[self.active].append(entry)
+
+        if offset + len(data) >= self.segment_bytes:
+            self.active = None
+            self.enforce_retention()
+
+    def enforce_retention(self):
+        """Delete the oldest segments once the store is over its size budget"""
+        sizes = {segment: os.path.getsize(self.data_path(segment)) for segment in self.index}
+        total = sum(sizes.values())
+        for segment in sorted(self.index):
+            if total <= self.max_bytes or segment == self.active:
+                break
+            for path in (self.data_path(segment), self.index_path(segment)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= sizes[segment]
+            del self.index[segment]
+
+    def run(self):
+        """Flush pending lines every flush_interval seconds"""
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                # Logging here would feed back into the store; stderr like logging.Handler.handleError
+                sys.stderr.write(f"Log store flush failed: {e}\n")
+
+    def read_block(self, segment, entry):
+        """Decode one block into (timestamp, line) pairs"""
+        _, _, offset, length, compressed = entry
+        try:
+            with open(self.data_path(segment), "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+        except FileNotFoundError:
+            return []  # Removed by retention meanwhile
+        if compressed:
+            data = zlib.decompress(data)
+        return [parse_line(line) for line in data.decode("utf-8", "replace").splitlines()]
+
+    def snapshot(self):
+        """Blocks in time order and the pending lines, taken under the lock"""
+        with self.lock:
+            blocks = [(segment, entry) for segment in sorted(self.index) for entry in self.index[segment]]
+            pending = [parse_line(line.rstrip("\n")) for line in self.pending]
+        return blocks, pending
+
+    def tail(self, count=200):
+        """The last lines, reading only as many blocks from the end as needed"""
+        blocks, lines = self.snapshot()
+        for segment, entry in reversed(blocks):
+            if len(lines) >= count:
+                break
+            lines = self.read_block(segment, entry) + lines
+        return lines[-count:]
+
+    def query(self, start=None, end=None, text=None, limit=1000):
+        """Lines between two timestamps containing a text, reading only the blocks that overlap the range"""
+        blocks, pending = self.snapshot()
+        needle = text.lower() if text else None
+        results = []
+        for segment, entry in blocks:
+            if (start is not None and entry[1] < start) or (end is not None and entry[0] > end):
+                continue
+            results.extend(self.read_block(segment, entry))
+        results.extend(pending)
+        matched = [
+            (timestamp, line) for timestamp, line in results
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end)
+            and (needle is None or needle in line.lower())
+        ]
+        return matched[-limit:]
+
+    def close(self):
+        """Stop the flush thread and write what is pending"""
+        self.stop_event.set()
+        self.flush()
+
+
+def parse_line(line):
+    """Split a stored line into its timestamp and the formatted log line"""
+    timestamp, _, text = line.partition(" ")
+    try:
+        return float(timestamp), text.replace("\\n", "\n")
+    except ValueError:
+        return 0.0, line
+
+
+class LogStoreHandler(logging.Handler):
+    """Logging handler writing into a LogStore"""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def emit(self, record):
+        # Web access logs would fill the store with polling requests
+        if record.name == "werkzeug":
+            return
+        try:
+            self.store.append(record.created, self.format(record))
+            if record.levelno >= logging.ERROR:
+                self.store.flush()
+        except Exception:
+            self.handleError(record)
+
+
+def install(store_config):
+    """Create the store from the log_store config section and attach it to the root logger"""
+    store = LogStore(
+        store_config.get("dir", LOG_DIR),
+        store_config.get("segment_bytes", 1024 * 1024),
+        store_config.get("max_bytes", 16 * 1024 * 1024),
+        store_config.get("compress", True),
+        store_config.get("flush_interval", 5.0)
+    )
+    handler = LogStoreHandler(store)
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.getLogger().addHandler(handler)
+    return store
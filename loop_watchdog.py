@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+STALL_BUCKETS = (5.0, 30.0, 120.0)  # Upper bounds in seconds of the stall duration counters
+
+
+def sd_notify(message):
+    """Send a state line to systemd's notify socket, False when not run by systemd"""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]  # Abstract namespace
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.sendto(message.encode("utf-8"), address)
+    return True
+
+
+def systemd_watchdog_interval():
+    """Half the unit's WatchdogSec in seconds, None if the systemd watchdog is not enabled for this process"""
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6 / 2
+
+
+def bucket_label(index):
+    if index == 0:
+        return f"<{STALL_BUCKETS[0]:g}s"
+    if index == len(STALL_BUCKETS):
+        return f">={STALL_BUCKETS[-1]:g}s"
+    return f"{STALL_BUCKETS[index - 1]:g}-{STALL_BUCKETS[index]:g}s"
+
+
+class LoopWatchdog:
+    """Notices when the sensor loop stops beating: stack snapshots, an alarm, stall counters and the systemd watchdog"""
+
+    def __init__(self, watchdog_config=None, alarm=None):
+        watchdog_config = watchdog_config or {}
+        self.enabled = watchdog_config.get("enabled", True)
+        self.stall_threshold = watchdog_config.get("stall_threshold", 2.5)
+        self.check_interval = watchdog_config.get("check_interval", 0.25)
+        self.snapshot_interval = watchdog_config.get("snapshot_interval", 5.0)
+        self.systemd = watchdog_config.get("systemd", True)
+        self.alarm = alarm  # Called with True/False alternately while stalled, False once the loop runs again
+        self.snapshots = deque(maxlen=watchdog_config.get("snapshots", 10))
+
+        self.last_beat = None
+        self.busy_until = 0.0  # Monotonic time up to which the loop announced it may block
+        self.thread_id = None
+        self.stall_started = None  # Last beat before the current stall
+        self.last_snapshot = None
+        self.alarm_lit = False
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.longest_stall = 0.0
+        self.last_stall = None  # (wall clock end, duration) of the last finished stall
+        self.buckets = [0] * (len(STALL_BUCKETS) + 1)
+        self.notify_interval = None
+        self.stopped = threading.Event()
+        self.checker = None
+
+    def start(self):
+        """Watch the calling thread, which must call beat() on every loop iteration"""
+        if not self.enabled:
+            return
+        self.thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        if self.systemd:
+            self.notify_interval = systemd_watchdog_interval()
+            if self.notify_interval:
+                logger.info(f"Feeding the systemd watchdog every {self.notify_interval:.1f}s while the sensor loop runs")
+        self.checker = threading.Thread(target=self.check_loop, name="loop-watchdog", daemon=True)
+        self.checker.start()
+
+    def beat(self):
+        # Sensor loop hot path: one attribute store
+        self.last_beat = time.monotonic()
+
+    def expect(self, seconds):
+        """The loop is about to block for at most seconds (a landing): systemd stays fed and no stall is counted until then"""
+        self.busy_until = time.monotonic() + seconds
+
+    def stop(self):
+        self.stopped.set()
+
+    def check_loop(self):
+        last_notify = 0.0
+        while not self.stopped.wait(self.check_interval):
+            now = time.monotonic()
+            last_beat = self.last_beat
+            if now - last_beat >= self.stall_threshold and now >= self.busy_until:
+                if self.stall_started is None:
+                    self.stall_started = last_beat
+                    logger.error(f"Sensor loop stalled: no iteration for {now - last_beat:.1f}s, sensors are not being watched")
+                    self.take_snapshot(now)
+                elif now - self.last_snapshot >= self.snapshot_interval:
+                    self.take_snapshot(now)
+                self.set_alarm(not self.alarm_lit)
+                continue
+
+            if self.stall_started is not None:
+                self.stall_ended(last_beat - self.stall_started)
+            if self.notify_interval and now - last_notify >= self.notify_interval:
+                # Only a beating loop (or one in announced, bounded work) feeds systemd, a stall longer than WatchdogSec gets the service restarted
+                try:
+                    sd_notify("WATCHDOG=1")
+                except OSError as e:
+                    logger.warning(f"Could not notify the systemd watchdog: {e}")
+                last_notify = now
+
+    def take_snapshot(self, now):
+        """Record where the sensor thread is stuck"""
+        self.last_snapshot = now
+        frame = sys._current_frames().get(self.thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "Sensor thread is gone\n"
+        stalled_for = now - self.stall_started
+        self.snapshots.append({"time": time.time(), "stalled_for": round(stalled_for, 3), "stack": stack})
+        logger.warning(f"Sensor loop stack after {stalled_for:.1f}s:\n{stack.rstrip()}")
+
+    def stall_ended(self, duration):
+        self.stall_started = None
+        self.stalls += 1
+        self.stall_seconds += duration
+        self.longest_stall = max(self.longest_stall, duration)
+        self.last_stall = (time.time(), duration)
+        index = 0
+        while index < len(STALL_BUCKETS) and duration >= STALL_BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.set_alarm(False)
+        logger.warning(f"Sensor loop running again after a {duration:.2f}s stall")
+
+    def set_alarm(self, lit):
+        self.alarm_lit = lit
+        if self.alarm:
+            try:
+                self.alarm(lit)
+            except Exception as e:
+                logger.warning(f"Stall alarm failed: {e}")
+
+    def snapshot(self, stacks=False):
+        """Current state and stall counters for the web interface, with the recorded stacks if asked"""
+        stall_started = self.stall_started
+        info = {
+            "enabled": self.enabled,
+            "stall_threshold": self.stall_threshold,
+            "stalled": stall_started is not None,
+            "stalled_for": round(time.monotonic() - stall_started, 3) if stall_started is not None else None,
+            "stalls": self.stalls,
+            "stall_seconds": round(self.stall_seconds, 3),
+            "longest_stall": round(self.longest_stall, 3),
+            "last_stall_time": self.last_stall[0] if self.last_stall else None,
+            "last_stall_duration": round(self.last_stall[1], 3) if self.last_stall else None,
+            "durations": {bucket_label(index): count for index, count in enumerate(self.buckets)},
+            "systemd": self.notify_interval is not None
+        }
+        if stacks:
+            info["snapshots"] = list(self.snapshots)
+        return info
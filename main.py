@@ -2,18 +2,27 @@
 import time
 import json
 import socket
-import requests
 import RPi.GPIO as GPIO
-import ntplib
 from datetime import datetime
 import sys
 import select
 import threading
+import types
+import signal
 import logging
 import os
 
-# Import web server module
-import web_server
+# Only what the sensor loop needs is imported here. The HTTP, NTP and web stacks
+# (requests, ntplib, Flask) are imported by the startup thread once the loop is running.
+import trace_recorder
+import log_store
+import log_pipeline
+import realtime
+import loop_watchdog
+import config_reload
+import profiler
+import state_board
+from event_record import EventRecord, log_line
 
 # Configuration file path
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
@@ -50,6 +59,53 @@ DEFAULT_CONFIG = {
         "url": "https://example.com/api/v1/drone_racing/sensor/action",
         "station_code": "station_1",
         "secure_key": "key"
+    },
+    "delivery": {
+        "mode": "single",
+        "hedge_delay": 0.25
+    },
+    "health": {
+        "interval": 5.0,
+        "failure_threshold": 3,
+        "reset_timeout": 15.0
+    },
+    "trace": {
+        "enabled": True,
+        "capacity": 65536,
+        "samples": False
+    },
+    "log_store": {
+        "enabled": True,
+        "segment_bytes": 1048576,
+        "max_bytes": 16777216,
+        "compress": True,
+        "flush_interval": 5.0
+    },
+    "isolation": {
+        "enabled": False
+    },
+    "realtime": {
+        "enabled": False,
+        "cpu": 3,
+        "priority": 50,
+        "lock_memory": True,
+        "gc_freeze": True,
+        "gc_pause_during_race": True
+    },
+    "watchdog": {
+        "enabled": True,
+        "stall_threshold": 2.5,
+        "snapshot_interval": 5.0,
+        "systemd": True
+    },
+    "peer_clock": {
+        "role": "off",  # "reference" serves the other timers, "follower" takes event times from the reference
+        "port": 1339,
+        "interval": 1.0
+    },
+    "state_board": {
+        "enabled": True,
+        "heartbeat": 0.5
     }
 }
 
@@ -68,41 +124,6 @@ def load_config():
 
 # Configuration
 DEBUG_MODE = True  # Set to True to allow keyboard input (S/F) to trigger events
-config = load_config()
-DIRECT_MODE = config.get("direct_mode", False)  # Load from config file or use default
-
-# Load NTP servers from config or use defaults
-NTP_SERVERS = config.get("ntp_servers", [
-    "pool.ntp.org",
-    "time.google.com",
-    "time.windows.com",
-    "time.apple.com",
-    "time.cloudflare.com",
-    "time.nist.gov",
-    "europe.pool.ntp.org",
-    "asia.pool.ntp.org",
-    "north-america.pool.ntp.org"
-])
-
-# Track side - load from config (1 for RED TRACK, 2 for BLUE TRACK)
-SIDE = config.get("side", 1)
-
-# Proxy server settings - load from config
-proxy_config = config.get("proxy", DEFAULT_CONFIG["proxy"])
-SERVER_HOST = proxy_config.get("host", DEFAULT_CONFIG["proxy"]["host"])
-SERVER_PORT = proxy_config.get("port", DEFAULT_CONFIG["proxy"]["port"])
-SERVER_PATH = proxy_config.get("path", DEFAULT_CONFIG["proxy"]["path"])
-
-# Direct server settings - load from config
-direct_config = config.get("direct", DEFAULT_CONFIG["direct"])
-DIRECT_SERVER_URL = direct_config.get("url", DEFAULT_CONFIG["direct"]["url"])
-STATION_CODE = direct_config.get("station_code", DEFAULT_CONFIG["direct"]["station_code"])
-SECURE_KEY = direct_config.get("secure_key", DEFAULT_CONFIG["direct"]["secure_key"])
-
-# Log server settings
-log_server_config = config.get("log_server", DEFAULT_CONFIG["log_server"])
-LOG_SERVER_HOST = log_server_config.get("host", DEFAULT_CONFIG["log_server"]["host"])
-LOG_SERVER_PORT = log_server_config.get("port", DEFAULT_CONFIG["log_server"]["port"])
 
 # Pin definitions (BCM mode)
 START_OPT_PIN = 17  # Adjust as needed for your RPi connections
@@ -111,9 +132,35 @@ LED_START_PIN = 22  # Adjust as needed for your RPi connections
 LED_FINISH_PIN = 23  # Adjust as needed for your RPi connections
 LED_FINISH2_PIN = 24  # Adjust as needed for your RPi connections
 
+def read_settings(config):
+    """The settings a config reload can change, named as SensorSystem attributes"""
+    proxy_config = config.get("proxy", DEFAULT_CONFIG["proxy"])
+    direct_config = config.get("direct", DEFAULT_CONFIG["direct"])
+    log_server_config = config.get("log_server", DEFAULT_CONFIG["log_server"])
+    return types.SimpleNamespace(
+        DIRECT_MODE=config.get("direct_mode", DEFAULT_CONFIG["direct_mode"]),
+        SIDE=config.get("side", DEFAULT_CONFIG["side"]),
+        NTP_SERVERS=config.get("ntp_servers", DEFAULT_CONFIG["ntp_servers"]),
+        # Proxy settings
+        SERVER_HOST=proxy_config.get("host", DEFAULT_CONFIG["proxy"]["host"]),
+        SERVER_PORT=proxy_config.get("port", DEFAULT_CONFIG["proxy"]["port"]),
+        SERVER_PATH=proxy_config.get("path", DEFAULT_CONFIG["proxy"]["path"]),
+        # Direct settings
+        DIRECT_SERVER_URL=direct_config.get("url", DEFAULT_CONFIG["direct"]["url"]),
+        STATION_CODE=direct_config.get("station_code", DEFAULT_CONFIG["direct"]["station_code"]),
+        SECURE_KEY=direct_config.get("secure_key", DEFAULT_CONFIG["direct"]["secure_key"]),
+        # Log server settings
+        LOG_SERVER_HOST=log_server_config.get("host", DEFAULT_CONFIG["log_server"]["host"]),
+        LOG_SERVER_PORT=log_server_config.get("port", DEFAULT_CONFIG["log_server"]["port"]),
+        delivery_config=config.get("delivery", DEFAULT_CONFIG["delivery"])
+    )
+
 # Timing constants
 START_DELAY = 2.0  # 2 seconds delay
-REQUEST_TIMEOUT = 0.5  # 500ms timeout
+REQUEST_TIMEOUT = 0.5  # 500ms floor for adaptive per-attempt timeouts
+LOOP_INTERVAL = 0.01  # Sleep between sensor reads
+SERVICES_WAIT = 10.0  # Longest an event waits for the startup thread before building delivery itself
+LANDING_BLINKS = 5  # Error blinks after a failed landing, 0.6s each
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -122,12 +169,6 @@ logger = logging.getLogger(__name__)
 ff = False
 start_activated = False
 start_sensor_active_time = 0
-current_match = {
-    "start_time": None,
-    "start_log": None,
-    "start_response": None,
-    "in_progress": False
-}
 
 class SensorSystem:
     """Main sensor system class that encapsulates all functionality"""
@@ -136,48 +177,347 @@ class SensorSystem:
         # Load configuration first
         self.config = load_config()
         
+        # Keep logs on disk across restarts, before anything else logs
+        self.log_store = None
+        log_store_config = self.config.get("log_store", DEFAULT_CONFIG["log_store"])
+        if log_store_config.get("enabled", True):
+            try:
+                self.log_store = log_store.install(log_store_config)
+            except Exception as e:
+                logger.error(f"Could not open log store: {e}")
+        
+        # Console, web and disk handlers run on a background thread, the sensor loop only enqueues
+        log_pipeline.start()
+        
         # Reference class attributes to module constants/config for web server access
         self.DEBUG_MODE = DEBUG_MODE
-        self.DIRECT_MODE = self.config.get("direct_mode", DEFAULT_CONFIG["direct_mode"])
-        self.SIDE = self.config.get("side", DEFAULT_CONFIG["side"])
-        self.NTP_SERVERS = self.config.get("ntp_servers", DEFAULT_CONFIG["ntp_servers"])
+        # Mode, side, upstreams and log server, switched between races by a config reload
+        self.apply_settings(read_settings(self.config))
         
-        # Proxy settings
-        proxy_config = self.config.get("proxy", DEFAULT_CONFIG["proxy"])
-        self.SERVER_HOST = proxy_config.get("host", DEFAULT_CONFIG["proxy"]["host"])
-        self.SERVER_PORT = proxy_config.get("port", DEFAULT_CONFIG["proxy"]["port"])
-        self.SERVER_PATH = proxy_config.get("path", DEFAULT_CONFIG["proxy"]["path"])
+        # Event delivery and health checks are built by the startup thread
+        self.delivery = None
+        self.health_monitor = None
+        self.delivery_lock = threading.Lock()
+        self.startup_error = None  # Why the startup thread failed, if it did
+        self.health_started = False
         
-        # Direct settings
-        direct_config = self.config.get("direct", DEFAULT_CONFIG["direct"])
-        self.DIRECT_SERVER_URL = direct_config.get("url", DEFAULT_CONFIG["direct"]["url"])
-        self.STATION_CODE = direct_config.get("station_code", DEFAULT_CONFIG["direct"]["station_code"])
-        self.SECURE_KEY = direct_config.get("secure_key", DEFAULT_CONFIG["direct"]["secure_key"])
-
-        # Log server settings
-        log_server_config = self.config.get("log_server", DEFAULT_CONFIG["log_server"])
-        self.LOG_SERVER_HOST = log_server_config.get("host", DEFAULT_CONFIG["log_server"]["host"])
-        self.LOG_SERVER_PORT = log_server_config.get("port", DEFAULT_CONFIG["log_server"]["port"])
+        # Flight recorder of raw sensor edges, for disputed results
+        self.trace_config = self.config.get("trace", DEFAULT_CONFIG["trace"])
+        self.trace = None
+        if self.trace_config.get("enabled", True):
+            try:
+                self.trace = trace_recorder.TraceRecorder(
+                    self.trace_config.get("path", trace_recorder.TRACE_PATH),
+                    self.trace_config.get("capacity", DEFAULT_CONFIG["trace"]["capacity"]),
+                    {START_OPT_PIN: "start", FINISH_VIBRO_PIN: "finish"}
+                )
+            except Exception as e:
+                logger.error(f"Could not open sensor trace: {e}")
+        self.trace_samples = self.trace is not None and self.trace_config.get("samples", False)
         
         # State variables
         self.ff = False
         self.start_activated = False
         self.start_sensor_active_time = 0
-        self.current_match = {
-            "start_time": None,
-            "start_log": None,
-            "start_response": None,
-            "in_progress": False
-        }
+        self.race_start = None  # EventRecord of the take-off while a race is in progress
+        self.armed_landing = None  # Prepared by arm_landing when the start threshold is reached
+        self.sensor_states = {"start": 1, "finish": 1}  # Last pin levels, for the web interface
+        self.engine_server = None  # Serves the web process in isolated mode
+        self.pending_config = None  # Prepared by a config reload, switched in by the sensor loop
+        self.reload_lock = threading.Lock()
+        self.ntp_sync_lock = threading.Lock()  # Held by the background NTP sync after a landing
+        self.reload_generation = 0  # Bumped by every reload request, a prepared reload that is not the latest is dropped
+        
+        # Opt-in real-time scheduling of the sensor loop, and its jitter measurement (always on)
+        self.realtime_config = self.config.get("realtime", DEFAULT_CONFIG["realtime"])
+        self.realtime_enabled = self.realtime_config.get("enabled", False)
+        self.realtime_applied = None
+        self.race_gc = realtime.RaceGC(
+            self.realtime_enabled and self.realtime_config.get("gc_pause_during_race", True),
+            self.realtime_config.get("gc_max_race", realtime.MAX_RACE_SECONDS)
+        )
+        self.jitter = realtime.JitterMeter(self.realtime_config.get("jitter_window", 6000))
+        
+        # Event times: the local clock, or the reference's once the startup thread has a peer clock running
+        self.clock = time.time
+        self.peer_clock = None
+        self.race_clock = None  # Clock of the race in progress, see take_off_time
+        
+        # Live state in shared memory for overlays and scoreboards on this machine
+        self.state_board = None
+        board_config = self.config.get("state_board", DEFAULT_CONFIG["state_board"])
+        if board_config.get("enabled", True):
+            try:
+                self.state_board = state_board.StateBoard(
+                    board_config.get("path", state_board.BOARD_PATH),
+                    self.SIDE,
+                    board_config.get("heartbeat", DEFAULT_CONFIG["state_board"]["heartbeat"]),
+                    self.clock_report
+                )
+            except Exception as e:
+                logger.error(f"Could not open state board: {e}")
         
-        # Initialize the system
-        self.setup()
+        # Stall detection for the sensor loop, started by run()
+        self.watchdog = loop_watchdog.LoopWatchdog(self.config.get("watchdog", DEFAULT_CONFIG["watchdog"]), alarm=self.stall_alarm)
         
-        # Start web server
-        self.start_web_server()
+        # Pins first, so run() can read sensors while the network and web stacks come up
+        self.started_at = time.time()
+        self.services_ready = threading.Event()  # Delivery, health monitor and web server are up
+        self.services_settled = threading.Event()  # The startup thread got its services up, or failed
+        self.startup_complete = threading.Event()  # Startup tests and their LED blinks are done
+        self.setup_pins()
+        startup_thread = threading.Thread(target=self.start_services, name="startup")
+        startup_thread.daemon = True
+        startup_thread.start()
+    
+    def start_services(self):
+        """Bring up delivery, the web server and the startup checks in the background"""
+        try:
+            self.build_delivery()
+            self.start_peer_clock()
+            
+            # Start web server
+            self.start_web_server()
+        except Exception as e:
+            # Events build delivery themselves if it is missing, see wait_for_services
+            self.startup_error = e
+            logger.error(f"Startup failed: {e}", exc_info=True)
+            if self.delivery is not None:
+                self.start_health_monitor()
+            self.services_settled.set()
+            self.startup_complete.set()  # The sensor loop takes over the LEDs
+            return
+        self.services_ready.set()
+        self.services_settled.set()
+        logger.info(f"Services ready {time.time() - self.started_at:.2f}s after startup")
+        
+        try:
+            # Connectivity and NTP tests
+            self.setup()
+            
+            # Keep checking upstreams after the one-off startup test
+            self.start_health_monitor()
+            
+            # Objects loaded by the startup thread are left out of garbage collections too
+            if self.realtime_enabled and self.realtime_config.get("gc_freeze", True):
+                realtime.freeze_heap()
+        except Exception as e:
+            logger.error(f"Startup checks failed: {e}", exc_info=True)
+        finally:
+            self.startup_complete.set()
+    
+    def build_delivery(self):
+        """Build event delivery and its health monitor, unless the startup thread or an earlier event already has"""
+        import delivery
+        import health_monitor
+        with self.delivery_lock:
+            if self.delivery is not None:
+                return
+            # Event delivery (single upstream, all upstreams at once or hedged)
+            built = delivery.build_delivery(self, self.delivery_config, min_timeout=REQUEST_TIMEOUT)
+            
+            # Periodic upstream health checks with a circuit breaker per upstream
+            self.health_monitor = health_monitor.HealthMonitor(
+                built,
+                self.LOG_SERVER_HOST,
+                self.LOG_SERVER_PORT,
+                self.config.get("health", DEFAULT_CONFIG["health"])
+            )
+            self.delivery = built
+    
+    def start_health_monitor(self):
+        """Start probing upstreams, once, whichever thread built delivery"""
+        with self.delivery_lock:
+            if self.health_started:
+                return
+            self.health_started = True
+        self.health_monitor.start()
+    
+    def start_peer_clock(self):
+        """Serve or follow the LAN reference clock, as configured"""
+        import peer_clock
+        clock_config = self.config.get("peer_clock", DEFAULT_CONFIG["peer_clock"])
+        role = clock_config.get("role", "off")
+        port = clock_config.get("port", peer_clock.DEFAULT_PORT)
+        try:
+            if role == "reference":
+                self.peer_clock = peer_clock.PeerClockServer(port=port).start()
+            elif role == "follower":
+                # The proxy machine is the usual reference
+                reference = clock_config.get("reference") or self.SERVER_HOST
+                self.peer_clock = peer_clock.PeerClock(
+                    reference, port, clock_config.get("node"), clock_config.get("interval", 1.0)
+                ).start()
+                self.clock = self.peer_clock.now
+        except OSError as e:
+            logger.error(f"Could not start the peer clock: {e}")
+    
+    def clock_report(self):
+        """Clock source, offset from this machine's clock, error bound and state, for the state board"""
+        if self.peer_clock is None:
+            return state_board.CLOCK_LOCAL, 0.0, None, 0
+        if self.clock is time.time:
+            return state_board.CLOCK_REFERENCE, 0.0, None, 0
+        offset, error, drift, clock_state = self.peer_clock.report()
+        return state_board.CLOCK_FOLLOWER, offset, error if clock_state else None, clock_state
+    
+    def take_off_time(self):
+        """Take-off time; the landing is stamped on the same clock estimate, so a new peer clock fit cannot land inside a race"""
+        self.race_clock = self.peer_clock.pinned() if self.clock is not time.time else time.time
+        return self.race_clock()
+    
+    def landing_time(self):
+        """Landing time, on the clock estimate of its take-off"""
+        return (self.race_clock or self.clock)()
+    
+    def local_time(self, event_time):
+        """This machine's wall clock time of an event time, for the sensor trace"""
+        clock = self.race_clock or self.clock
+        if clock is time.time:
+            return event_time
+        return event_time - (clock() - time.time())
+    
+    def wait_for_services(self):
+        """Wait a bounded time for the startup thread's delivery, then build it here; False if there is none"""
+        if self.delivery is not None:
+            return True
+        if not self.services_settled.is_set():
+            logger.warning("Event before startup finished, waiting for services (event time already taken)")
+            self.services_settled.wait(SERVICES_WAIT)
+        if self.delivery is not None:
+            return True
+        logger.error(f"No delivery from startup ({self.startup_error or 'still starting'}), building it for this event")
+        try:
+            self.build_delivery()
+        except Exception as e:
+            logger.error(f"Could not build delivery, the event is not sent: {e}")
+            return False
+        if self.startup_error is not None:
+            self.start_health_monitor()  # Otherwise the startup thread starts it after its checks
+        return True
+    
+    def apply_settings(self, settings):
+        for name, value in vars(settings).items():
+            setattr(self, name, value)
+    
+    def reload_config(self, config=None):
+        """Validate a new configuration (config.json if none is given) and prepare it in the background
+
+        Returns the changed sections and those that only take effect after a restart. The sensor
+        loop switches to the new configuration once no race is in progress.
+        """
+        if config is None:
+            config = config_reload.read_config(CONFIG_FILE)
+        errors = config_reload.validate(config)
+        if errors:
+            raise ValueError("; ".join(errors))
+        # Against the running configuration, so replacing a prepared reload loses none of its changes
+        changed = config_reload.changed_keys(self.config, config, DEFAULT_CONFIG)
+        restart = config_reload.restart_required(changed)
+        if restart:
+            logger.warning(f"Config changes to {', '.join(restart)} take effect after a restart")
+        with self.reload_lock:
+            self.reload_generation += 1
+            generation = self.reload_generation
+        reload_thread = threading.Thread(target=self.prepare_reload, args=(config, changed, generation), name="config-reload")
+        reload_thread.daemon = True
+        reload_thread.start()
+        return {"changed": changed, "restart_required": restart}
+    
+    def reload_on_signal(self, signum, frame):
+        """SIGHUP handler, re-reads config.json off the sensor loop thread"""
+        def reload():
+            try:
+                self.reload_config()
+            except ValueError as e:
+                logger.error(f"Config reload rejected: {e}")
+        threading.Thread(target=reload, name="config-reload", daemon=True).start()
+    
+    def prepare_reload(self, config, changed, generation):
+        """Build the delivery and health monitor for a new configuration, leaving the switch to the sensor loop"""
+        import delivery
+        import health_monitor
+        if not self.wait_for_services():
+            logger.error("No delivery to reconfigure, configuration not applied")
+            return
+        settings = read_settings(config)
+        staged = {"config": config, "settings": settings, "changed": changed, "delivery": None, "health_monitor": None}
+        if config_reload.needs_rebuild(changed):
+            try:
+                staged["delivery"] = delivery.build_delivery(
+                    settings, settings.delivery_config, min_timeout=REQUEST_TIMEOUT, journal=self.delivery.journal
+                )
+                staged["health_monitor"] = health_monitor.HealthMonitor(
+                    staged["delivery"],
+                    settings.LOG_SERVER_HOST,
+                    settings.LOG_SERVER_PORT,
+                    config.get("health", DEFAULT_CONFIG["health"])
+                )
+            except Exception as e:
+                logger.error(f"Could not build delivery for the new configuration, keeping the current one: {e}")
+                return
+            # Connections are opened here, not by the first event after the switch
+            for upstream in staged["delivery"].upstreams:
+                upstream.warm()
+        
+        with self.reload_lock:
+            # A newer reload was requested while this one was being prepared, it carries the latest config
+            stale = generation != self.reload_generation
+            if stale:
+                replaced = staged
+            else:
+                replaced = self.pending_config
+                self.pending_config = staged
+        if replaced and replaced["delivery"]:
+            replaced["delivery"].close()
+        if stale:
+            logger.info(f"Configuration reload {generation} superseded by a newer one, dropped")
+            return
+        logger.info(f"New configuration ready ({', '.join(changed) or 'no changes'}), switching between races")
+    
+    def apply_pending_config(self):
+        """Switch to the prepared configuration, called by the sensor loop while no race is in progress"""
+        with self.reload_lock:
+            staged = self.pending_config
+            self.pending_config = None
+        self.config = staged["config"]
+        self.apply_settings(staged["settings"])
+        retired = None
+        if staged["delivery"] is not None:
+            retired = (self.delivery, self.health_monitor)
+            self.delivery = staged["delivery"]
+            self.health_monitor = staged["health_monitor"]
+        # Starting and stopping threads is left to the background
+        finish_thread = threading.Thread(target=self.finish_reload, args=(staged, retired), name="config-reload")
+        finish_thread.daemon = True
+        finish_thread.start()
+    
+    def finish_reload(self, staged, retired):
+        """Start the new health monitor and retire the replaced delivery once its background attempts are done"""
+        if retired:
+            old_delivery, old_monitor = retired
+            old_monitor.stop()
+            staged["health_monitor"].start()
+            old_delivery.close()
+        logger.info(f"Configuration applied: {', '.join(staged['changed']) or 'no changes'}")
+    
+    def sync_ntp_later(self, reason):
+        """Run the post-landing NTP sync in the background, the sensor loop never waits on NTP servers"""
+        def sync():
+            if not self.ntp_sync_lock.acquire(blocking=False):
+                return  # One already running
+            try:
+                self.try_ntp_sync()
+                logger.info(f"NTP time updated after {reason}")
+            except Exception as e:
+                logger.warning(f"Could not update NTP time after {reason}: {e}")
+            finally:
+                self.ntp_sync_lock.release()
+        threading.Thread(target=sync, name="ntp-sync", daemon=True).start()
     
     def try_ntp_sync(self):
         """Try to synchronize with NTP servers, trying each in sequence"""
+        import ntplib
         ntp_client = ntplib.NTPClient()
         
         for server in self.NTP_SERVERS:
@@ -202,8 +542,8 @@ class SensorSystem:
         
         raise Exception("Failed to synchronize with any NTP server")
 
-    def setup(self):
-        """Initialize GPIO, network, and NTP"""
+    def setup_pins(self):
+        """Initialize GPIO"""
         logger.info("=== Starting Sensor System ===")
         
         # Initialize GPIO
@@ -229,6 +569,10 @@ class SensorSystem:
             logger.info("Press 'S' to simulate START sensor")
             logger.info("Press 'F' to simulate FINISH sensor")
             logger.info("Press 'Q' to quit")
+    
+    def setup(self):
+        """Test network connectivity and NTP"""
+        import requests
         
         # Test connectivity, but don't exit on failure
         connection_success = True
@@ -303,6 +647,12 @@ class SensorSystem:
         # Use system time directly without NTP sync
         return time.time()
     
+    def landing_hold(self):
+        """Longest the sensor loop is held by a landing: the delivery deadline, the error blink and some slack"""
+        if self.delivery is None:
+            return SERVICES_WAIT + 8.0 + LANDING_BLINKS * 0.6 + 2.0  # Still starting up, the event waits for it first
+        return self.delivery.policy.deadline + LANDING_BLINKS * 0.6 + 2.0
+    
     def error_blink_pattern(self, count):
         """Error indication - alternates all LEDs in a pattern"""
         for _ in range(count):
@@ -318,6 +668,15 @@ class SensorSystem:
             GPIO.output(LED_FINISH2_PIN, GPIO.LOW)
             time.sleep(0.3)
     
+    def stall_alarm(self, lit):
+        """Blink the start and finish LEDs together while the sensor loop is stalled, all off once it runs again"""
+        if not self.startup_complete.is_set():
+            return
+        level = GPIO.HIGH if lit else GPIO.LOW
+        GPIO.output(LED_START_PIN, level)
+        GPIO.output(LED_FINISH_PIN, level)
+        GPIO.output(LED_FINISH2_PIN, GPIO.LOW)
+    
     def blink_start_led(self, count, delay_sec):
         """Blink the start LED a specified number of times"""
         for _ in range(count):
@@ -328,10 +687,15 @@ class SensorSystem:
     
     def send_log_request(self, event_type, event_time):
         """Send event data to the local log server"""
+        import requests
         try:
             if not self.LOG_SERVER_HOST or not self.LOG_SERVER_PORT:
                 logger.info("Log server not configured, skipping log request.")
                 return
+            
+            if self.health_monitor is not None and not self.health_monitor.is_available("log_server"):
+                logger.warning("Log server is down (circuit open), skipping log request.")
+                return
 
             # Determine endpoint based on side
             endpoint = f"/send{self.SIDE}"
@@ -345,7 +709,10 @@ class SensorSystem:
             
             logger.info(f"Sending log data to {url}: {json.dumps(log_data)}")
             
+            request_started = time.time()
             response = requests.post(url, json=log_data, timeout=2)
+            if self.health_monitor is not None:
+                self.health_monitor.record("log_server", True, time.time() - request_started)
             
             if response.status_code == 200:
                 logger.info("Log request successful.")
@@ -353,228 +720,156 @@ class SensorSystem:
                 logger.warning(f"Log request failed! Status: {response.status_code}, Body: {response.text}")
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to send log request: {e}")
+            if self.health_monitor is not None:
+                self.health_monitor.record("log_server", False, 0, str(e))
         except Exception as e:
             logger.error(f"An unexpected error occurred while sending log request: {e}")
 
-    def send_post_request(self, side, event_type, event_time):
-        """Send POST request to the server"""
-        logger.info("=== Sending POST Request ===")
-        
+    def primary_upstream(self):
+        """Name of the upstream selected by the direct mode setting"""
+        if self.DIRECT_MODE:
+            return "direct"
+        # Datagram transport is preferred when enabled, the HTTP proxy is its fallback
+        return "proxy_udp" if self.delivery.get_upstream("proxy_udp") else "proxy"
+    
+    def send_post_request(self, side, event_type, event_time, prepared=None):
+        """Send an event to the server, returns its EventRecord"""
         # Check if time is valid before sending request
         if event_time < 1000000000:
             logger.error("Invalid timestamp (before 2001)!")
-            return False
-        
-        # NTP sync before sending request removed as requested
+            return EventRecord(side, event_type, event_time, response="Invalid timestamp (before 2001)")
         
-        if self.DIRECT_MODE:
-            return self.send_direct_request(side, event_type, event_time)
-        else:
-            return self.send_proxy_request(side, event_type, event_time)
-    
-    def send_proxy_request(self, side, event_type, event_time):
-        """Send request through proxy server"""
-        # Prepare JSON data
-        json_data = {
-            "station_code": self.STATION_CODE,
-            "secure_key": self.SECURE_KEY,
-            "event_type": event_type,
-            "event_body": {
-                "side": side,
-                "time": round(event_time, 3)
-            }
-        }
+        # Pre-armed events skip the preamble, their critical path is stamp, fill, write
+        if prepared is None:
+            logger.info("=== Sending POST Request ===")
         
-        # Multiple retry attempts
-        MAX_RETRIES = 3
-        for attempt in range(MAX_RETRIES):
-            if attempt > 0:
-                logger.info(f"Retry attempt {attempt} of {MAX_RETRIES - 1}...")
-                time.sleep(1)  # Delay between retries
-            
-            try:
-                url = f"http://{self.SERVER_HOST}:{self.SERVER_PORT}{self.SERVER_PATH}"
-                logger.info("Connecting to proxy server...")
-                logger.info(f"Sending data: {json.dumps(json_data)}")
-                
-                response = requests.post(
-                    url,
-                    json=json_data,
-                    timeout=5  # 5 seconds timeout
-                )
-                
-                logger.info(f"Response Status: {response.status_code}")
-                logger.info(f"Response Body: {response.text}")
-                
-                # Store response for match tracking
-                response_text = f"Status: {response.status_code}\nBody: {response.text}"
-                self.last_response_data = response_text
-                
-                if response.status_code == 200:
-                    logger.info("Request successful (200 OK)")
-                    logger.info("=== Request Complete ===")
-                    return True
-                else:
-                    logger.warning(f"Request failed! Non-200 response received: {response.status_code}")
-                    continue  # Try the next retry
-                    
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Connection error: {e}")
-                # Store error as response for match tracking
-                self.last_response_data = f"Connection error: {e}"
-                continue  # Try the next retry
+        # NTP sync before sending request removed as requested
         
-        logger.error("All retry attempts failed!")
-        logger.error("=== Request Failed ===")
-        return False
-    
-    def send_direct_request(self, side, event_type, event_time):
-        """Send request directly to the server"""
-        logger.info("Sending direct request to external server...")
-        
-        # Prepare JSON data
-        json_data = {
-            "station_code": self.STATION_CODE,
-            "secure_key": self.SECURE_KEY,
-            "event_type": event_type,
-            "event_body": {
-                "side": side,
-                "absolute_time": round(event_time, 0)
-            }
-        }
+        if not self.wait_for_services():
+            return EventRecord(side, event_type, event_time, response=f"Not sent, delivery unavailable: {self.startup_error}")
+        result = self.delivery.send(side, event_type, event_time, self.primary_upstream(), prepared=prepared)
+        event = EventRecord.delivered(side, event_type, event_time, result)
         
-        # Multiple retry attempts
-        MAX_RETRIES = 3
-        for attempt in range(MAX_RETRIES):
-            if attempt > 0:
-                logger.info(f"Retry attempt {attempt} of {MAX_RETRIES - 1}...")
-                time.sleep(1)  # Delay between retries
-            
-            try:
-                logger.info(f"Sending data: {json.dumps(json_data)}")
-                
-                response = requests.post(
-                    self.DIRECT_SERVER_URL,
-                    json=json_data,
-                    timeout=5  # 5 seconds timeout
-                )
-                
-                logger.info(f"Response Status: {response.status_code}")
-                logger.info(f"Response Body: {response.text}")
-                
-                # Store response for match tracking
-                response_text = f"Status: {response.status_code}\nBody: {response.text}"
-                self.last_response_data = response_text
-                
-                if response.status_code == 200:
-                    logger.info("Request successful (200 OK)")
-                    logger.info("=== Request Complete ===")
-                    return True
-                else:
-                    logger.warning(f"Request failed! Non-200 response received: {response.status_code}")
-                    continue  # Try the next retry
-                    
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Connection error: {e}")
-                # Store error as response for match tracking
-                self.last_response_data = f"Connection error: {e}"
-                continue  # Try the next retry
+        if result.success:
+            logger.info("=== Request Complete ===")
+            return event
         
         logger.error("All retry attempts failed!")
         logger.error("=== Request Failed ===")
-        return False
+        return event
     
     def send_post_request_take_off(self, side, event_time):
         """Send take_off event and record match start"""
         # Capture log before sending request
-        start_log = f"Starting take-off event at {datetime.fromtimestamp(event_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, side: {side}"
-        logger.info(start_log)
+        if self.state_board is not None:
+            self.state_board.take_off(event_time)
+        logger.info(log_line("take_off", event_time, side))
         
-        # Send primary request and get result
-        success = self.send_post_request(side, "take_off", event_time)
+        # Send primary request, its record carries the response for the match
+        event = self.send_post_request(side, "take_off", event_time)
         
-        # Get the response data (will be added in send_post_request)
-        response_data = getattr(self, "last_response_data", "No response data")
+        if self.trace:
+            self.trace.mark(trace_recorder.MARK_TAKE_OFF, self.local_time(event_time))
         
         # Send log request regardless of primary request success
         self.send_log_request("take_off", event_time)
         
         # Store match start data regardless of request success
-        self.current_match = {
-            "start_time": event_time,
-            "start_log": start_log,
-            "start_response": response_data,
-            "in_progress": True
-        }
+        self.race_start = event
         
-        if success:
+        if event.success:
             logger.info("Match started successfully and recorded")
         else:
             logger.warning("Match started with request errors but still recorded for database")
         
-        return success
+        # No garbage collection pauses until the landing is handled
+        self.race_gc.race_started()
+        
+        return event.success
+    
+    @property
+    def match_in_progress(self):
+        return self.race_start is not None
+    
+    def arm_landing(self):
+        """Prepare the landing as soon as a start is armed: payload templates, warm connections, DB row"""
+        if self.trace:
+            self.trace.mark(trace_recorder.MARK_ARMED)
+        # A new start means a race still in flight was abandoned
+        self.race_gc.race_finished()
+        if not self.services_ready.is_set():
+            return  # Still starting up, the landing is sent unprepared
+        import web_server  # Loaded by the startup thread by now, this is a dictionary lookup
+        primary = self.primary_upstream()
+        prepared = None
+        if self.delivery.accepts("landing", primary):
+            prepared = self.delivery.prepare(self.SIDE, "landing", primary)
+        armed = {"prepared": prepared, "match_id": None}
+        self.armed_landing = armed
+        
+        # The row is reserved off the sensor thread; a landing that comes first inserts its own row
+        def reserve():
+            armed["match_id"] = web_server.allocate_match(self.SIDE)
+            logger.info(f"Landing pre-armed (match row {armed['match_id']})")
+        threading.Thread(target=reserve, name="match-row", daemon=True).start()
     
     def send_post_request_landing(self, side, event_time):
         """Send landing event and complete match record"""
-        # Capture log before sending request
-        finish_log = f"Landing event at {datetime.fromtimestamp(event_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, side: {side}"
-        logger.info(finish_log)
+        board = self.state_board if self.race_start is not None else None
+        if board is not None:
+            board.landing(self.race_start.event_time, event_time)
+        ready = self.wait_for_services()
+        armed = self.armed_landing or {}
+        self.armed_landing = None
+        prepared = armed.get("prepared")
         
-        # Send primary request and get result, ONLY IF NOT IN DIRECT MODE
-        success = True  # Default to success if skipping primary request
-        response_data = "Request skipped (Direct Mode)"
-        if not self.DIRECT_MODE:
+        # Send primary request and get result, ONLY IF AN UPSTREAM TAKES LANDINGS (direct API does not)
+        if not ready:
+            event = EventRecord(side, "landing", event_time, response=f"Not sent, delivery unavailable: {self.startup_error}")
+        elif prepared is not None and prepared.primary == self.primary_upstream():
+            event = self.send_post_request(side, "landing", event_time, prepared=prepared)
+            logger.info("Pre-armed landing event sent to primary server (Proxy Mode)")
+        elif self.delivery.accepts("landing", self.primary_upstream()):
             logger.info("Sending landing event to primary server (Proxy Mode)")
-            success = self.send_post_request(side, "landing", event_time)
-            response_data = getattr(self, "last_response_data", "No response data")
+            event = self.send_post_request(side, "landing", event_time)
         else:
             logger.info("Skipping landing event send to primary server (Direct Mode)")
+            event = EventRecord(side, "landing", event_time, success=True, response="Request skipped (Direct Mode)")
             # Although we skip the primary request, we still need to update NTP
-            try:
-                ntp_response = self.try_ntp_sync()
-                logger.info("NTP time updated after landing event processing (Direct Mode)")
-            except Exception as e:
-                logger.warning(f"Could not update NTP time after landing event (Direct Mode): {e}")
+            self.sync_ntp_later("landing event processing (Direct Mode)")
+        
+        if board is not None:
+            board.delivered(event.success, event.status)
+        if self.trace:
+            self.trace.mark(trace_recorder.MARK_LANDING, self.local_time(event_time))
+        
+        # Formatted only now, so it stays off the critical path
+        logger.info(log_line("landing", event_time, side))
         
         # Send log request regardless of primary request success or mode
         self.send_log_request("landing", event_time)
         
         # If we have a match in progress, complete it regardless of request success
-        if self.current_match["in_progress"]:
-            # Complete match data
-            start_time = self.current_match["start_time"]
-            start_log = self.current_match["start_log"]
-            start_response = self.current_match["start_response"]
-            
-            # Reset current match
-            self.current_match = {
-                "start_time": None,
-                "start_log": None,
-                "start_response": None,
-                "in_progress": False
-            }
+        if self.race_start is not None:
+            start = self.race_start
+            self.race_start = None
             
             # Save match to database even if request failed
             import web_server
-            web_server.save_match(
-                side, 
-                start_time, 
-                event_time, 
-                start_log, 
-                finish_log, 
-                start_response, 
-                response_data
-            )
+            web_server.save_match(start, event, match_id=armed.get("match_id"))
             
-            match_time = event_time - start_time
-            if success:
+            match_time = event_time - start.event_time
+            if event.success:
                 logger.info(f"Match completed successfully and saved: {match_time:.2f} seconds")
             else:
                 logger.warning(f"Match completed with request errors but still saved to database: {match_time:.2f} seconds")
         else:
             logger.warning("Finish event received but no matching start event found")
         
-        return success
+        self.race_gc.race_finished()
+        self.race_clock = None  # Races that follow take up the latest estimate
+        
+        return event.success
     
     def check_keyboard_input(self):
         """Check for keyboard input in non-blocking mode"""
@@ -589,31 +884,71 @@ class SensorSystem:
     def trigger_start_event(self):
         """Trigger the start event directly (used in debug mode)"""
         logger.info("DEBUG: Triggering start event immediately")
-        # Use system time directly instead of get_current_time to avoid NTP sync
-        event_time = time.time()
+        # System time (or the peer reference clock) rather than get_current_time, no NTP query
+        event_time = self.take_off_time()
         self.send_post_request_take_off(self.SIDE, event_time)
     
     def trigger_finish_event(self):
         """Trigger the finish event directly (used in debug mode)"""
         logger.info("DEBUG: Triggering finish event immediately")
-        # Use system time directly instead of get_current_time to avoid NTP sync
-        event_time = time.time()
+        # System time (or the peer reference clock) rather than get_current_time, no NTP query
+        event_time = self.landing_time()
         success = self.send_post_request_landing(self.SIDE, event_time)
         
         # Force NTP update AFTER landing event is processed (same as in main loop)
-        try:
-            ntp_response = self.try_ntp_sync()
-            logger.info("NTP time updated after landing event processing")
-        except Exception as e:
-            logger.warning(f"Could not update NTP time after landing event: {e}")
+        self.sync_ntp_later("landing event processing")
+    
+    def health_info(self):
+        """Upstream health and journal backlog for the web interface"""
+        if self.delivery is None:
+            return {'endpoints': {}, 'journaled_events': 0}
+        journal = self.delivery.journal
+        return {
+            'endpoints': self.health_monitor.snapshot(),
+            'journaled_events': journal.count() if journal else 0
+        }
+    
+    def realtime_info(self):
+        """Real-time settings in effect and the sensor loop jitter, for the web interface"""
+        return {
+            "enabled": self.realtime_enabled,
+            "applied": self.realtime_applied,
+            "gc_paused": self.race_gc.in_flight,
+            "jitter": self.jitter.snapshot()
+        }
+    
+    def watchdog_info(self, stacks=False):
+        """Sensor loop stall state and counters for the web interface"""
+        return self.watchdog.snapshot(stacks)
+    
+    def peer_clock_info(self):
+        """Peer clock role and estimate, or the nodes' reports on a reference, for the web interface"""
+        if self.peer_clock is None:
+            return {"role": "off"}
+        return self.peer_clock.snapshot()
+    
+    def profile(self, mode, target, seconds, interval=profiler.DEFAULT_INTERVAL, output=None):
+        """Capture a bounded profile of this process, returns (file name, mime type, body bytes)"""
+        return profiler.capture(mode, target, seconds, interval, output)
     
     def start_web_server(self):
-        """Start the web server in a separate thread"""
+        """Start the web server in a separate thread, or in its own process in isolated mode"""
+        import web_server
+        isolation_config = self.config.get("isolation", DEFAULT_CONFIG["isolation"])
+        if isolation_config.get("enabled", False):
+            import engine_ipc
+            # The web process only reads the database, this process writes it
+            web_server.initialize_database()
+            self.engine_server = engine_ipc.EngineServer(self, isolation_config.get("socket", engine_ipc.ENGINE_SOCKET))
+            self.engine_server.start()
+            logger.info("Web server started in its own process at http://0.0.0.0:8080")
+            return
+        
         # Initialize web server with a reference to this sensor system
         web_server.initialize_web_server(self)
         
         # Start web server in a separate thread
-        web_thread = threading.Thread(target=web_server.run_web_server)
+        web_thread = threading.Thread(target=web_server.run_web_server, name="web-server")
         web_thread.daemon = True
         web_thread.start()
         logger.info("Web server started at http://0.0.0.0:8080")
@@ -650,13 +985,42 @@ class SensorSystem:
                 logger.warning("Debug keyboard input disabled")
                 has_interactive_terminal = False
         
+        if self.realtime_enabled:
+            self.realtime_applied = realtime.apply(self.realtime_config)
+        
         logger.info("Starting main loop...")
+        self.watchdog.start()
+        profiler.register_sensor_thread()
         
+        loop_started = None
+        sleep_started = None
         try:
             while True:
+                self.watchdog.beat()
+                
+                # A reloaded configuration is switched in between races only
+                if (self.pending_config is not None and not self.ff and self.armed_landing is None
+                        and self.race_start is None):
+                    self.apply_pending_config()
+                if self.race_gc.in_flight:
+                    self.race_gc.check()
+                # A cProfile capture of this thread is switched on and off here
+                if profiler.sensor_profile is not None:
+                    profiler.sensor_profile.step()
+                # Loop period and how late the sleep woke us up
+                woke = time.perf_counter()
+                if sleep_started is not None:
+                    self.jitter.record(woke - loop_started, woke - sleep_started - LOOP_INTERVAL)
+                loop_started = woke
+                
                 # Read current sensor states
                 current_start_state = GPIO.input(START_OPT_PIN)
                 current_finish_state = GPIO.input(FINISH_VIBRO_PIN)
+                # The startup thread owns the LEDs until its status blinks are done
+                leds = self.startup_complete.is_set()
+                if self.trace_samples:
+                    self.trace.record(START_OPT_PIN, current_start_state, trace_recorder.KIND_SAMPLE)
+                    self.trace.record(FINISH_VIBRO_PIN, current_finish_state, trace_recorder.KIND_SAMPLE)
                 
                 # Debug mode - check for keyboard input only if we have an interactive terminal
                 if self.DEBUG_MODE and has_interactive_terminal:
@@ -681,8 +1045,12 @@ class SensorSystem:
                 
                 # Check start optical sensor state changes
                 if current_start_state != last_start_state:
-                    logger.info(f"Start sensor state changed to: {'INACTIVE' if current_start_state else 'ACTIVE'}")
-                    logger.info(f"Start sensor GPIO pin {START_OPT_PIN} value: {current_start_state}")
+                    if self.trace:
+                        self.trace.record(START_OPT_PIN, current_start_state)
+                    self.sensor_states["start"] = current_start_state
+                    # Lazy arguments: the log listener thread does the formatting
+                    logger.info("Start sensor state changed to: %s", 'INACTIVE' if current_start_state else 'ACTIVE')
+                    logger.info("Start sensor GPIO pin %d value: %s", START_OPT_PIN, current_start_state)
                     
                     if not current_start_state:  # Sensor became active (pulled low)
                         self.start_sensor_active_time = time.time()
@@ -693,8 +1061,8 @@ class SensorSystem:
                             logger.info("Start sensor released before 2 seconds - ignoring")
                         elif self.ff and self.start_activated:
                             logger.info("Triggering take-off event")
-                            # Use system time directly instead of get_current_time to avoid NTP sync
-                            event_time = time.time()
+                            # System time (or the peer reference clock) rather than get_current_time, no NTP query
+                            event_time = self.take_off_time()
                             self.send_post_request_take_off(self.SIDE, event_time)
                         
                         self.ff = False
@@ -704,46 +1072,51 @@ class SensorSystem:
                 
                 # Start sensor logic with 2-second delay
                 if not current_start_state:  # Active Low
-                    GPIO.output(LED_START_PIN, GPIO.HIGH)
+                    if leds:
+                        GPIO.output(LED_START_PIN, GPIO.HIGH)
                     
                     # Check if sensor has been active for 2 seconds
                     if not self.ff and not self.start_activated and (time.time() - self.start_sensor_active_time >= START_DELAY):
                         logger.info("2-second threshold reached - activating start")
                         self.ff = True
                         self.start_activated = True
-                else:
+                        # A landing for this side will follow, get it ready now
+                        self.arm_landing()
+                elif leds:
                     GPIO.output(LED_START_PIN, GPIO.LOW)
                 
                 # Check finish sensor state changes
                 if current_finish_state != last_finish_state:
-                    logger.info(f"Finish sensor state changed to: {'INACTIVE' if current_finish_state else 'ACTIVE'}")
-                    logger.info(f"Finish sensor GPIO pin {FINISH_VIBRO_PIN} value: {current_finish_state}")
-                    logger.info(f"Start sensor state when finish changed: {'INACTIVE' if current_start_state else 'ACTIVE'}")
+                    if self.trace:
+                        self.trace.record(FINISH_VIBRO_PIN, current_finish_state)
+                    self.sensor_states["finish"] = current_finish_state
+                    logger.info("Finish sensor state changed to: %s", 'INACTIVE' if current_finish_state else 'ACTIVE')
+                    logger.info("Finish sensor GPIO pin %d value: %s", FINISH_VIBRO_PIN, current_finish_state)
+                    logger.info("Start sensor state when finish changed: %s", 'INACTIVE' if current_start_state else 'ACTIVE')
                     last_finish_state = current_finish_state
                 
                 # Finish sensor logic (active low, like start sensor)
                 if not current_finish_state and current_start_state:  # Both sensors are active LOW
-                    logger.info("Triggering landing event")
-                    logger.info(f"Finish sensor GPIO pin {FINISH_VIBRO_PIN} value: {current_finish_state}")
-                    logger.info(f"Start sensor GPIO pin {START_OPT_PIN} value: {current_start_state}")
+                    # Record timestamp immediately when the event is triggered, before any logging
+                    # System time (or the peer reference clock) rather than get_current_time, no NTP query
+                    event_time = self.landing_time()
                     
-                    # Record timestamp immediately when the event is triggered
-                    # Use system time directly instead of get_current_time to avoid NTP sync
-                    event_time = time.time()
-                    
-                    GPIO.output(LED_FINISH_PIN, GPIO.HIGH)
-                    GPIO.output(LED_FINISH2_PIN, GPIO.LOW)
+                    if leds:
+                        GPIO.output(LED_FINISH_PIN, GPIO.HIGH)
+                        GPIO.output(LED_FINISH2_PIN, GPIO.LOW)
                     
                     # NTP sync before sending request removed as requested
                     
+                    # Bounded by the delivery deadline, then the pause or the error blink; systemd stays fed meanwhile
+                    self.watchdog.expect(self.landing_hold())
                     success = self.send_post_request_landing(self.SIDE, event_time)
                     
-                    # Force NTP update AFTER landing event is processed
-                    try:
-                        ntp_response = self.try_ntp_sync()
-                        logger.info("NTP time updated after landing event processing")
-                    except Exception as e:
-                        logger.warning(f"Could not update NTP time after landing event: {e}")
+                    logger.info("Triggered landing event")
+                    logger.info("Finish sensor GPIO pin %d value: %s", FINISH_VIBRO_PIN, current_finish_state)
+                    logger.info("Start sensor GPIO pin %d value: %s", START_OPT_PIN, current_start_state)
+                    
+                    # Force NTP update AFTER landing event is processed, off the sensor thread
+                    self.sync_ntp_later("landing event processing")
                     
                     if success:
                         logger.info("Landing event successfully processed")
@@ -757,18 +1130,25 @@ class SensorSystem:
                     else:
                         logger.error("Landing event failed to process properly!")
                         # Visual error indication - blink pattern
-                        self.error_blink_pattern(5)
+                        self.error_blink_pattern(LANDING_BLINKS)
                         
                         # Reset states for next detection
                         self.ff = False
                         self.start_activated = False
                 
-                elif not current_start_state:
+                elif not current_start_state and leds:
                     GPIO.output(LED_FINISH_PIN, GPIO.LOW)
                     GPIO.output(LED_FINISH2_PIN, GPIO.HIGH)
                 
+                # Live state for local readers, only written when something changed or the heartbeat is due
+                if self.state_board is not None:
+                    phase = (state_board.FLYING if self.race_start is not None else state_board.ARMED if self.ff
+                             else state_board.HOLDING if not current_start_state else state_board.IDLE)
+                    self.state_board.update(self.SIDE, current_start_state, current_finish_state, phase)
+                
                 # Short sleep to reduce CPU usage
-                time.sleep(0.01)
+                sleep_started = time.perf_counter()
+                time.sleep(LOOP_INTERVAL)
         
         except KeyboardInterrupt:
             logger.info("Program terminated by user")
@@ -779,8 +1159,11 @@ class SensorSystem:
                     termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
                 except:
                     pass
+            self.watchdog.stop()
             GPIO.cleanup()
             logger.info("GPIO cleaned up")
+            if self.engine_server:
+                self.engine_server.stop()
 
 
 def main():
@@ -794,6 +1177,8 @@ def main():
     
     # Create and run the sensor system
     sensor_system = SensorSystem()
+    # systemctl reload (SIGHUP) applies config.json without a restart
+    signal.signal(signal.SIGHUP, sensor_system.reload_on_signal)
     sensor_system.run()
 
 
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import gzip
+import time
+import sqlite3
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive.db")
+BATCH_SIZE = 10000  # Rows per executemany, one transaction per source
+SQLITE_MAGIC = b"SQLite format 3\x00"
+EXPORT_COLUMNS = ("id", "side", "start_time", "finish_time", "match_time")
+
+
+def open_archive(path=ARCHIVE_PATH):
+    """Open (creating if needed) the archive database, tuned for bulk inserts"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-16384")  # 16 MB
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive_sources (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        station TEXT,
+        clock_offset REAL,
+        merged_at REAL NOT NULL,
+        read INTEGER NOT NULL DEFAULT 0,
+        inserted INTEGER NOT NULL DEFAULT 0,
+        skipped INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    # start_ms is the station's own clock, so merging again with another offset still finds the duplicates
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive_matches (
+        id INTEGER PRIMARY KEY,
+        station TEXT NOT NULL,
+        side INTEGER NOT NULL,
+        start_ms INTEGER NOT NULL,
+        start_time REAL NOT NULL,
+        finish_time REAL NOT NULL,
+        match_time REAL NOT NULL,
+        clock_offset REAL NOT NULL DEFAULT 0,
+        source_match_id INTEGER,
+        source_id INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_archive_key ON archive_matches (station, side, start_ms)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_start ON archive_matches (start_time)')
+    conn.commit()
+    return conn
+
+
+def is_database(path):
+    with open(path, "rb") as f:
+        return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+def read_database(path, batch_size=BATCH_SIZE):
+    """Completed matches of an exported matches.db as (id, side, start, finish, match time, None) tuples"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(matches)")}
+        if not columns:
+            raise ValueError(f"{path} has no matches table")
+        where = "WHERE completed = 1" if "completed" in columns else ""
+        cursor = conn.execute(f"SELECT id, side, start_time, finish_time, match_time FROM matches {where} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row + (None,)
+    finally:
+        conn.close()
+
+
+def read_ndjson(path):
+    """Matches of an NDJSON export (gzipped if the name ends in .gz), None for each unreadable line"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                start_time = record["start_time"]
+                finish_time = record["finish_time"]
+                yield (record.get("id"), record["side"], start_time, finish_time,
+                       record.get("match_time", finish_time - start_time), record.get("station"))
+            except (ValueError, KeyError, TypeError):
+                yield None
+
+
+def read_source(path, batch_size=BATCH_SIZE):
+    return read_database(path, batch_size) if is_database(path) else read_ndjson(path)
+
+
+def default_station(path):
+    """Station name from a file name like station_1.db or matches-station_1.ndjson.gz"""
+    name = os.path.basename(path)
+    for suffix in (".gz", ".ndjson", ".jsonl", ".db", ".sqlite"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    for prefix in ("matches-", "matches_"):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    return None if name in ("", "matches") else name
+
+
+def valid(record):
+    if record is None:
+        return False
+    _, side, start_time, finish_time, match_time, _ = record
+    return (side in (1, 2) and isinstance(start_time, (int, float)) and isinstance(finish_time, (int, float))
+            and isinstance(match_time, (int, float)) and start_time > 0 and finish_time >= start_time)
+
+
+def merge_source(conn, path, station=None, offsets=None, batch_size=BATCH_SIZE, name=None):
+    """Bulk-load one exported database or NDJSON file into the archive, returns its counts
+
+    Rows already in the archive (same station, side and start time to the millisecond) are
+    skipped. Times are shifted by the clock offset of their station, in seconds.
+    """
+    offsets = offsets or {}
+    station = station or default_station(name or path)
+    if not station and is_database(path):
+        raise ValueError(f"Name the station of {name or os.path.basename(path)}: station=path on the command line, stations in the API")
+    stats = {"source": name or os.path.basename(path), "station": station, "read": 0, "inserted": 0, "skipped": 0}
+    cursor = conn.execute(
+        "INSERT INTO archive_sources (name, station, clock_offset, merged_at) VALUES (?, ?, ?, ?)",
+        (stats["source"], station, offsets.get(station), time.time())
+    )
+    source_id = cursor.lastrowid
+
+    def flush(rows):
+        before = conn.total_changes
+        conn.executemany('''
+        INSERT OR IGNORE INTO archive_matches
+        (station, side, start_ms, start_time, finish_time, match_time, clock_offset, source_match_id, source_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        stats["inserted"] += conn.total_changes - before
+
+    rows = []
+    try:
+        for record in read_source(path, batch_size):
+            stats["read"] += 1
+            if not valid(record) or not (record[5] or station):
+                stats["skipped"] += 1
+                continue
+            match_id, side, start_time, finish_time, match_time, record_station = record
+            row_station = record_station or station
+            offset = offsets.get(row_station, 0.0)
+            rows.append((row_station, side, round(start_time * 1000), start_time + offset, finish_time + offset,
+                         match_time, offset, match_id, source_id))
+            if len(rows) >= batch_size:
+                flush(rows)
+                rows = []
+        if rows:
+            flush(rows)
+        conn.execute("UPDATE archive_sources SET read = ?, inserted = ?, skipped = ? WHERE id = ?",
+                     (stats["read"], stats["inserted"], stats["skipped"], source_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    stats["duplicates"] = stats["read"] - stats["skipped"] - stats["inserted"]
+    return stats
+
+
+def merge(sources, archive_path=ARCHIVE_PATH, offsets=None, batch_size=BATCH_SIZE):
+    """Merge (station or None, path) sources into the archive, returns the counts of each"""
+    conn = open_archive(archive_path)
+    try:
+        results = []
+        for station, path in sources:
+            started = time.time()
+            stats = merge_source(conn, path, station, offsets, batch_size)
+            stats["seconds"] = round(time.time() - started, 3)
+            logger.info(f"Merged {stats['source']}: {stats['inserted']} new, {stats['duplicates']} duplicate, "
+                        f"{stats['skipped']} skipped in {stats['seconds']}s")
+            results.append(stats)
+        return results
+    finally:
+        conn.close()
+
+
+def summary(archive_path=ARCHIVE_PATH):
+    """Row counts per station and the merge history"""
+    conn = open_archive(archive_path)
+    try:
+        stations = [
+            {"station": station, "matches": count, "first": first, "last": last}
+            for station, count, first, last in conn.execute(
+                "SELECT station, COUNT(*), MIN(start_time), MAX(start_time) FROM archive_matches GROUP BY station ORDER BY station"
+            )
+        ]
+        sources = [
+            dict(zip(("name", "station", "clock_offset", "merged_at", "read", "inserted", "skipped"), row))
+            for row in conn.execute(
+                "SELECT name, station, clock_offset, merged_at, read, inserted, skipped FROM archive_sources ORDER BY id DESC LIMIT 50"
+            )
+        ]
+        return {"stations": stations, "sources": sources}
+    finally:
+        conn.close()
+
+
+def export_ndjson(db_path, station, batch_size=BATCH_SIZE):
+    """NDJSON lines of a station's completed matches, the other input format of merge"""
+    for record in read_database(db_path, batch_size):
+        row = dict(zip(EXPORT_COLUMNS, record))
+        row["station"] = station
+        yield json.dumps(row) + "\n"
+
+
+def parse_source(argument):
+    """station=path or just path"""
+    station, separator, path = argument.partition("=")
+    if separator and not os.path.exists(argument):
+        return station, path
+    return None, argument
+
+
+def parse_offsets(arguments):
+    offsets = {}
+    for argument in arguments or []:
+        station, separator, seconds = argument.partition("=")
+        if not separator:
+            raise argparse.ArgumentTypeError(f"Offset {argument} is not station=seconds")
+        offsets[station] = float(seconds)
+    return offsets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge match databases and NDJSON exports of several stations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge_parser = commands.add_parser("merge", help="Bulk-load exports into an archive database")
+    merge_parser.add_argument("archive", help="Archive database, created if missing")
+    merge_parser.add_argument("sources", nargs="+", help="Exported matches.db or .ndjson(.gz) files, as station=path "
+                              "unless the file name or the records name the station")
+    merge_parser.add_argument("--offset", action="append", metavar="STATION=SECONDS",
+                              help="Clock offset added to a station's times, repeat per station")
+    merge_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    export_parser = commands.add_parser("export", help="Write a matches.db as NDJSON to stdout")
+    export_parser.add_argument("database")
+    export_parser.add_argument("--station", required=True)
+    summary_parser = commands.add_parser("summary", help="Matches per station and merge history of an archive")
+    summary_parser.add_argument("archive")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    if args.command == "merge":
+        results = merge([parse_source(source) for source in args.sources], args.archive,
+                        parse_offsets(args.offset), args.batch_size)
+        print(json.dumps(results, indent=2))
+    elif args.command == "export":
+        sys.stdout.writelines(export_ndjson(args.database, args.station))
+    else:
+        print(json.dumps(summary(args.archive), indent=2))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import time
+import threading
+
+
+class MatchCache:
+    """Match query results and rendered fragments, kept until the next write to the matches"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Starts from the clock, so an ETag from before a restart never matches
+        self.version = int(time.time() * 1000)
+        self.entries = {}
+        self.followed = None  # Last version seen from the engine process in isolated mode
+
+    def get(self, key, compute):
+        """(value, version) for key, computed on a miss; a value computed across a write is not kept
+
+        The version is the one the value was computed at, so an ETag built from it never
+        vouches for a value older than the tag says.
+        """
+        with self.lock:
+            version = self.version
+            if key in self.entries:
+                return self.entries[key]
+        value = compute()
+        with self.lock:
+            if self.version == version:
+                self.entries[key] = (value, version)
+        return value, version
+
+    def invalidate(self):
+        """Drop everything, called after every write to the matches table"""
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+    def follow(self, version):
+        """Invalidate when the process writing the matches reports a new version, True if it did"""
+        if version is not None and version != self.followed:
+            self.followed = version
+            self.invalidate()
+            return True
+        return False
+
+    def etag(self, key, version):
+        """Entity tag of a cached resource at the version get() returned with it"""
+        return f"{key}-{version}"
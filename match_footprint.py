@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+import web_server
+import event_record
+from event_record import EventRecord
+
+# What an upstream typically answers to an event
+SAMPLE_BODY = {
+    "status": "ok",
+    "event": {"id": 123456, "side": 1, "type": "take_off", "station": "station_1", "received_at": "2026-10-19T12:00:00.123Z"},
+    "race": {"id": 9876, "heat": 3, "pilots": ["pilot_alpha_1", "pilot_bravo_2"]},
+    "message": "Event accepted"
+}
+ATTEMPTS = ({"upstream": "proxy", "attempt": 1, "offset": 0.0, "timeout": 0.5, "elapsed": 0.012, "status": 200},)
+
+
+def sample_body(size):
+    """The sample body padded (or cut) to about size characters"""
+    body = json.dumps(SAMPLE_BODY)
+    if size > len(body):
+        return body[:-1] + f', "detail": "{"x" * (size - len(body) - 14)}"}}'
+    return body[:size]
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS"):
+                return int(line.split()[1])
+    return 0
+
+
+def save_legacy(side, start_time, finish_time, body):
+    """A match as it was stored before the compact layout: log lines, status in the response text, attempts as plain json.dumps"""
+    conn = sqlite3.connect(web_server.DB_PATH)
+    conn.execute('''
+    INSERT INTO matches
+    (side, start_time, finish_time, start_time_formatted, finish_time_formatted, match_time,
+     start_log, finish_log, start_response, finish_response, start_attempts, finish_attempts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (side, start_time, finish_time, event_record.format_time(start_time), event_record.format_time(finish_time),
+          finish_time - start_time, event_record.log_line("take_off", start_time, side),
+          event_record.log_line("landing", finish_time, side), f"Status: 200\nBody: {body}", f"Status: 200\nBody: {body}",
+          json.dumps(list(ATTEMPTS)), json.dumps(list(ATTEMPTS))))
+    conn.commit()
+    conn.close()
+
+
+def save_compact(side, start_time, finish_time, body):
+    start = EventRecord(side, "take_off", start_time, "proxy", True, 200, 0.012, body, ATTEMPTS)
+    finish = EventRecord(side, "landing", finish_time, "proxy", True, 200, 0.012, body, ATTEMPTS)
+    web_server.save_match(start, finish)
+
+
+def measure(save, matches, body):
+    """Average stored bytes per match row, and the memory the match list and its rendered HTML take"""
+    with tempfile.TemporaryDirectory() as directory:
+        web_server.DB_PATH = os.path.join(directory, "matches.db")
+        web_server.initialize_database()
+        now = time.time()
+        for i in range(matches):
+            save(1 + i % 2, now + i * 60, now + i * 60 + 42.123, body)
+
+        conn = sqlite3.connect(web_server.DB_PATH)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(matches)")]
+        total = " + ".join(f"COALESCE(length({column}), 0)" for column in columns)
+        row_bytes = conn.execute(f"SELECT AVG({total}) FROM matches WHERE completed = 1").fetchone()[0]
+        conn.close()
+
+        web_server.match_cache.invalidate()
+        rss_before = rss_kb()
+        tracemalloc.start()
+        loaded = web_server.get_matches()
+        with web_server.app.app_context():
+            html = web_server.render_matches()
+        cache_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        rss_delta = rss_kb() - rss_before
+        del loaded
+        web_server.match_cache.invalidate()
+    return {"row_bytes": row_bytes, "cache_bytes": cache_bytes, "html_bytes": len(html), "rss_kb": rss_delta}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the stored size and memory of matches in the legacy and compact layouts")
+    parser.add_argument("--matches", type=int, default=40, help="Matches to save (the dashboard shows the last 40)")
+    parser.add_argument("--body-size", type=int, default=250, help="Characters in each upstream response body")
+    options = parser.parse_args()
+
+    logging.getLogger("web_server").setLevel(logging.WARNING)
+    body = sample_body(options.body_size)
+    # Template compilation and first imports would land on whichever layout is measured first
+    measure(save_compact, 2, body)
+    legacy = measure(save_legacy, options.matches, body)
+    compact = measure(save_compact, options.matches, body)
+    print(f"{options.matches} matches, {len(body)}-character response bodies")
+    print(f"{'':10} {'bytes/row':>10} {'cache':>10} {'html':>10} {'rss':>8}")
+    for name, result in (("legacy", legacy), ("compact", compact)):
+        print(f"{name:10} {result['row_bytes']:10.1f} {result['cache_bytes'] / 1024:8.1f}KB "
+              f"{result['html_bytes'] / 1024:8.1f}KB {result['rss_kb']:6d}KB")
+    print(f"row size {100.0 * (1 - compact['row_bytes'] / legacy['row_bytes']):.0f}% smaller")
+    event = EventRecord(1, "take_off", time.time(), "proxy", True, 200, 0.012, body, ATTEMPTS)
+    as_dict = {name: getattr(event, name) for name in EventRecord.__slots__}
+    print(f"event record {sys.getsizeof(event)} bytes, as a dict {sys.getsizeof(as_dict)} bytes (without the values)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
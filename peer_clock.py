@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+import sys
+import time
+import socket
+import struct
+import logging
+import argparse
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Datagram layout (network byte order):
+#   header:   magic "SC", version, message type, sequence number
+#   REQUEST:  header + t1 (follower clock when sent), the follower's current estimate (reference minus its
+#             wall clock, error bound, its own drift, state code) and its node name (a length byte followed by UTF-8)
+#   RESPONSE: header + t1 echoed, t2 (reference clock when received), t3 (reference clock when sent)
+MAGIC = b"SC"
+VERSION = 1
+MSG_REQUEST = 1
+MSG_RESPONSE = 2
+
+HEADER = struct.Struct("!2sBBI")
+REQUEST_BODY = struct.Struct("!ddddB")
+RESPONSE_BODY = struct.Struct("!ddd")
+TIMESPEC = struct.Struct("@ll")
+
+MAX_DATAGRAM = 512
+DEFAULT_PORT = 1339
+ROLES = ("off", "reference", "follower")
+STATES = ("unsynced", "synced", "holdover")
+
+MIN_SAMPLES = 3  # Exchanges before the estimate is used
+MIN_DRIFT_SPAN = 10.0  # Seconds of samples before drift is estimated, offset only until then
+STEP_THRESHOLD = 0.128  # A sample this far off the estimate is an outlier, or a step of the reference clock
+STEP_CONFIRM = 3  # Outliers in a row that mean the reference clock stepped
+HOLDOVER_DRIFT = 50e-6  # Error growth per second without exchanges, a Pi crystal's tolerance
+AGREEMENT = 0.001  # Error bound under which a node agrees with the reference
+STALE_AFTER = 30.0  # Seconds without a request before the reference lists a node as lost
+
+# Kernel receive timestamps keep the Python wake-up delay out of the exchange. The socket module
+# does not name the option, 35 is its value on Linux for x86 and ARM.
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35 if sys.platform.startswith("linux") else None)
+
+
+def enable_timestamps(sock):
+    if SO_TIMESTAMPNS is None:
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return True
+    except OSError:
+        return False
+
+
+def receive(sock, timestamps):
+    """recvfrom, plus the wall clock time the datagram arrived: the kernel's if timestamps are on, else now"""
+    if not timestamps:
+        data, address = sock.recvfrom(MAX_DATAGRAM)
+        return data, address, time.time()
+    data, ancillary, _, address = sock.recvmsg(MAX_DATAGRAM, socket.CMSG_SPACE(TIMESPEC.size))
+    for level, kind, value in ancillary:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(value) >= TIMESPEC.size:
+            seconds, nanoseconds = TIMESPEC.unpack_from(value)
+            return data, address, seconds + nanoseconds * 1e-9
+    return data, address, time.time()
+
+
+def parse_header(data, message_type):
+    """Sequence number of a datagram of the given type, None for anything else"""
+    if len(data) < HEADER.size:
+        return None
+    magic, version, kind, seq = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or kind != message_type:
+        return None
+    return seq
+
+
+class PeerClockServer:
+    """Reference side: answers exchanges with its own wall clock and keeps the last report of each node"""
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.nodes = {}  # Node name -> its last request
+        self.lock = threading.Lock()
+        self.sock = None
+        self.timestamps = False
+        self.closed = False
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.port = self.sock.getsockname()[1]
+        self.timestamps = enable_timestamps(self.sock)
+        thread = threading.Thread(target=self.serve, name="peer-clock-server")
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Peer clock reference listening on UDP {self.host}:{self.port}")
+        return self
+
+    def close(self):
+        self.closed = True
+        if self.sock is not None:
+            self.sock.close()
+
+    def serve(self):
+        while not self.closed:
+            try:
+                data, address, t2 = receive(self.sock, self.timestamps)
+            except OSError as e:
+                if self.closed:
+                    break
+                logger.error(f"Peer clock receive error: {e}")
+                continue
+            seq = parse_header(data, MSG_REQUEST)
+            if seq is None or len(data) < HEADER.size + REQUEST_BODY.size + 1:
+                continue
+            t1, offset, error, drift, state = REQUEST_BODY.unpack_from(data, HEADER.size)
+            t3 = time.time()
+            try:
+                self.sock.sendto(HEADER.pack(MAGIC, VERSION, MSG_RESPONSE, seq) + RESPONSE_BODY.pack(t1, t2, t3), address)
+            except OSError as e:
+                if not self.closed:
+                    logger.warning(f"Could not answer peer clock request from {address[0]}: {e}")
+                continue
+            name_start = HEADER.size + REQUEST_BODY.size
+            node = data[name_start + 1:name_start + 1 + data[name_start]].decode("utf-8", "replace") or address[0]
+            with self.lock:
+                self.nodes[node] = (address[0], offset, error, drift, state, time.monotonic())
+
+    def snapshot(self):
+        """The reference's view: the last reported estimate of every node that synced against it"""
+        now = time.monotonic()
+        with self.lock:
+            nodes = sorted(self.nodes.items())
+        rows = []
+        for node, (address, offset, error, drift, state, seen) in nodes:
+            age = now - seen
+            state_name = "lost" if age > STALE_AFTER else STATES[state] if state < len(STATES) else "unknown"
+            rows.append({
+                "node": node,
+                "address": address,
+                "state": state_name,
+                "offset_ms": round(offset * 1000, 3),
+                "error_ms": round(error * 1000, 3),
+                "drift_ppm": round(drift * 1e6, 2),
+                "agreed": state_name == "synced" and error < AGREEMENT,
+                "last_seen": round(age, 1)
+            })
+        return {"role": "reference", "port": self.port, "kernel_timestamps": self.timestamps, "nodes": rows}
+
+
+class PeerClock:
+    """Follower side: estimates the reference clock's offset and drift from two-way exchanges
+
+    Each poll sends a short burst of exchanges and keeps the one with the least round trip,
+    the least disturbed by queuing. Offset and drift are a least-squares line through the kept
+    samples against the local monotonic clock, so a step of the local wall clock does not matter.
+    """
+
+    def __init__(self, reference_host, port=DEFAULT_PORT, node=None, interval=1.0, burst=4, window=64,
+                 timeout=0.25, local_clock=time.monotonic):
+        self.reference = (reference_host, port)
+        self.node = (node or socket.gethostname()).encode("utf-8")[:255]
+        self.interval = interval
+        self.burst = burst
+        self.timeout = timeout
+        self.local_clock = local_clock
+        self.samples = deque(maxlen=window)  # (local time, offset, round trip) of the best exchange of each poll
+
+        # reference time = local + offset + drift * (local - base), replaced as one tuple so now() never sees a mix
+        self.fit = None  # (base, offset, drift)
+        self.error = None  # Error bound of the fit in seconds
+        self.last_sync = None  # Local time of the last poll that got an answer
+        self.outliers = 0
+        self.polls = 0
+        self.lost = 0  # Exchanges without an answer
+        self.steps = 0
+        self.sock = None
+        self.timestamps = False
+        self.seq = 0
+        self.stopped = threading.Event()
+
+    def now(self):
+        """Reference time now, the local wall clock until the first estimate"""
+        fit = self.fit
+        if fit is None:
+            return time.time()
+        local = self.local_clock()
+        return local + fit[1] + fit[2] * (local - fit[0])
+
+    def pinned(self):
+        """A clock on the current estimate only, later fits and steps do not move it (both times of a race)"""
+        fit = self.fit
+        if fit is None:
+            return time.time
+        base, offset, drift = fit
+        local_clock = self.local_clock
+
+        def clock():
+            local = local_clock()
+            return local + offset + drift * (local - base)
+        return clock
+
+    def state(self):
+        if self.fit is None:
+            return "unsynced"
+        if self.local_clock() - self.last_sync > max(5 * self.interval, 5.0):
+            return "holdover"
+        return "synced"
+
+    def current_error(self):
+        """Error bound now: the fit's, growing with the time since the last exchange"""
+        if self.error is None:
+            return None
+        return self.error + (self.local_clock() - self.last_sync) * HOLDOVER_DRIFT
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="peer-clock")
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Peer clock following {self.reference[0]}:{self.reference[1]}")
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        failing = False
+        while True:
+            try:
+                self.poll()
+                if failing:
+                    logger.info(f"Peer clock reference {self.reference[0]} reachable again")
+                    failing = False
+            except OSError as e:
+                # Unreachable reference: keep the estimate and try again with a new socket
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+                if not failing:
+                    logger.warning(f"Peer clock exchange with {self.reference[0]} failed, holding the estimate: {e}")
+                    failing = True
+            if self.stopped.wait(self.interval):
+                break
+        if self.sock is not None:
+            self.sock.close()
+
+    def open_socket(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(self.reference)
+        self.timestamps = enable_timestamps(self.sock)
+
+    def report(self):
+        """This node's estimate as sent along with each request"""
+        state = self.state()
+        if state == "unsynced":
+            return 0.0, 0.0, 0.0, 0
+        return self.now() - time.time(), self.current_error(), -self.fit[2], STATES.index(state)
+
+    def exchange(self, report):
+        """One request and its answer, returns (local midpoint, offset, round trip) or None when lost"""
+        if self.sock is None:
+            self.open_socket()
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        node = bytes([len(self.node)]) + self.node
+        t1 = self.local_clock()
+        self.sock.send(HEADER.pack(MAGIC, VERSION, MSG_REQUEST, self.seq) + REQUEST_BODY.pack(t1, *report) + node)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.sock.settimeout(remaining)
+            try:
+                data, _, arrived = receive(self.sock, self.timestamps)
+            except socket.timeout:
+                return None
+            # Arrival on the local clock: the kernel timestamp is wall clock, moved over by how long ago it was
+            t4 = self.local_clock() - (time.time() - arrived)
+            if parse_header(data, MSG_RESPONSE) != self.seq or len(data) < HEADER.size + RESPONSE_BODY.size:
+                continue  # A late answer to an earlier request
+            echoed, t2, t3 = RESPONSE_BODY.unpack_from(data, HEADER.size)
+            if echoed != t1:
+                continue
+            round_trip = (t4 - t1) - (t3 - t2)
+            return (t1 + t4) / 2, (t2 + t3) / 2 - (t1 + t4) / 2, max(round_trip, 0.0)
+
+    def poll(self):
+        """One burst of exchanges, the best one updates the estimate"""
+        self.polls += 1
+        report = self.report()
+        best = None
+        for _ in range(self.burst):
+            sample = self.exchange(report)
+            if sample is None:
+                self.lost += 1
+            elif best is None or sample[2] < best[2]:
+                best = sample
+        if best is None:
+            return
+        fit = self.fit
+        # Right after starting over the old estimate stays in use, but is not what new samples are judged by
+        if fit is not None and len(self.samples) >= MIN_SAMPLES:
+            predicted = fit[1] + fit[2] * (best[0] - fit[0])
+            if abs(best[1] - predicted) > STEP_THRESHOLD:
+                self.outliers += 1
+                if self.outliers < STEP_CONFIRM:
+                    return
+                logger.warning(f"Reference clock moved by {best[1] - predicted:+.3f}s, starting the estimate over")
+                self.samples.clear()
+                self.steps += 1
+        self.outliers = 0
+        self.samples.append(best)
+        self.update_fit()
+        self.last_sync = best[0]
+
+    def update_fit(self):
+        """Least-squares offset and drift through the samples with the shortest round trips"""
+        if len(self.samples) < MIN_SAMPLES:
+            return
+        shortest = min(sample[2] for sample in self.samples)
+        margin = max(shortest, 0.0005)
+        kept = [sample for sample in self.samples if sample[2] <= shortest + margin]
+        base = self.samples[-1][0]
+        xs = [sample[0] - base for sample in kept]
+        ys = [sample[1] for sample in kept]
+        count = len(kept)
+        mean_x = sum(xs) / count
+        mean_y = sum(ys) / count
+        spread = sum((x - mean_x) ** 2 for x in xs)
+        if count >= MIN_SAMPLES and xs[-1] - xs[0] >= MIN_DRIFT_SPAN and spread > 0:
+            drift = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+        else:
+            drift = self.fit[2] if self.fit is not None else 0.0
+        offset = mean_y - drift * mean_x
+        residual = (sum((y - offset - drift * x) ** 2 for x, y in zip(xs, ys)) / count) ** 0.5
+        # Half the round trip bounds the path asymmetry, the residuals add what the line does not explain
+        error = shortest / 2 + residual
+        if self.fit is None:
+            logger.info(f"Peer clock synced to {self.reference[0]}: offset {offset - (time.time() - self.local_clock()):+.6f}s "
+                        f"from the local clock, error {error * 1000:.3f} ms")
+        self.fit = (base, offset, drift)
+        self.error = error
+
+    def snapshot(self):
+        """This node's estimate for the web interface"""
+        state = self.state()
+        info = {
+            "role": "follower",
+            "reference": f"{self.reference[0]}:{self.reference[1]}",
+            "node": self.node.decode("utf-8"),
+            "state": state,
+            "polls": self.polls,
+            "lost": self.lost,
+            "steps": self.steps,
+            "samples": len(self.samples),
+            "kernel_timestamps": self.timestamps
+        }
+        if state != "unsynced":
+            error = self.current_error()
+            info.update({
+                "offset_ms": round((self.now() - time.time()) * 1000, 3),
+                "error_ms": round(error * 1000, 3),
+                "drift_ppm": round(-self.fit[2] * 1e6, 2),  # How fast this node's clock runs against the reference
+                "round_trip_ms": round(min(sample[2] for sample in self.samples) * 1000, 3),
+                "agreed": state == "synced" and error < AGREEMENT,
+                "last_sync": round(self.local_clock() - self.last_sync, 1)
+            })
+        return info
+
+
+def simulated_clock(offset, drift_ppm):
+    """A local clock off by offset seconds and running drift_ppm fast, to try the estimate out on one machine"""
+    started = time.monotonic()
+    wall_at_start = time.time()
+
+    def clock():
+        elapsed = time.monotonic() - started
+        return wall_at_start + offset + elapsed * (1 + drift_ppm * 1e-6)
+    return clock
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SL Timer peer clock: a reference for the timers on the LAN, or a follower")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Run a reference, typically next to the proxy")
+    serve_parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="UDP port to listen on")
+    serve_parser.add_argument("--report", type=float, default=10.0, help="Seconds between node table logs")
+    follow_parser = commands.add_parser("follow", help="Follow a reference and log the estimate")
+    follow_parser.add_argument("reference", help="Host of the reference")
+    follow_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    follow_parser.add_argument("--node", help="Name reported to the reference, the host name by default")
+    follow_parser.add_argument("--interval", type=float, default=1.0, help="Seconds between polls")
+    follow_parser.add_argument("--simulate-offset", type=float, default=0.0, help="Seconds to put the local clock off by")
+    follow_parser.add_argument("--simulate-drift", type=float, default=0.0, help="ppm to make the local clock run fast")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    try:
+        if args.command == "serve":
+            server = PeerClockServer(args.host, args.port).start()
+            while True:
+                time.sleep(args.report)
+                for row in server.snapshot()["nodes"]:
+                    logger.info(f"{row['node']} ({row['address']}): {row['state']}, offset {row['offset_ms']:+.3f} ms, "
+                                f"error {row['error_ms']:.3f} ms, drift {row['drift_ppm']:+.2f} ppm"
+                                f"{'' if row['agreed'] else ', NOT AGREED'}")
+        else:
+            simulated = args.simulate_offset or args.simulate_drift
+            local_clock = simulated_clock(args.simulate_offset, args.simulate_drift) if simulated else time.monotonic
+            clock = PeerClock(args.reference, args.port, args.node, args.interval, local_clock=local_clock).start()
+            while True:
+                time.sleep(max(args.interval, 1.0))
+                info = clock.snapshot()
+                if info["state"] == "unsynced":
+                    logger.info(f"Unsynced, {info['lost']} exchanges lost")
+                    continue
+                # With a simulated clock on the reference's machine, the wall clock is the truth
+                truth = f", actual error {(clock.now() - time.time()) * 1000:+.3f} ms" if simulated else ""
+                logger.info(f"{info['state']}: offset {info['offset_ms']:+.3f} ms, error {info['error_ms']:.3f} ms, "
+                            f"drift {info['drift_ppm']:+.2f} ppm, round trip {info['round_trip_ms']:.3f} ms{truth}")
+    except KeyboardInterrupt:
+        logger.info("Peer clock stopped")
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+import io
+import os
+import re
+import sys
+import time
+import marshal
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sample", "cprofile")
+TARGETS = ("sensor", "web", "process")
+MAX_SECONDS = 60.0
+DEFAULT_INTERVAL = 0.005  # 200 samples a second
+WEB_FRAMES = ("serve_forever", "process_request_thread")  # socketserver's accept loop and per-request threads
+# From Python 3.12 cProfile hooks sys.monitoring: a profile sees every thread and only one can be enabled at a time
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+# Idle state: nothing runs until a capture starts
+sensor_thread_id = None  # Set by the sensor loop
+sensor_profile = None  # ThreadProfile the sensor loop steps during a cProfile capture
+request_profile = None  # RequestProfiles the web server feeds during a cProfile capture
+capture_lock = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """Another capture is already running"""
+
+
+def register_sensor_thread():
+    """Mark the calling thread as the sensor loop"""
+    global sensor_thread_id
+    sensor_thread_id = threading.get_ident()
+
+
+def is_web_stack(frame):
+    while frame is not None:
+        if frame.f_code.co_name in WEB_FRAMES:
+            return True
+        frame = frame.f_back
+    return False
+
+
+def thread_filter(target):
+    """Predicate on (thread id, frame) for the threads a sampling capture covers"""
+    sampler = threading.get_ident()
+    if target == "sensor":
+        return lambda ident, frame: ident == sensor_thread_id
+    if target == "web":
+        return lambda ident, frame: ident != sampler and is_web_stack(frame)
+    return lambda ident, frame: ident != sampler
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def thread_label(thread):
+    # Per-request threads are numbered, one flame graph root covers them all
+    return re.sub(r"^Thread-\d+", "Thread", thread.name) if thread else "unknown"
+
+
+def sample(target, seconds, interval=DEFAULT_INTERVAL):
+    """Sample the stacks of the target threads for a while, returns collapsed stacks and the sample count"""
+    accept = thread_filter(target)
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if not accept(ident, frame):
+                continue
+            thread = threads.get(ident)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_label(thread))
+            stacks[";".join(reversed(labels))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def collapsed(stacks):
+    """Folded stack lines ("root;caller;callee count"), the input of flamegraph.pl, speedscope and inferno"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class ThreadProfile:
+    """cProfile of the sensor loop thread, switched on and off by the loop itself at step()"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.profile = None
+        self.deadline = None
+        self.done = threading.Event()
+
+    def step(self):
+        """Called by the sensor loop every iteration until the capture is collected, False once it is over"""
+        if self.done.is_set():
+            return False
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.deadline = time.monotonic() + self.seconds
+            self.profile.enable()
+            return True
+        if time.monotonic() < self.deadline:
+            return True
+        self.profile.disable()
+        self.done.set()
+        return False
+
+
+class RequestProfiles:
+    """cProfile of each web request handled during a capture, merged into one set of statistics"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = None
+        self.requests = 0
+
+    def begin(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def end(self, profile):
+        profile.disable()
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+            self.requests += 1
+
+
+def profile_process(seconds):
+    """cProfile every thread for a while with a single profile, what Python 3.12 and later allow"""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        raise ProfileBusy("Another profiler is active in this process")
+    try:
+        time.sleep(seconds)
+    finally:
+        profile.disable()
+    return pstats.Stats(profile), "every thread (one profile per process from Python 3.12)"
+
+
+def profile_calls(target, seconds):
+    """cProfile the sensor loop, web requests or both for a while, returns the merged statistics and what they cover"""
+    global sensor_profile, request_profile
+    if not PER_THREAD_PROFILES:
+        return profile_process(seconds)
+    sensor = ThreadProfile(seconds) if target in ("sensor", "process") and sensor_thread_id is not None else None
+    requests = RequestProfiles() if target in ("web", "process") else None
+    sensor_profile, request_profile = sensor, requests
+    try:
+        if sensor is not None:
+            # A stalled loop never finishes its capture
+            if not sensor.done.wait(seconds + 5.0):
+                raise TimeoutError("The sensor loop did not finish the capture, see /api/watchdog")
+        else:
+            time.sleep(seconds)
+    finally:
+        sensor_profile, request_profile = None, None
+
+    stats = None
+    covered = []
+    if sensor is not None:
+        stats = pstats.Stats(sensor.profile)
+        covered.append("sensor loop")
+    if requests is not None:
+        with requests.lock:
+            if requests.stats is not None:
+                if stats is None:
+                    stats = requests.stats
+                else:
+                    stats.add(requests.stats)
+            covered.append(f"{requests.requests} web requests")
+    if stats is None:
+        raise ValueError("Nothing was profiled: the sensor loop is not running here and no web request came in")
+    return stats, ", ".join(covered)
+
+
+def check(mode, target):
+    """Raise ValueError for an unknown mode or target"""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if target not in TARGETS:
+        raise ValueError(f"target must be one of {', '.join(TARGETS)}")
+
+
+def capture(mode, target, seconds, interval=DEFAULT_INTERVAL, output=None):
+    """Run one bounded capture, returns (file name, mime type, body bytes)
+
+    Sampling gives collapsed stacks for a flame graph. cProfile gives a pstats file for
+    snakeviz or flameprof, or with output="text" the top functions by cumulative time.
+    """
+    check(mode, target)
+    if target == "sensor" and sensor_thread_id is None:
+        raise ValueError("The sensor loop does not run in this process")
+    seconds = min(max(float(seconds), 0.1), MAX_SECONDS)
+    interval = max(float(interval), 0.001)
+    if not capture_lock.acquire(blocking=False):
+        raise ProfileBusy("A profile is already being captured")
+    try:
+        logger.info(f"Capturing a {seconds:g}s {mode} profile of {target}")
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if mode == "sample":
+            stacks, samples = sample(target, seconds, interval)
+            logger.info(f"Profile done: {samples} samples, {len(stacks)} distinct stacks")
+            return f"profile-{target}-{stamp}.folded", "text/plain", collapsed(stacks).encode("utf-8")
+
+        stats, covered = profile_calls(target, seconds)
+        logger.info(f"Profile done: {covered}")
+        if output == "text":
+            text = io.StringIO()
+            stats.stream = text
+            stats.sort_stats("cumulative").print_stats(60)
+            return f"profile-{target}-{stamp}.txt", "text/plain", f"Covers: {covered}\n{text.getvalue()}".encode("utf-8")
+        # The pstats file format, what Stats.dump_stats writes
+        return f"profile-{target}-{stamp}.prof", "application/octet-stream", marshal.dumps(stats.stats)
+    finally:
+        capture_lock.release()
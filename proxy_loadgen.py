@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from delivery import IDEMPOTENCY_HEADER
+from proxy_server import EventProxy, UpstreamPool, read_request, encode_response, keeps_alive
+
+logger = logging.getLogger(__name__)
+
+
+class FakeUpstream:
+    """Counts the events it receives and those arriving out of their station's order, answering 200 after an optional delay, or 503 while down"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.down = False
+        self.received = 0
+        self.keys = set()
+        self.last_time = {}  # Station code -> time of its latest event received
+        self.out_of_order = 0
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                _, _, headers, body = request
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                if self.down:
+                    writer.write(encode_response(503, {"success": False}))
+                else:
+                    self.received += 1
+                    key = headers.get(IDEMPOTENCY_HEADER.lower())
+                    if key not in self.keys:
+                        event = json.loads(body)
+                        event_time = event["event_body"]["time"]
+                        if event_time < self.last_time.get(event["station_code"], 0.0):
+                            self.out_of_order += 1
+                        self.last_time[event["station_code"]] = event_time
+                    self.keys.add(key)
+                    writer.write(encode_response(200, {"success": True}))
+                await writer.drain()
+                if not keeps_alive(headers):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def event_body(station, side, event_type):
+    return json.dumps({
+        "station_code": station,
+        "secure_key": "loadgen",
+        "event_type": event_type,
+        "event_body": {"side": side, "time": round(time.time(), 3)}
+    }).encode("utf-8")
+
+
+async def station(url, index, deadline, rate, duplicates, latencies, counters):
+    """One simulated timer on its own keep-alive connection, sending events until the deadline"""
+    pool = UpstreamPool(url, size=1)
+    interval = 1.0 / rate if rate else 0.0
+    next_send = time.perf_counter()
+    sequence = 0
+    last_key = None
+    try:
+        while time.perf_counter() < deadline:
+            sequence += 1
+            # Retransmits reuse the key of the event before, as a timer retry would
+            if last_key and duplicates and sequence % round(1 / duplicates) == 0:
+                key = last_key
+            else:
+                key = uuid.uuid4().hex
+            body = event_body(f"loadgen-{index}", 1 + index % 2, "take_off" if sequence % 2 else "landing")
+            started = time.perf_counter()
+            try:
+                status, _ = await pool.post(body, {IDEMPOTENCY_HEADER: key})
+            except Exception:
+                counters["errors"] += 1
+                await asyncio.sleep(0.1)
+                continue
+            latencies.append(time.perf_counter() - started)
+            counters["acked" if status == 200 else "errors"] += 1
+            counters["sent_keys"].add(key)
+            last_key = key
+            if interval:
+                next_send += interval
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+    finally:
+        pool.close()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def run(options):
+    upstream = None
+    proxy = None
+    url = options.url
+    backlog_dir = tempfile.mkdtemp(prefix="proxy-loadgen-")
+    if not url:
+        # Everything in this process: a counting upstream and the proxy in front of it
+        upstream = await FakeUpstream(options.upstream_delay).start()
+        proxy = EventProxy(
+            f"http://127.0.0.1:{upstream.port}/api", "127.0.0.1", 0,
+            backlog_path=os.path.join(backlog_dir, "backlog.db"), connections=options.connections
+        )
+        await proxy.start()
+        url = f"http://127.0.0.1:{proxy.port}/proxy"
+
+    latencies = []
+    counters = {"acked": 0, "errors": 0, "sent_keys": set()}
+    started = time.perf_counter()
+    deadline = started + options.duration
+
+    async def outage():
+        await asyncio.sleep(options.outage_at)
+        upstream.down = True
+        logger.info("Upstream down")
+        await asyncio.sleep(options.outage)
+        upstream.down = False
+        logger.info("Upstream back")
+
+    tasks = [asyncio.create_task(station(url, index, deadline, options.rate, options.duplicates, latencies, counters))
+             for index in range(options.stations)]
+    if upstream and options.outage:
+        tasks.append(asyncio.create_task(outage()))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    print(f"Stations: {options.stations}, duration {elapsed:.1f}s")
+    print(f"Acknowledged: {counters['acked']} ({counters['acked'] / elapsed:.0f} events/s), errors: {counters['errors']}")
+    print(f"Ack latency: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms,"
+          f" max {max(latencies, default=0) * 1000:.2f} ms")
+
+    if proxy:
+        # Wait for the backlog to drain to the upstream
+        drain_started = time.perf_counter()
+        while time.perf_counter() - drain_started < options.drain_timeout:
+            health = await proxy.health()
+            if not health["backlog"] and not health["queued"]:
+                break
+            await asyncio.sleep(0.2)
+        health = await proxy.health()
+        print(f"Proxy: {json.dumps(health)}")
+        print(f"Upstream received {upstream.received} requests for {len(upstream.keys)} distinct events"
+              f" ({len(counters['sent_keys'])} distinct sent), drained {time.perf_counter() - drain_started:.1f}s after the load")
+        lost = counters["sent_keys"] - upstream.keys
+        print(f"Lost events: {len(lost)}, out of their station's order: {upstream.out_of_order}")
+        await proxy.stop()
+        await upstream.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the event proxy")
+    parser.add_argument("--url", help="Proxy URL to load; without it a proxy and a counting upstream run in this process")
+    parser.add_argument("--stations", type=int, default=50, help="Concurrent simulated timers")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to send for")
+    parser.add_argument("--rate", type=float, default=0.0, help="Events per second per station, 0 sends as fast as acknowledged")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Fraction of sends repeating the previous event")
+    parser.add_argument("--connections", type=int, default=16, help="Proxy upstream connections (local proxy only)")
+    parser.add_argument("--upstream-delay", type=float, default=0.0, help="Response delay of the counting upstream")
+    parser.add_argument("--outage", type=float, default=0.0, help="Seconds the counting upstream answers 503")
+    parser.add_argument("--outage-at", type=float, default=2.0, help="When the outage starts")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="How long to wait for the backlog to drain")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    asyncio.run(run(args))
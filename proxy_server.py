@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+import os
+import ssl
+import json
+import time
+import random
+import asyncio
+import logging
+import sqlite3
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from delivery import IDEMPOTENCY_HEADER
+import peer_clock
+
+logger = logging.getLogger(__name__)
+
+# Accepted events wait here until the upstream has taken them, across restarts
+BACKLOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "proxy_backlog.db")
+
+DEFAULT_PORT = 1337
+DEFAULT_PATH = "/proxy"
+MAX_QUEUED = 50000  # Events held in memory for forwarding, the rest wait in the backlog
+EVENT_TYPES = ("take_off", "landing")
+MAX_BODY = 16 * 1024
+MAX_HEADERS = 100
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    """Malformed request, answered with the given status and the connection closed"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    """Read one HTTP/1.x request, returns (method, path, headers, body) or None when the client closed"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Bad request line")
+    headers = {"__version__": version}
+    for _ in range(MAX_HEADERS):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "Too many headers")
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY:
+        raise HttpError(413, "Body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target.split("?", 1)[0], headers, body
+
+
+def keeps_alive(headers):
+    """Whether the client wants the connection kept open after this request"""
+    connection = headers.get("connection", "").lower()
+    if headers.get("__version__") == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+def encode_response(status, payload, keep_alive=True, head=False):
+    """Complete HTTP/1.1 response with a JSON body, only its headers for a HEAD request"""
+    body = json.dumps(payload).encode("utf-8")
+    return (
+        f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode("latin-1") + (b"" if head else body)
+
+
+class UpstreamPool:
+    """Keep-alive HTTP/1.1 connections to one upstream URL, at most size of them in use at once"""
+
+    def __init__(self, url, size=8, timeout=5.0):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.https = parts.scheme == "https"
+        self.port = parts.port or (443 if self.https else 80)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.ssl = ssl.create_default_context() if self.https else None
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def post(self, body, headers=None):
+        """POST a body, returns (status, response body), reusing an idle connection when there is one"""
+        async with self.slots:
+            # An idle connection may have been closed by the server meanwhile, then a new one is opened
+            for reused in (True, False):
+                connection = self.idle.pop() if reused and self.idle else None
+                if reused and connection is None:
+                    continue
+                if connection is None:
+                    connection = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout
+                    )
+                try:
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self.exchange(connection, body, headers or {}), self.timeout
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    connection[1].close()
+                    if not reused:
+                        raise ConnectionError(str(e) or type(e).__name__)
+                    continue
+                except BaseException:
+                    connection[1].close()
+                    raise
+                if keep_alive:
+                    self.idle.append(connection)
+                else:
+                    connection[1].close()
+                return status, data
+
+    async def exchange(self, connection, body, headers):
+        """Write one request and read its response on an open connection"""
+        reader, writer = connection
+        head = [f"POST {self.path} HTTP/1.1", f"Host: {self.host}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}"]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by upstream")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(chunks)
+        elif "content-length" in response_headers:
+            data = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await reader.read()
+            keep_alive = False
+        return status, data, keep_alive
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class Backlog:
+    """SQLite table of accepted events not yet taken by the upstream, written in batches"""
+
+    def __init__(self, path=BACKLOG_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS backlog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            body BLOB NOT NULL,
+            received_at REAL NOT NULL
+        )
+        ''')
+        self.conn.commit()
+
+    def commit(self, events, delivered):
+        """Insert new events and remove delivered ones in one transaction, returns each event's row id (None if already queued)"""
+        row_ids = []
+        with self.conn:
+            for key, body, received_at in events:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO backlog (idempotency_key, body, received_at) VALUES (?, ?, ?)",
+                    (key, body, received_at)
+                )
+                row_ids.append(cursor.lastrowid if cursor.rowcount else None)
+            if delivered:
+                self.conn.executemany("DELETE FROM backlog WHERE id = ?", [(row_id,) for row_id in delivered])
+        return row_ids
+
+    def pending(self, after_id=0, limit=1000):
+        """Oldest waiting events after a row id"""
+        return self.conn.execute(
+            "SELECT id, idempotency_key, body FROM backlog WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+        ).fetchall()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM backlog").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def validate_event(event, stations=None):
+    """Check a proxy-format event, returns an error message or None"""
+    if not isinstance(event, dict):
+        return "Body must be a JSON object"
+    if not isinstance(event.get("station_code"), str) or not isinstance(event.get("secure_key"), str):
+        return "station_code and secure_key are required"
+    if stations is not None and stations.get(event["station_code"]) != event["secure_key"]:
+        return "Unknown station or wrong secure_key"
+    if event.get("event_type") not in EVENT_TYPES:
+        return f"event_type must be one of {', '.join(EVENT_TYPES)}"
+    body = event.get("event_body")
+    if not isinstance(body, dict) or body.get("side") not in (1, 2):
+        return "event_body.side must be 1 or 2"
+    event_time = body.get("time")
+    if isinstance(event_time, bool) or not isinstance(event_time, (int, float)) or event_time < 1000000000:
+        return "event_body.time must be a Unix timestamp"
+    return None
+
+
+def station_of(body):
+    """Station code of a stored event body, "" if it has none"""
+    try:
+        return json.loads(body).get("station_code", "")
+    except (ValueError, AttributeError):
+        return ""
+
+
+def event_key(event, headers):
+    """Idempotency key of an event: the timer's header, or its identifying fields"""
+    key = headers.get(IDEMPOTENCY_HEADER.lower())
+    if key:
+        return key
+    body = event["event_body"]
+    return f"{event['station_code']}:{event['event_type']}:{body['side']}:{body['time']}"
+
+
+class EventProxy:
+    """Accepts events from many timers, deduplicates and persists them, and forwards them over pooled connections"""
+
+    def __init__(self, upstream_url, host="0.0.0.0", port=DEFAULT_PORT, path=DEFAULT_PATH,
+                 backlog_path=BACKLOG_PATH, stations=None, connections=16, batch_size=256,
+                 dedup_size=65536, timeout=5.0, retry_max=30.0, clock_server=None):
+        self.upstream_url = upstream_url
+        self.host = host
+        self.port = port
+        self.path = path
+        self.backlog_path = backlog_path
+        self.stations = stations  # station_code -> secure_key, None accepts any station
+        self.connections = connections
+        self.batch_size = batch_size
+        self.dedup_size = dedup_size
+        self.timeout = timeout
+        self.retry_max = retry_max
+
+        self.seen = OrderedDict()  # Recently accepted idempotency keys
+        self.incoming = []  # (key, body, received_at, future, station) waiting for the next backlog commit
+        self.delivered = []  # Row ids the upstream took, removed with the next commit
+        self.queued = set()  # Row ids in the forward queues or being sent
+        self.last_queued = 0  # Highest row id queued, the queues hold the backlog in order up to it
+        self.replaying = True  # Rows in the backlog are not in memory yet, new rows wait behind them
+        self.retry_at = 0.0  # Forwarding pauses until then after an upstream failure
+        self.failures = 0
+        self.stats = {"received": 0, "accepted": 0, "duplicates": 0, "invalid": 0,
+                      "forwarded": 0, "rejected_upstream": 0, "upstream_errors": 0}
+        self.clock_server = clock_server  # Peer clock reference, its node reports are part of /health
+
+    async def start(self):
+        """Open the backlog, the upstream pool and the listening socket"""
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="proxy-backlog")
+        self.backlog = Backlog(self.backlog_path)
+        self.pool = UpstreamPool(self.upstream_url, self.connections, self.timeout)
+        # One queue and worker per connection, a station's events always go through the same one
+        self.queues = [asyncio.Queue() for _ in range(self.connections)]
+        self.commit_wakeup = asyncio.Event()
+        self.commit_lock = asyncio.Lock()
+        self.tasks = [asyncio.create_task(self.commit_loop()), asyncio.create_task(self.replay_loop())]
+        self.tasks.extend(asyncio.create_task(self.forward_loop(queue)) for queue in self.queues)
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        waiting = await self.run_db(self.backlog.count)
+        logger.info(f"Proxy listening on {self.host}:{self.port}{self.path}, forwarding to {self.upstream_url}"
+                    f" ({waiting} events in backlog)")
+        return self
+
+    async def stop(self):
+        """Stop accepting, write what is pending and close everything"""
+        self.server.close()
+        await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.commit()
+        self.pool.close()
+        await self.run_db(self.backlog.close)
+        self.db_executor.shutdown()
+
+    def run_db(self, function, *args):
+        """Run a backlog call on its own thread, SQLite stays off the event loop"""
+        return asyncio.get_running_loop().run_in_executor(self.db_executor, function, *args)
+
+    async def handle_client(self, reader, writer):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    writer.write(encode_response(e.status, {"success": False, "error": str(e)}, False))
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self.route(method, path, headers, body)
+                keep_alive = keeps_alive(headers)
+                writer.write(encode_response(status, payload, keep_alive, method == "HEAD"))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, body):
+        if path == "/health" and method in ("GET", "HEAD"):
+            return 200, await self.health()
+        if path != self.path:
+            return 404, {"success": False, "error": "Not found"}
+        if method == "HEAD":
+            return 200, {"success": True}  # Connection warm-up by the timers
+        if method != "POST":
+            return 405, {"success": False, "error": "Use POST"}
+        return await self.accept(headers, body)
+
+    async def accept(self, headers, body):
+        """Validate, deduplicate and durably queue one event before acknowledging it"""
+        self.stats["received"] += 1
+        try:
+            event = json.loads(body)
+        except ValueError:
+            self.stats["invalid"] += 1
+            return 400, {"success": False, "error": "Invalid JSON"}
+        error = validate_event(event, self.stations)
+        if error:
+            self.stats["invalid"] += 1
+            return (403 if error.startswith("Unknown station") else 400), {"success": False, "error": error}
+
+        key = event_key(event, headers)
+        if key in self.seen:
+            self.seen.move_to_end(key)
+            self.stats["duplicates"] += 1
+            return 200, {"success": True, "duplicate": True}
+        self.remember(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self.incoming.append((key, body, time.time(), future, event["station_code"]))
+        self.commit_wakeup.set()
+        try:
+            duplicate = await future
+        except Exception as e:
+            self.seen.pop(key, None)
+            logger.error(f"Could not store event {key}: {e}")
+            return 503, {"success": False, "error": "Backlog unavailable"}
+        self.stats["duplicates" if duplicate else "accepted"] += 1
+        return 200, {"success": True, "duplicate": duplicate}
+
+    def remember(self, key):
+        self.seen[key] = True
+        if len(self.seen) > self.dedup_size:
+            self.seen.popitem(last=False)
+
+    async def commit_loop(self):
+        """Write accepted events and delivery results to the backlog, one transaction per wake-up"""
+        while True:
+            await self.commit_wakeup.wait()
+            self.commit_wakeup.clear()
+            await self.commit()
+
+    async def commit(self):
+        async with self.commit_lock:
+            incoming, self.incoming = self.incoming, []
+            delivered, self.delivered = self.delivered, []
+            if not incoming and not delivered:
+                return
+            try:
+                row_ids = await self.run_db(
+                    self.backlog.commit, [(key, body, received_at) for key, body, received_at, *_ in incoming], delivered
+                )
+            except Exception as e:
+                self.delivered.extend(delivered)  # Retried with the next commit
+                for _, _, _, future, _ in incoming:
+                    future.set_exception(e)
+                return
+        for (key, body, _, future, station), row_id in zip(incoming, row_ids):
+            # A None row id is an event still in the backlog from before a restart, already queued by the replay
+            if row_id is not None and not self.replaying:
+                if len(self.queued) < MAX_QUEUED:
+                    self.enqueue(row_id, key, body, station)
+                else:
+                    self.replaying = True  # This row and the ones after it are read back in order by the replay
+            future.set_result(row_id is None)
+
+    def enqueue(self, row_id, key, body, station):
+        """Queue a row on its station's worker, so each station's events reach the upstream in the order they came in"""
+        self.queued.add(row_id)
+        self.last_queued = max(self.last_queued, row_id)
+        self.queues[hash(station) % len(self.queues)].put_nowait((row_id, key, body))
+
+    async def forward_loop(self, queue):
+        """Send one queue's events upstream in order, one worker per pooled connection"""
+        while True:
+            row_id, key, body = await queue.get()
+            # Retried in place until the upstream takes or refuses it, the station's later events wait behind it
+            while True:
+                delay = self.retry_at - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    status, data = await self.pool.post(body, {IDEMPOTENCY_HEADER: key})
+                except Exception as e:
+                    status, data = None, str(e) or type(e).__name__
+
+                if status is not None and (status < 300 or (400 <= status < 500 and status not in (408, 429))):
+                    if status >= 300:
+                        # The upstream will never take it, retrying would block the backlog
+                        self.stats["rejected_upstream"] += 1
+                        logger.warning("Upstream rejected %s with %s: %s", key, status, data[:200])
+                    else:
+                        self.stats["forwarded"] += 1
+                    self.failures = 0
+                    self.delivered.append(row_id)
+                    if len(self.delivered) >= self.batch_size:
+                        self.commit_wakeup.set()
+                    break
+
+                self.stats["upstream_errors"] += 1
+                if time.time() >= self.retry_at:
+                    # Counted once per retry window, not once per worker that was sending when it went down
+                    self.failures += 1
+                    backoff = min(self.retry_max, 0.5 * 2 ** min(self.failures, 8)) * random.uniform(0.5, 1.0)
+                    self.retry_at = time.time() + backoff
+                    logger.warning("Upstream unavailable (%s), retrying in %.1fs", status or data, backoff)
+            self.queued.discard(row_id)
+
+    async def replay_loop(self):
+        """Queue events from the backlog that are not in memory yet (left from a restart or over the memory cap), oldest first"""
+        while True:
+            # Delivered rows are removed at least once a second
+            await self.commit()
+            room = min(self.batch_size * 4, MAX_QUEUED - len(self.queued))
+            if self.replaying and room > 0:
+                # Under the commit lock, so rows committed meanwhile are either read here or queued by commit
+                async with self.commit_lock:
+                    rows = await self.run_db(self.backlog.pending, self.last_queued, room)
+                    for row_id, key, body in rows:
+                        self.enqueue(row_id, key, bytes(body), station_of(body))
+                    if len(rows) < room:
+                        self.replaying = False  # Caught up, commit queues new rows directly again
+                if self.replaying:
+                    continue  # More waiting, read on
+            await asyncio.sleep(1.0)
+
+    async def health(self):
+        """Counters and backlog size, for monitoring and the load generator"""
+        health = dict(self.stats, backlog=await self.run_db(self.backlog.count), queued=len(self.queued),
+                      upstream_up=time.time() >= self.retry_at)
+        if self.clock_server is not None:
+            health["peer_clock"] = self.clock_server.snapshot()["nodes"]
+        return health
+
+
+def run(options):
+    stations = None
+    if options.stations:
+        with open(options.stations) as f:
+            stations = json.load(f)
+    # The proxy machine is the timers' default clock reference
+    clock_server = peer_clock.PeerClockServer(options.host, options.clock_port).start() if options.clock_port else None
+
+    async def serve():
+        proxy = EventProxy(
+            options.upstream, options.host, options.port, options.path, options.backlog, stations,
+            options.connections, options.batch_size, clock_server=clock_server
+        )
+        await proxy.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await proxy.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("Proxy stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SL Timer event proxy for many timers")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--path", default=DEFAULT_PATH, help="Path the timers post events to")
+    parser.add_argument("--upstream", required=True, help="URL events are forwarded to")
+    parser.add_argument("--backlog", default=BACKLOG_PATH, help="SQLite file of events not yet forwarded")
+    parser.add_argument("--stations", help="JSON file mapping station codes to secure keys, any station is accepted without it")
+    parser.add_argument("--connections", type=int, default=16, help="Pooled upstream connections")
+    parser.add_argument("--batch-size", type=int, default=256, help="Delivered events removed from the backlog per commit")
+    parser.add_argument("--clock-port", type=int, default=peer_clock.DEFAULT_PORT,
+                        help="UDP port of the peer clock reference for the timers, 0 to turn it off")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    run(args)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import json
+import math
+import time
+
+OVERALL = "all"  # Session key of the all-time aggregate of a side, sessions are keyed by their id
+RESOLUTION = 0.01  # Match times are bucketed to hundredths, like they are displayed
+RECENT_SIZE = 10  # Last match times kept for the trend
+
+
+def create_table(cursor):
+    """Create the summary table holding one aggregate per side and session, plus each side's overall one"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS match_stats (
+        side INTEGER NOT NULL,
+        session TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        total REAL NOT NULL,
+        best REAL NOT NULL,
+        worst REAL NOT NULL,
+        histogram TEXT NOT NULL,
+        recent TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (side, session)
+    )
+    ''')
+
+
+def update(cursor, side, period, match_time):
+    """Fold one match time into the aggregate of a side and period (OVERALL or a session id)"""
+    cursor.execute('SELECT count, total, best, worst, histogram, recent FROM match_stats WHERE side = ? AND session = ?',
+                   (side, period))
+    row = cursor.fetchone()
+    if row:
+        count, total, best, worst, histogram, recent = row
+        histogram = json.loads(histogram)
+        recent = json.loads(recent)
+    else:
+        count, total, best, worst, histogram, recent = 0, 0.0, match_time, match_time, {}, []
+
+    bucket = str(round(match_time / RESOLUTION))
+    histogram[bucket] = histogram.get(bucket, 0) + 1
+    recent = (recent + [match_time])[-RECENT_SIZE:]
+
+    cursor.execute('''
+    INSERT OR REPLACE INTO match_stats (side, session, count, total, best, worst, histogram, recent, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (side, period, count + 1, total + match_time, min(best, match_time), max(worst, match_time),
+          json.dumps(histogram), json.dumps(recent), time.time()))
+
+
+def record(cursor, side, session_id, match_time):
+    """Update the overall and, for a match filed under one, the session aggregate of a newly saved match"""
+    update(cursor, side, OVERALL, match_time)
+    if session_id is not None:
+        update(cursor, side, str(session_id), match_time)
+
+
+def refresh_session(cursor, side, session_id):
+    """Recompute a side's session aggregate from its matches, after a match was moved in or out of the session"""
+    if session_id is None:
+        return
+    cursor.execute('DELETE FROM match_stats WHERE side = ? AND session = ?', (side, str(session_id)))
+    cursor.execute('SELECT match_time FROM matches WHERE side = ? AND session_id = ? AND completed = 1 ORDER BY id',
+                   (side, session_id))
+    for (match_time,) in cursor.fetchall():
+        update(cursor, side, str(session_id), match_time)
+
+
+def rebuild(cursor):
+    """Recompute every aggregate from the stored matches, only needed once for databases that predate it"""
+    cursor.execute('DELETE FROM match_stats')
+    cursor.execute('SELECT side, session_id, match_time FROM matches WHERE completed = 1 ORDER BY id')
+    rows = cursor.fetchall()
+    for side, session_id, match_time in rows:
+        record(cursor, side, session_id, match_time)
+    return len(rows)
+
+
+def migrate(cursor):
+    """Replace the per-day aggregates of older versions by per-session ones, keeping the overall ones
+
+    Session matches are never pruned, so their aggregates can be rebuilt exactly; the overall
+    ones also cover pruned matches and stay as they are.
+    """
+    cursor.execute("DELETE FROM match_stats WHERE session LIKE '%-%'")
+    if cursor.rowcount <= 0:
+        return False
+    cursor.execute('SELECT DISTINCT side, session_id FROM matches WHERE session_id IS NOT NULL')
+    for side, session_id in cursor.fetchall():
+        refresh_session(cursor, side, session_id)
+    return True
+
+
+def percentile(histogram, count, fraction):
+    """Match time at the given fraction of a bucket histogram (nearest rank)"""
+    rank = max(1, math.ceil(fraction * count))
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return round(int(bucket) * RESOLUTION, 2)
+    return None
+
+
+def trend(recent):
+    """Mean of the newer half of the recent times minus the older half, negative means getting faster"""
+    if len(recent) < 2:
+        return None
+    half = len(recent) // 2
+    older = recent[:half]
+    newer = recent[-half:]
+    return round(sum(newer) / len(newer) - sum(older) / len(older), 3)
+
+
+def summarize(row):
+    """Turn a stored aggregate into the numbers served by /api/stats"""
+    count, total, best, worst, histogram, recent = row
+    histogram = json.loads(histogram)
+    recent = json.loads(recent)
+    return {
+        "count": count,
+        "best": round(best, 3),
+        "worst": round(worst, 3),
+        "mean": round(total / count, 3),
+        "median": percentile(histogram, count, 0.5),
+        "p90": percentile(histogram, count, 0.9),
+        "trend": trend(recent),
+        "last": round(recent[-1], 3) if recent else None
+    }
+
+
+def load(cursor, sessions, default=None):
+    """Each side's overall numbers and those of one session: sessions maps a side to its session id, default covers the rest
+
+    Only the requested rows are read (primary key lookups), however many sessions and matches there are.
+    """
+    wanted = {str(session_id) for session_id in list(sessions.values()) + [default] if session_id is not None}
+    keys = [OVERALL] + sorted(wanted)
+    cursor.execute('SELECT side, session, count, total, best, worst, histogram, recent FROM match_stats '
+                   f'WHERE session IN ({", ".join("?" * len(keys))}) ORDER BY side', keys)
+    stats = {}
+    for side, period, *row in cursor.fetchall():
+        entry = stats.setdefault(str(side), {"overall": None, "session": None})
+        if period == OVERALL:
+            entry["overall"] = summarize(row)
+        elif period == str(sessions.get(str(side), default)):
+            entry["session"] = {"session_id": int(period), **summarize(row)}
+    return stats
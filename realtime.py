@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import gc
+import os
+import time
+import ctypes
+import ctypes.util
+import logging
+import resource
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# mlockall flags from <sys/mman.h>
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+MAX_RACE_SECONDS = 300.0  # A landing later than this is not coming, the collector is turned back on
+
+
+def pin_to_cpu(cpu):
+    """Restrict the calling thread to one CPU core"""
+    os.sched_setaffinity(0, {cpu})
+    return cpu
+
+
+def raise_priority(priority):
+    """SCHED_FIFO for the calling thread, or the lowest nice value we are allowed, returns what was set"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        return f"SCHED_FIFO {priority}"
+    except (PermissionError, AttributeError, OSError) as e:
+        logger.warning(f"SCHED_FIFO not permitted ({e}), trying a higher nice priority")
+    for nice in (-20, -10, -5):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+            return f"nice {nice}"
+        except (PermissionError, OSError):
+            continue
+    return None
+
+
+def lock_memory():
+    """Keep the process's pages in RAM, future allocations too if the memlock limit allows it"""
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+    # With a limited memlock budget MCL_FUTURE would make later allocations fail
+    flags = MCL_CURRENT | MCL_FUTURE if soft == resource.RLIM_INFINITY else MCL_CURRENT
+    if libc.mlockall(flags) != 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    return "current and future" if flags & MCL_FUTURE else "current"
+
+
+def freeze_heap():
+    """Move everything allocated so far out of the collector's reach, returns the frozen object count"""
+    # Everything loaded at startup is never collected, so collections stay short
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def apply(realtime_config):
+    """Apply the configured real-time settings to the calling (sensor loop) thread"""
+    applied = {}
+    if realtime_config.get("cpu") is not None:
+        try:
+            applied["cpu"] = pin_to_cpu(realtime_config["cpu"])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not pin the sensor loop to CPU {realtime_config['cpu']}: {e}")
+    applied["priority"] = raise_priority(realtime_config.get("priority", 50))
+    if realtime_config.get("lock_memory", True):
+        try:
+            applied["memory_locked"] = lock_memory()
+        except OSError as e:
+            logger.warning(f"Could not lock memory: {e}")
+    if realtime_config.get("gc_freeze", True):
+        applied["gc_frozen"] = freeze_heap()
+    logger.info(f"Real-time mode: {applied}")
+    return applied
+
+
+class RaceGC:
+    """Keeps the garbage collector from pausing the sensor loop while a race is in flight"""
+
+    def __init__(self, enabled=True, max_seconds=MAX_RACE_SECONDS):
+        self.enabled = enabled
+        self.max_seconds = max_seconds
+        self.in_flight = False
+        self.deadline = None
+
+    def race_started(self):
+        if self.enabled and not self.in_flight:
+            gc.disable()
+            self.in_flight = True
+            self.deadline = time.monotonic() + self.max_seconds
+
+    def check(self):
+        """Called by the sensor loop during a race, turns the collector back on when the landing is overdue"""
+        if self.in_flight and time.monotonic() >= self.deadline:
+            logger.warning(f"No landing {self.max_seconds:g}s after the take-off, garbage collection back on")
+            self.race_finished()
+
+    def race_finished(self):
+        if self.in_flight:
+            gc.enable()
+            self.in_flight = False
+
+
+def distribution(samples):
+    """Percentiles of a list of durations, in milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        "p50": round(ordered[count // 2] * 1000, 3),
+        "p90": round(ordered[int(count * 0.9)] * 1000, 3),
+        "p99": round(ordered[min(count - 1, int(count * 0.99))] * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3)
+    }
+
+
+class JitterMeter:
+    """Rolling loop period and wake-up latency of the sensor loop"""
+
+    def __init__(self, window=6000):
+        self.periods = deque(maxlen=window)
+        self.wake_latencies = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, period, wake_latency):
+        self.periods.append(period)
+        self.wake_latencies.append(wake_latency)
+        self.count += 1
+
+    def snapshot(self):
+        """Distributions over the window, for /api/realtime"""
+        return {
+            "samples": len(self.periods),
+            "total_iterations": self.count,
+            "loop_period_ms": distribution(list(self.periods)),
+            "wake_latency_ms": distribution(list(self.wake_latencies))
+        }
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Modules that must stay out of the sensor-critical import path of main.py
+DEFERRED_MODULES = ("flask", "requests", "ntplib", "web_server", "delivery", "engine_ipc")
+
+PROBE = (
+    "import sys, time, importlib.util\n"
+    # Off the Pi the dashboard load test's simulated GPIO stands in, registered before the clock starts
+    "if importlib.util.find_spec('RPi') is None:\n"
+    "    from dashboard_loadtest import install_simulated_gpio\n"
+    "    install_simulated_gpio()\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "print('IMPORT_SECONDS', time.perf_counter() - started)\n"
+    "print('LOADED', ' '.join(sorted(m for m in {modules!r} if m in sys.modules)))\n"
+)
+
+
+def measure(directory):
+    """Import main.py in a fresh interpreter, returns the import time, the deferred modules it loaded and -X importtime lines"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(modules=DEFERRED_MODULES)],
+        cwd=directory, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    seconds = float(re.search(r"IMPORT_SECONDS (\S+)", result.stdout).group(1))
+    loaded = re.search(r"LOADED ?(.*)", result.stdout).group(1).split()
+    entries = parse_importtime(result.stderr)
+    # The simulated GPIO is imported before the clock starts, its imports are listed first
+    stub = [index for index, (_, module) in enumerate(entries) if module == "dashboard_loadtest"]
+    if stub:
+        entries = entries[stub[0] + 1:]
+    return seconds, loaded, entries
+
+
+def parse_importtime(output):
+    """(cumulative microseconds, module) of each import in -X importtime output"""
+    entries = []
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)", line)
+        if match:
+            entries.append((int(match.group(1)), match.group(2)))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long main.py takes to import and check heavy stacks stay deferred")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--budget", type=float, default=None, help="Fail if the median import time exceeds this many seconds")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    options = parser.parse_args()
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    loaded = []
+    entries = []
+    for _ in range(options.runs):
+        seconds, loaded, entries = measure(directory)
+        timings.append(seconds)
+    timings.sort()
+    median = timings[len(timings) // 2]
+
+    print(f"import main: median {median * 1000:.1f} ms, min {timings[0] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms ({options.runs} runs)")
+    print("Slowest imports (last run, cumulative):")
+    for microseconds, module in sorted(entries, reverse=True)[:options.top]:
+        print(f"  {microseconds / 1000:8.1f} ms  {module}")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: deferred modules loaded at import: {', '.join(loaded)}")
+        failed = True
+    if options.budget is not None and median > options.budget:
+        print(f"FAIL: median import time over the {options.budget:.3f} s budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import os
+import sys
+import mmap
+import json
+import math
+import time
+import zlib
+import struct
+import argparse
+import threading
+
+# Shared memory where there is one, readers poll it without touching the disk
+BOARD_PATH = "/dev/shm/sltimer-state" if os.path.isdir("/dev/shm") else os.path.join("/tmp", "sltimer-state")
+
+# File header: magic, version, state size, then the sequence counter on its own 8 bytes
+HEADER = struct.Struct("<4sHH")
+MAGIC = b"SLSB"
+VERSION = 1
+SEQ = struct.Struct("<I")
+SEQ_OFFSET = 8
+STATE_OFFSET = 16
+
+# State: written time (ns), writer pid, side, start level, finish level, phase, current run's start,
+# last run's start, finish and match time, runs finished, last HTTP status, last delivery,
+# clock source, clock offset, clock error, clock state
+STATE = struct.Struct("<qI4BddddIHBBddB3x")
+CRC = struct.Struct("<I")
+CRC_OFFSET = STATE_OFFSET + STATE.size
+BOARD_SIZE = CRC_OFFSET + CRC.size
+
+FIELDS = ("updated_ns", "pid", "side", "start_level", "finish_level", "phase", "run_start", "last_start",
+          "last_finish", "last_match_time", "results", "last_status", "last_delivery", "clock_source",
+          "clock_offset", "clock_error", "clock_state")
+
+# Phases
+IDLE = 0
+HOLDING = 1  # Start sensor covered, counting down the start delay
+ARMED = 2  # Start delay reached, the take-off follows when the sensor is released
+FLYING = 3  # Take-off sent, waiting for the landing
+
+# Delivery of the last result
+PENDING = 0
+DELIVERED = 1
+FAILED = 2
+
+# Where event times come from
+CLOCK_LOCAL = 0
+CLOCK_REFERENCE = 1  # This timer serves the peer clock
+CLOCK_FOLLOWER = 2  # Event times are the reference's, clock_state says how good the estimate is
+
+PHASE_NAMES = ("idle", "holding", "armed", "flying")
+DELIVERY_NAMES = ("pending", "delivered", "failed")
+CLOCK_NAMES = ("local", "reference", "follower")
+CLOCK_STATES = ("unsynced", "synced", "holdover")
+
+
+def local_clock():
+    return CLOCK_LOCAL, 0.0, math.nan, 0
+
+
+class StateBoard:
+    """Live timer state in a fixed-layout memory-mapped file, for overlays and scoreboards on this machine
+
+    Writes follow a seqlock: the counter is odd while the state is rewritten and even once it
+    is complete. A reader copies the state between two reads of the counter and keeps the copy
+    when both are the same even number. Python has no memory barriers, so the state also carries
+    a CRC32, which catches a copy torn by stores reordered on a weakly ordered CPU.
+    """
+
+    def __init__(self, path=BOARD_PATH, side=1, heartbeat=0.5, clock_report=local_clock):
+        self.path = path
+        self.heartbeat = heartbeat
+        self.clock_report = clock_report  # () -> (clock source, offset, error, state)
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != BOARD_SIZE:
+                os.ftruncate(fd, BOARD_SIZE)
+            self.map = mmap.mmap(fd, BOARD_SIZE)
+        finally:
+            os.close(fd)
+
+        # Same file across restarts, so readers that have it mapped keep working; the counter carries on
+        magic, version, size = HEADER.unpack_from(self.map, 0)
+        self.seq = SEQ.unpack_from(self.map, SEQ_OFFSET)[0] & ~1 if (magic, version, size) == (MAGIC, VERSION, STATE.size) else 0
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, STATE.size)
+
+        self.side = side
+        self.start_level = 1
+        self.finish_level = 1
+        self.phase = IDLE
+        self.run_start = 0.0
+        self.last_start = 0.0
+        self.last_finish = 0.0
+        self.last_match_time = 0.0
+        self.results = 0
+        self.last_status = 0
+        self.last_delivery = PENDING
+        self.next_beat = 0.0
+        self.publish()
+
+    def publish(self):
+        """Write the whole state, between an odd and an even sequence number"""
+        with self.lock:
+            source, offset, error, clock_state = self.clock_report()
+            data = STATE.pack(
+                time.time_ns(), self.pid, self.side, self.start_level, self.finish_level, self.phase,
+                self.run_start, self.last_start, self.last_finish, self.last_match_time, self.results,
+                self.last_status, self.last_delivery, source, offset, math.nan if error is None else error, clock_state
+            )
+            seq = (self.seq + 1) & 0xFFFFFFFF
+            SEQ.pack_into(self.map, SEQ_OFFSET, seq)
+            self.map[STATE_OFFSET:CRC_OFFSET] = data
+            CRC.pack_into(self.map, CRC_OFFSET, zlib.crc32(data))
+            self.seq = (seq + 1) & 0xFFFFFFFF
+            SEQ.pack_into(self.map, SEQ_OFFSET, self.seq)
+            self.next_beat = time.monotonic() + self.heartbeat
+
+    def update(self, side, start_level, finish_level, phase):
+        """Called by the sensor loop every iteration, writes only on a change or when the heartbeat is due"""
+        if (side != self.side or start_level != self.start_level or finish_level != self.finish_level
+                or phase != self.phase):
+            self.side = side
+            self.start_level = start_level
+            self.finish_level = finish_level
+            self.phase = phase
+            if phase != FLYING:
+                self.run_start = 0.0
+            self.publish()
+        elif time.monotonic() >= self.next_beat:
+            self.publish()
+
+    def take_off(self, event_time):
+        """A run started, published before its request goes out"""
+        self.phase = FLYING
+        self.run_start = event_time
+        self.publish()
+
+    def landing(self, start_time, finish_time):
+        """A run finished, published before its request goes out"""
+        self.phase = IDLE
+        self.run_start = 0.0
+        self.last_start = start_time
+        self.last_finish = finish_time
+        self.last_match_time = finish_time - start_time
+        self.results += 1
+        self.last_status = 0
+        self.last_delivery = PENDING
+        self.publish()
+
+    def delivered(self, success, status):
+        """How the landing of the last run was delivered"""
+        self.last_status = status or 0
+        self.last_delivery = DELIVERED if success else FAILED
+        self.publish()
+
+    def close(self):
+        self.map.close()
+
+
+class StateBoardReader:
+    """Read side of the state board, cheap enough to poll at kHz rates"""
+
+    def __init__(self, path=BOARD_PATH):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self.map = mmap.mmap(fd, BOARD_SIZE, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        magic, version, size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or size != STATE.size:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} state board")
+
+    def sequence(self):
+        """Current sequence number, changes with every write"""
+        return SEQ.unpack_from(self.map, SEQ_OFFSET)[0]
+
+    def read_raw(self, retries=1000):
+        """(sequence, state tuple) of a consistent copy, None if the writer kept the state busy for all retries"""
+        board = self.map
+        for _ in range(retries):
+            seq = SEQ.unpack_from(board, SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            data = board[STATE_OFFSET:CRC_OFFSET]
+            crc = CRC.unpack_from(board, CRC_OFFSET)[0]
+            if SEQ.unpack_from(board, SEQ_OFFSET)[0] == seq and zlib.crc32(data) == crc:
+                return seq, STATE.unpack(data)
+        return None
+
+    def read(self, retries=1000):
+        """Consistent copy of the state as a dict, None if the writer kept the state busy for all retries"""
+        raw = self.read_raw(retries)
+        if raw is None:
+            return None
+        seq, values = raw
+        state = dict(zip(FIELDS, values))
+        state["seq"] = seq
+        state["age"] = time.time() - state["updated_ns"] / 1e9
+        state["phase"] = PHASE_NAMES[state["phase"]]
+        state["last_delivery"] = DELIVERY_NAMES[state["last_delivery"]]
+        state["clock_source"] = CLOCK_NAMES[state["clock_source"]]
+        state["clock_state"] = CLOCK_STATES[state["clock_state"]]
+        if math.isnan(state["clock_error"]):
+            state["clock_error"] = None
+        return state
+
+    def close(self):
+        self.map.close()
+
+
+def benchmark(reader, seconds):
+    """Consistent reads per second, with the timer writing as usual"""
+    reads = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        reader.read_raw()
+        reads += 1
+    return reads / seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow the timer's live state board")
+    parser.add_argument("path", nargs="?", default=BOARD_PATH)
+    parser.add_argument("--rate", type=float, default=1000.0, help="Polls per second")
+    parser.add_argument("--benchmark", type=float, metavar="SECONDS", help="Measure how many reads a second one reader gets")
+    args = parser.parse_args()
+
+    reader = StateBoardReader(args.path)
+    if args.benchmark:
+        print(f"{benchmark(reader, args.benchmark):.0f} reads/s")
+        sys.exit(0)
+    # One JSON line per change, heartbeats only move the time and the clock estimate
+    last_seq = None
+    last_values = None
+    try:
+        while True:
+            seq = reader.sequence()
+            if seq != last_seq:
+                raw = reader.read_raw()
+                if raw is not None:
+                    last_seq, values = raw
+                    values = values[1:14] + values[16:]
+                    if values != last_values:
+                        print(json.dumps(reader.read()), flush=True)
+                        last_values = values
+            time.sleep(1.0 / args.rate)
+    except KeyboardInterrupt:
+        pass
@@ -185,6 +185,11 @@ function initPage() {
         clearButton.addEventListener('click', clearLogs);
     }
     
+    const searchButton = document.getElementById('log-search-button');
+    if (searchButton) {
+        searchButton.addEventListener('click', searchStoredLogs);
+    }
+    
     // Setup AJAX for getting log updates
     setupLogUpdates();
 }
@@ -279,25 +284,65 @@ function setupTabs() {
 }
 
 function setupMatchDetailToggles() {
-    const toggleButtons = document.querySelectorAll('.toggle-details');
+    // One listener on the container also covers cards added by the live stream
+    const matchesContainer = document.getElementById('matches-container');
+    if (!matchesContainer) {
+        return;
+    }
     
-    toggleButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const matchCard = this.closest('.match-card');
-            const detailsSection = matchCard.querySelector('.match-details');
-            
-            // Toggle visibility
-            if (detailsSection.classList.contains('visible')) {
-                detailsSection.classList.remove('visible');
-                this.textContent = 'Details';
-            } else {
-                detailsSection.classList.add('visible');
-                this.textContent = 'Hide Details';
-            }
-        });
+    matchesContainer.addEventListener('click', function(event) {
+        const button = event.target.closest('.toggle-details');
+        if (!button) {
+            return;
+        }
+        const matchCard = button.closest('.match-card');
+        const detailsSection = matchCard.querySelector('.match-details');
+        
+        // Toggle visibility
+        if (detailsSection.classList.contains('visible')) {
+            detailsSection.classList.remove('visible');
+            button.textContent = 'Details';
+        } else {
+            detailsSection.classList.add('visible');
+            button.textContent = 'Hide Details';
+        }
     });
 }
 
+function lastMatchId() {
+    const matchesContainer = document.getElementById('matches-container');
+    return matchesContainer ? matchesContainer.dataset.lastMatchId || '' : '';
+}
+
+function addMatchCard(data) {
+    // A match saved since the page loaded: insert its card on top instead of reloading the list
+    const matchesContainer = document.getElementById('matches-container');
+    if (!matchesContainer || matchesContainer.querySelector(`[data-match-id="${data.match.id}"]`)) {
+        return;
+    }
+    const placeholder = matchesContainer.querySelector('.no-matches');
+    if (placeholder) {
+        placeholder.remove();
+    }
+    matchesContainer.insertAdjacentHTML('afterbegin', data.html);
+    matchesContainer.dataset.lastMatchId = data.match.id;
+    
+    // The list shows the 40 most recent matches
+    const cards = matchesContainer.querySelectorAll('.match-card');
+    for (let i = 40; i < cards.length; i++) {
+        cards[i].remove();
+    }
+}
+
+function replaceMatches(data) {
+    // The matches changed without a new one (cleared or reassigned): swap in the current list
+    const matchesContainer = document.getElementById('matches-container');
+    if (matchesContainer) {
+        matchesContainer.innerHTML = data.html;
+        matchesContainer.dataset.lastMatchId = data.last_id;
+    }
+}
+
 function setupAutoRefresh() {
     // Refresh system info every 5 seconds
     refreshTimer = setInterval(refreshSystemInfo, 5000);
@@ -324,11 +369,103 @@ function updateSystemInfo(data) {
         document.getElementById('last-ntp-sync-time').textContent = data.last_ntp_sync_time;
         document.getElementById('last-ntp-sync-server').textContent = data.last_ntp_sync_server;
     }
+    
+    // Update upstream health if available
+    if (data.health) {
+        updateHealth(data.health);
+    }
+    
+    if (data.watchdog) {
+        updateWatchdog(data.watchdog);
+    }
+    
+    if (data.peer_clock) {
+        updatePeerClock(data.peer_clock);
+    }
+}
+
+function updatePeerClock(clock) {
+    // Follower: own offset and error bound. Reference: the last report of each node
+    const formatOffset = entry => `${entry.offset_ms >= 0 ? '+' : ''}${entry.offset_ms.toFixed(3)} ms \u00b1${entry.error_ms.toFixed(3)} ms`;
+    const state = document.getElementById('peer-clock-state');
+    if (state) {
+        state.textContent = clock.state;
+        document.getElementById('peer-clock-offset').textContent =
+            clock.offset_ms === undefined ? '-' : formatOffset(clock);
+    }
+    const nodes = document.getElementById('peer-clock-nodes');
+    if (nodes && clock.nodes) {
+        nodes.textContent = clock.nodes.length
+            ? clock.nodes.map(node => `${node.node}: ${formatOffset(node)}${node.agreed ? '' : ` (${node.state === 'synced' ? 'over 1 ms' : node.state})`}`).join(', ')
+            : 'None yet';
+    }
+}
+
+function updateWatchdog(watchdog) {
+    // Stall alarm banner and the sensor loop line of the system status
+    const banner = document.getElementById('stall-banner');
+    if (banner) {
+        if (watchdog.stalled) {
+            document.getElementById('stall-banner-text').textContent =
+                `The sensor loop has stalled for ${watchdog.stalled_for.toFixed(1)}s, sensors are not being watched.`;
+            banner.classList.remove('hidden');
+        } else {
+            banner.classList.add('hidden');
+        }
+    }
+    
+    const status = document.getElementById('sensor-loop-status');
+    if (status) {
+        status.textContent = watchdog.stalled ? 'STALLED' : 'Running';
+        document.getElementById('sensor-loop-stalls').textContent =
+            `${watchdog.stalls} (longest ${watchdog.longest_stall}s)`;
+    }
+}
+
+function updateHealth(health) {
+    const tableBody = document.getElementById('health-table-body');
+    if (!tableBody) {
+        return;
+    }
+    
+    const formatValue = value => (value === null || value === undefined) ? '-' : value;
+    
+    // Rebuild the rows, the list is short
+    tableBody.innerHTML = '';
+    health.endpoints.forEach(endpoint => {
+        const row = document.createElement('tr');
+        const cells = [
+            endpoint.name,
+            `${endpoint.host}:${endpoint.port}`,
+            null,
+            `${formatValue(endpoint.availability)}%`,
+            `${formatValue(endpoint.latency_avg_ms)} / ${formatValue(endpoint.latency_p95_ms)} ms`,
+            endpoint.last_error || ''
+        ];
+        cells.forEach(text => {
+            const cell = document.createElement('td');
+            if (text === null) {
+                const state = document.createElement('span');
+                state.className = `health-state health-${endpoint.state}`;
+                state.textContent = endpoint.state;
+                cell.appendChild(state);
+            } else {
+                cell.textContent = text;
+            }
+            row.appendChild(cell);
+        });
+        tableBody.appendChild(row);
+    });
+    
+    const journaled = document.getElementById('journaled-events');
+    if (journaled) {
+        journaled.textContent = health.journaled_events;
+    }
 }
 
 function setupLogUpdates() {
-    // Use server-sent events for log updates
-    const evtSource = new EventSource('/api/log_stream');
+    // Use server-sent events for log updates and new matches, catching up on matches missed while disconnected
+    const evtSource = new EventSource(`/api/log_stream?since_id=${lastMatchId()}`);
     logSocket = evtSource;
     
     evtSource.onopen = function() {
@@ -353,6 +490,14 @@ function setupLogUpdates() {
         }
     };
     
+    evtSource.addEventListener('match', function(event) {
+        addMatchCard(JSON.parse(event.data));
+    });
+    
+    evtSource.addEventListener('matches', function(event) {
+        replaceMatches(JSON.parse(event.data));
+    });
+    
     evtSource.onerror = function() {
         // Show connection loss banner
         connectionLost = true;
@@ -379,6 +524,34 @@ function toggleLogPause() {
     }
 }
 
+function searchStoredLogs() {
+    // Search the logs kept on disk, live logs are paused while the results are shown
+    const params = new URLSearchParams();
+    const start = document.getElementById('log-search-start').value;
+    const end = document.getElementById('log-search-end').value;
+    const text = document.getElementById('log-search-text').value.trim();
+    if (start) params.append('start', new Date(start).getTime() / 1000);
+    if (end) params.append('end', new Date(end).getTime() / 1000);
+    if (text) params.append('q', text);
+    
+    fetch('/api/logs?' + params.toString())
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            alert(`Log search failed: ${data.error}`);
+            return;
+        }
+        if (!logPaused) {
+            toggleLogPause();
+        }
+        clearLogs();
+        data.forEach(entry => appendLogEntry(entry));
+    })
+    .catch(error => {
+        console.error('Error searching logs:', error);
+    });
+}
+
 function clearLogs() {
     const logContainer = document.getElementById('log-container');
     if (logContainer) {
@@ -594,7 +767,7 @@ function saveDirectModeSettings() {
             const resultElement = document.getElementById('ntp-sync-result');
             resultElement.style.display = 'block';
             resultElement.className = 'success-message';
-            resultElement.innerHTML = `Direct mode setting saved as ${isDirectMode ? 'DIRECT' : 'PROXY'}. Changes will be applied after reboot.`;
+            resultElement.innerHTML = `Direct mode setting saved as ${isDirectMode ? 'DIRECT' : 'PROXY'}. It takes effect between races, no restart needed.`;
             
             // Auto-hide message after 5 seconds
             setTimeout(() => {
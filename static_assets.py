@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+
+from flask import Response, request, abort
+
+try:
+    import brotli  # Optional, gzip only without it
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+URL_PREFIX = "/assets"
+COMPRESSIBLE = (".css", ".js", ".svg", ".html", ".json", ".txt")
+IMMUTABLE = "public, max-age=31536000, immutable"
+DYNAMIC_TYPES = ("text/html", "application/json")
+DYNAMIC_MIN_BYTES = 1024  # Smaller responses are not worth the CPU
+
+
+class Asset:
+    """One static file: its content hash and the encodings it can be sent in"""
+
+    def __init__(self, path, name):
+        with open(path, "rb") as f:
+            data = f.read()
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        self.url = f"{URL_PREFIX}/{stem}.{self.digest}{ext}"
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.bodies = {"identity": data}
+        if ext in COMPRESSIBLE:
+            # Compressed once here, each request only picks a body
+            self.add("gzip", gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                self.add("br", brotli.compress(data, quality=11))
+
+    def add(self, encoding, body):
+        if len(body) < len(self.bodies["identity"]):
+            self.bodies[encoding] = body
+
+    def choose(self, accept_encoding):
+        """Smallest body the client accepts"""
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and encoding in accept_encoding:
+                return encoding, self.bodies[encoding]
+        return "identity", self.bodies["identity"]
+
+
+class AssetPipeline:
+    """Content-hashed URLs for the static files, served pre-compressed with immutable caching"""
+
+    def __init__(self, app, directory=STATIC_DIR):
+        self.directory = directory
+        self.assets = {}  # name relative to the static directory -> Asset
+        self.by_url = {}
+        self.lock = threading.Lock()
+        app.add_url_rule(f"{URL_PREFIX}/<path:filename>", "assets", self.serve)
+        app.jinja_env.globals["asset_url"] = self.url
+        app.after_request(compress_response)
+
+    def load(self, name):
+        """Asset for a file, read and compressed on first use"""
+        asset = self.assets.get(name)
+        if asset is None:
+            with self.lock:
+                asset = self.assets.get(name)
+                if asset is None:
+                    path = os.path.join(self.directory, name)
+                    if not os.path.isfile(path) or not os.path.abspath(path).startswith(os.path.abspath(self.directory)):
+                        return None
+                    asset = Asset(path, name)
+                    self.assets[name] = asset
+                    self.by_url[asset.url] = asset
+        return asset
+
+    def url(self, name):
+        """Hashed URL of a static file, for templates"""
+        asset = self.load(name)
+        return asset.url if asset else f"/static/{name}"
+
+    def serve(self, filename):
+        asset = self.by_url.get(f"{URL_PREFIX}/{filename}")
+        if asset is None:
+            # An old hash, e.g. from a page cached before an update: send the current file, briefly cacheable
+            stem, _, ext = filename.rpartition(".")
+            original = f"{stem.rpartition('.')[0]}.{ext}"
+            asset = self.load(original)
+            if asset is None:
+                abort(404)
+            cache_control = "public, max-age=60"
+        else:
+            cache_control = IMMUTABLE
+
+        encoding, body = asset.choose(request.headers.get("Accept-Encoding", ""))
+        response = Response(body, mimetype=asset.mimetype)
+        response.headers["Cache-Control"] = cache_control
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.set_etag(f"{asset.digest}-{encoding}")
+        return response.make_conditional(request)
+
+
+def compress_response(response):
+    """Gzip rendered pages and JSON for clients that accept it, streams (the log stream) are left alone"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in DYNAMIC_TYPES
+            or "gzip" not in request.headers.get("Accept-Encoding", "")):
+        return response
+    data = response.get_data()
+    if len(data) < DYNAMIC_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, 6))
+    response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # Same entity, different bytes
+        response.set_etag(etag, weak=True)
+    return response
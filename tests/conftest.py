@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The timer's modules import RPi.GPIO, the dashboard load test's simulated GPIO stands in off the Pi
+from dashboard_loadtest import install_simulated_gpio
+
+install_simulated_gpio()
@@ -0,0 +1,73 @@
+import time
+
+import delivery
+import health_monitor
+from test_udp_transport import Upstream
+
+
+def open_breaker(reset_timeout):
+    breaker = health_monitor.CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    assert breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_at_threshold():
+    breaker = health_monitor.CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert not breaker.allow()
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = open_breaker(0.05)
+    time.sleep(0.06)
+    assert [breaker.allow() for _ in range(3)] == [True, False, False]
+    assert breaker.state == health_monitor.STATE_HALF_OPEN
+    assert breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_opens_again():
+    breaker = open_breaker(0.05)
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.record_failure()
+    assert not breaker.allow()
+
+
+def test_unanswered_trial_expires():
+    breaker = open_breaker(0.05)
+    time.sleep(0.06)
+    assert breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_journal_replayed_at_startup_and_periodically(tmp_path):
+    upstream = Upstream()
+    try:
+        journal = delivery.EventJournal(str(tmp_path / "journal.db"))
+        journal.append("key-1", 1, "take_off", time.time(), "proxy")
+        events = delivery.Delivery(
+            [delivery.Upstream("proxy", "proxy", f"http://127.0.0.1:{upstream.port}/proxy")],
+            "station_1", "key", journal=journal
+        )
+        monitor = health_monitor.HealthMonitor(events, health_config={"interval": 0.05, "journal_retry": 0.2})
+        monitor.start()
+        try:
+            deadline = time.time() + 5
+            while journal.count() and time.time() < deadline:
+                time.sleep(0.05)
+            assert journal.count() == 0
+            # Journaled later, with no circuit ever opening
+            journal.append("key-2", 1, "landing", time.time(), "proxy")
+            deadline = time.time() + 5
+            while journal.count() and time.time() < deadline:
+                time.sleep(0.05)
+            assert journal.count() == 0
+        finally:
+            monitor.stop()
+        assert [key for key, _ in upstream.events] == ["key-1", "key-2"]
+    finally:
+        upstream.close()
@@ -0,0 +1,87 @@
+import time
+import sqlite3
+
+import pytest
+
+import leaderboard
+import race_stats
+import web_server
+from event_record import EventRecord
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_server, "DB_PATH", str(tmp_path / "matches.db"))
+    web_server.initialize_database()
+    web_server.match_cache.invalidate()
+    conn = sqlite3.connect(web_server.DB_PATH)
+    yield conn
+    conn.close()
+
+
+def save(side, match_time, status=200, response="ok"):
+    now = time.time()
+    start = EventRecord(side, "take_off", now, "proxy", True, status, 0.01, response)
+    finish = EventRecord(side, "landing", now + match_time, "proxy", True, status, 0.01, response)
+    assert web_server.save_match(start, finish)
+
+
+def test_saved_match_round_trip(db):
+    save(1, 12.5, response="x" * 2000)
+    match = web_server.get_matches()[0]
+    assert match["match_time"] == "12.50"
+    assert match["start_status"] == 200
+    assert "more characters" in match["start_response"]
+
+
+def test_stats_per_session(db):
+    cursor = db.cursor()
+    session = leaderboard.create_session(cursor, "Qualifying")
+    pilot = leaderboard.create_pilot(cursor, "Pilot")
+    db.commit()
+    save(1, 11.0)
+    web_server.run_query(leaderboard.set_assignment, 1, session, None, pilot, commit=True)
+    save(1, 10.0)
+    stats = web_server.get_stats()["1"]
+    assert stats["overall"]["count"] == 2
+    assert stats["session"]["session_id"] == session
+    assert stats["session"]["count"] == 1 and stats["session"]["best"] == 10.0
+
+    # Moving the first match into the session recomputes its numbers
+    first = db.execute("SELECT id FROM matches WHERE session_id IS NULL").fetchone()[0]
+    assert web_server.run_query(web_server.file_match, first, session, None, pilot, commit=True)
+    assert web_server.get_stats(session)["1"]["session"]["count"] == 2
+
+
+def test_legacy_day_stats_migrate(db):
+    cursor = db.cursor()
+    save(1, 10.0)
+    cursor.execute("INSERT INTO match_stats VALUES (1, '2025-06-14', 1, 10.0, 10.0, 10.0, '{}', '[]', 0)")
+    assert race_stats.migrate(cursor)
+    assert [row[0] for row in cursor.execute("SELECT session FROM match_stats")] == [race_stats.OVERALL]
+
+
+def test_runs_without_pilot_stay_prunable(db):
+    cursor = db.cursor()
+    session = leaderboard.create_session(cursor, "Final")
+    pilot = leaderboard.create_pilot(cursor, "Pilot")
+    leaderboard.set_assignment(cursor, 1, session, None, pilot)
+    db.commit()
+    for index in range(45):
+        save(1, 10.0 + index / 10)
+    total, filed = db.execute("SELECT COUNT(*), COUNT(session_id) FROM matches").fetchone()
+    assert (total, filed) == (41, 1)
+    board = web_server.run_query(leaderboard.get_leaderboard, session)
+    assert [row["runs"] for row in board] == [1]
+
+
+def test_archive_rejects_malformed_form(tmp_path, monkeypatch):
+    import io
+    monkeypatch.setattr(web_server, "ARCHIVE_PATH", str(tmp_path / "archive.db"))
+    client = web_server.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    for form in ({"stations": "[]"}, {"stations": '"red"'}, {"offsets": "[1]"}, {"offsets": '{"red": "soon"}'}):
+        data = dict(form, files=(io.BytesIO(b'{"id": 1}\n'), "red.ndjson"))
+        response = client.post("/api/archive", data=data, content_type="multipart/form-data")
+        assert response.status_code == 400, form
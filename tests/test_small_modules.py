@@ -0,0 +1,85 @@
+import json
+import time
+import threading
+
+import config_reload
+import event_record
+import loop_watchdog
+import state_board
+from conftest import ROOT
+from match_cache import MatchCache
+
+
+def test_response_packing():
+    assert event_record.unpack_response(event_record.pack_response("short")) == "short"
+    packed = event_record.pack_response("y" * 1000)
+    assert isinstance(packed, bytes)
+    assert event_record.unpack_response(packed).startswith("y" * event_record.RESPONSE_LIMIT)
+    assert event_record.response_text(200, "ok") == "Status: 200\nBody: ok"
+
+
+def test_match_cache_versions():
+    cache = MatchCache()
+    value, version = cache.get("key", lambda: "first")
+    assert cache.get("key", lambda: "second") == ("first", version)
+    cache.invalidate()
+    assert cache.get("key", lambda: "second")[0] == "second"
+
+
+def test_match_cache_keeps_old_version_across_a_write():
+    cache = MatchCache()
+    before = cache.version
+
+    def compute():
+        cache.invalidate()  # A write lands while the value is computed
+        return "stale"
+
+    assert cache.get("key", compute) == ("stale", before)
+    assert "key" not in cache.entries
+
+
+def test_merge_config_keeps_other_settings():
+    config = {"delivery": {"mode": "single", "hedge_delay": 0.25}, "ntp_servers": ["a"]}
+    config_reload.merge_config(config, {"delivery": {"mode": "hedged"}, "ntp_servers": ["b"]})
+    assert config == {"delivery": {"mode": "hedged", "hedge_delay": 0.25}, "ntp_servers": ["b"]}
+
+
+def test_example_config_is_valid():
+    config = config_reload.read_config(f"{ROOT}/example-config.json")
+    assert config_reload.validate(config) == []
+    assert "proxy_udp" in config["delivery"]["upstreams"]
+
+
+def test_state_board_round_trip(tmp_path):
+    path = str(tmp_path / "board")
+    board = state_board.StateBoard(path, side=2)
+    reader = state_board.StateBoardReader(path)
+    board.take_off(100.0)
+    board.landing(100.0, 112.5)
+    board.delivered(True, 200)
+    state = reader.read()
+    assert state["side"] == 2 and state["phase"] == "idle"
+    assert state["last_match_time"] == 112.5 - 100.0
+    assert state["last_delivery"] == "delivered" and state["last_status"] == 200
+    json.dumps(state)
+    reader.close()
+    board.close()
+
+
+def test_watchdog_ignores_announced_work():
+    watchdog = loop_watchdog.LoopWatchdog({"stall_threshold": 0.1, "check_interval": 0.02, "systemd": False})
+
+    def loop():
+        watchdog.start()
+        watchdog.expect(0.5)
+        time.sleep(0.3)  # Announced, not a stall
+        watchdog.beat()
+        time.sleep(0.3)  # Unannounced
+        watchdog.beat()
+        time.sleep(0.05)
+        watchdog.stop()
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+    thread.join()
+    assert watchdog.stalls == 1
@@ -0,0 +1,14 @@
+import startup_benchmark
+from conftest import ROOT
+
+
+def test_deferred_modules_stay_unloaded():
+    seconds, loaded, entries = startup_benchmark.measure(ROOT)
+    assert loaded == []
+    assert seconds > 0
+    assert any(module == "main" for _, module in entries)
+
+
+def test_parse_importtime():
+    output = "import time: self [us] | cumulative | imported package\nimport time:       120 |        450 |   json\n"
+    assert startup_benchmark.parse_importtime(output) == [(450, "json")]
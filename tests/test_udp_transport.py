@@ -0,0 +1,96 @@
+import json
+import time
+import threading
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import delivery
+import udp_transport
+
+
+class Upstream:
+    """HTTP stand-in for the proxy, answering with the queued statuses and then 200"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.events = []
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                upstream.events.append((self.headers.get(delivery.IDEMPOTENCY_HEADER), body))
+                self.send_response(upstream.statuses.pop(0) if upstream.statuses else 200)
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream():
+    server = Upstream()
+    yield server
+    server.close()
+
+
+def sensor_settings(port):
+    return SimpleNamespace(SERVER_HOST="127.0.0.1", SERVER_PORT=port, SERVER_PATH="/proxy",
+                           DIRECT_SERVER_URL="http://127.0.0.1:9/direct", STATION_CODE="station_1", SECURE_KEY="key")
+
+
+def build(http_port, udp_port, **udp):
+    udp_config = {"enabled": True, "host": "127.0.0.1", "port": udp_port, **udp}
+    return delivery.build_delivery(sensor_settings(http_port), {"mode": "single", "journal": False, "udp": udp_config})
+
+
+def receiver(forward_port):
+    return udp_transport.UdpReceiver("127.0.0.1", 0, f"http://127.0.0.1:{forward_port}/proxy").start()
+
+
+def test_event_forwarded_through_receiver(upstream):
+    rx = receiver(upstream.port)
+    events = build(upstream.port, rx.listen_port)
+    result = events.send(1, "landing", time.time(), "proxy_udp")
+    assert result.success and result.upstream == "proxy_udp"
+    assert len(upstream.events) == 1
+    assert upstream.events[0][1]["event_type"] == "landing"
+
+
+def test_failed_forward_is_retransmitted():
+    upstream = Upstream([502, 502])
+    try:
+        rx = receiver(upstream.port)
+        events = build(upstream.port, rx.listen_port, fallback_after=10)
+        result = events.send(1, "take_off", time.time(), "proxy_udp")
+        assert result.success and result.upstream == "proxy_udp"
+        assert [attempt.get("status") for attempt in result.attempts] == [502, 502, 200]
+        # Every retransmit is the same event to the upstream
+        assert len({key for key, _ in upstream.events}) == 1
+    finally:
+        upstream.close()
+
+
+def test_http_fallback_without_failover(upstream):
+    # Nothing listens on the UDP port, the HTTP proxy takes the event even with failover off
+    events = build(upstream.port, 9)
+    assert [u.name for u in events.select_upstreams("landing", "proxy_udp")] == ["proxy_udp", "proxy"]
+    result = events.send(1, "landing", time.time(), "proxy_udp")
+    assert result.success and result.upstream == "proxy"
+
+
+def test_probe_round_trip(upstream):
+    rx = receiver(upstream.port)
+    events = build(upstream.port, rx.listen_port)
+    assert events.get_upstream("proxy_udp").probe(1.0) < 1.0
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import os
+import mmap
+import time
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Path of the ring file, survives restarts so a disputed race can still be looked at
+TRACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trace.bin")
+
+# File header: magic, version, record size, capacity, number of records ever written
+HEADER = struct.Struct("<4sHHIQ")
+HEADER_SIZE = 32
+MAGIC = b"SLTR"
+VERSION = 1
+COUNT_FIELD = struct.Struct("<Q")
+COUNT_OFFSET = 12
+
+# Record: wall clock nanoseconds, pin, level, kind, value (mark code)
+RECORD = struct.Struct("<qBBBxI")
+RECORD_SIZE = RECORD.size
+
+# Record kinds
+KIND_EDGE = 0  # Pin level changed
+KIND_SAMPLE = 1  # Raw read of a pin, only recorded with "samples" enabled
+KIND_MARK = 2  # Timer event, the value says which one
+
+# Mark codes
+MARK_ARMED = 1
+MARK_TAKE_OFF = 2
+MARK_LANDING = 3
+
+KIND_NAMES = {KIND_EDGE: "edge", KIND_SAMPLE: "sample", KIND_MARK: "mark"}
+MARK_NAMES = {MARK_ARMED: "armed", MARK_TAKE_OFF: "take_off", MARK_LANDING: "landing"}
+
+
+class TraceRecorder:
+    """Flight recorder keeping raw sensor edges in a memory-mapped ring file"""
+
+    def __init__(self, path=TRACE_PATH, capacity=65536, pin_names=None):
+        self.path = path
+        self.capacity = capacity
+        self.pin_names = pin_names or {}
+        self.lock = threading.Lock()
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, version, record_size, stored_capacity, count = HEADER.unpack_from(self.map, 0)
+        if magic == MAGIC and version == VERSION and record_size == RECORD_SIZE and stored_capacity == capacity:
+            self.count = count
+            logger.info(f"Sensor trace resumed from {path} ({min(count, capacity)} records)")
+        else:
+            # New file or different layout, start over
+            self.count = 0
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD_SIZE, capacity, 0)
+            logger.info(f"Sensor trace created at {path} ({capacity} records)")
+
+    def record(self, pin, level, kind=KIND_EDGE, value=0, time_ns=None):
+        """Write one fixed-size record straight into the mapped file"""
+        if time_ns is None:
+            time_ns = time.time_ns()
+        with self.lock:
+            RECORD.pack_into(self.map, HEADER_SIZE + (self.count % self.capacity) * RECORD_SIZE,
+                             time_ns, pin, level, kind, value)
+            self.count += 1
+            COUNT_FIELD.pack_into(self.map, COUNT_OFFSET, self.count)
+
+    def mark(self, code, event_time=None):
+        """Record a timer event, at the given time in seconds if set"""
+        self.record(0, 0, KIND_MARK, code, int(event_time * 1e9) if event_time is not None else None)
+
+    def snapshot(self):
+        """Copy the ring and return its consistent records, oldest first"""
+        count_before = COUNT_FIELD.unpack_from(self.map, COUNT_OFFSET)[0]
+        data = self.map[HEADER_SIZE:]
+        count_after = COUNT_FIELD.unpack_from(self.map, COUNT_OFFSET)[0]
+
+        # Slots rewritten while copying may be torn, leave out the records they held
+        first = max(0, count_after - self.capacity)
+        if first >= count_before:
+            return []
+        start = (first % self.capacity) * RECORD_SIZE
+        end = (count_before % self.capacity) * RECORD_SIZE
+        if start < end:
+            ordered = data[start:end]
+        else:
+            ordered = data[start:] + data[:end]
+        return list(RECORD.iter_unpack(ordered))
+
+    def window(self, start, end):
+        """Records between two times in seconds, as dicts for the API"""
+        start_ns = int(start * 1e9)
+        end_ns = int(end * 1e9)
+        records = []
+        for time_ns, pin, level, kind, value in self.snapshot():
+            if start_ns <= time_ns <= end_ns:
+                records.append({
+                    "time_ns": time_ns,
+                    "time": time_ns / 1e9,
+                    "kind": KIND_NAMES.get(kind, str(kind)),
+                    "pin": pin if kind != KIND_MARK else None,
+                    "name": MARK_NAMES.get(value) if kind == KIND_MARK else self.pin_names.get(pin, str(pin)),
+                    "level": level if kind != KIND_MARK else None
+                })
+        return records
+
+    def close(self):
+        """Flush and unmap the ring file"""
+        with self.lock:
+            self.map.flush()
+            self.map.close()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+import time
+import uuid
+import socket
+import struct
+import random
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from delivery import Upstream, DeliveryResult, IDEMPOTENCY_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Datagram layout (network byte order):
+#   header: magic "SL", version, message type, sequence number
+#   EVENT:  header + side, event code, event time (double), idempotency key (16 bytes),
+#           station code and secure key (each a length byte followed by UTF-8)
+#   ACK:    header + HTTP status the receiver got when forwarding the event
+#   PING/PONG: header only, used by the health monitor
+MAGIC = b"SL"
+VERSION = 1
+MSG_EVENT = 1
+MSG_ACK = 2
+MSG_PING = 3
+MSG_PONG = 4
+
+HEADER = struct.Struct("!2sBBI")
+EVENT_BODY = struct.Struct("!BBd16s")
+ACK_BODY = struct.Struct("!H")
+SEQ_FIELD = struct.Struct("!I")
+TIME_FIELD = struct.Struct("!d")
+SEQ_OFFSET = 4  # After magic, version and message type
+TIME_OFFSET = HEADER.size + 2  # After side and event code
+
+EVENT_CODES = {"take_off": 1, "landing": 2}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+MAX_DATAGRAM = 1024
+DEFAULT_PORT = 1338
+
+
+def encode_event(seq, json_data, idempotency_key):
+    """Pack a proxy-format event into a datagram"""
+    station_code = json_data["station_code"].encode("utf-8")[:255]
+    secure_key = json_data["secure_key"].encode("utf-8")[:255]
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, MSG_EVENT, seq),
+        EVENT_BODY.pack(
+            json_data["event_body"]["side"],
+            EVENT_CODES[json_data["event_type"]],
+            json_data["event_body"]["time"],
+            uuid.UUID(hex=idempotency_key).bytes
+        ),
+        bytes([len(station_code)]), station_code,
+        bytes([len(secure_key)]), secure_key
+    ])
+
+
+class DatagramTemplate:
+    """Pre-packed event datagram with the event time (and sequence number) left to fill in"""
+
+    def __init__(self, datagram):
+        self.datagram = datagram
+
+    def fill(self, event_time):
+        """Datagram for the given event time, sequence number still zero"""
+        datagram = bytearray(self.datagram)
+        TIME_FIELD.pack_into(datagram, TIME_OFFSET, event_time)
+        return bytes(datagram)
+
+
+def decode_event(data):
+    """Unpack an event datagram into (seq, proxy-format JSON dict, idempotency key)"""
+    _, _, _, seq = HEADER.unpack_from(data)
+    side, event_code, event_time, key_bytes = EVENT_BODY.unpack_from(data, HEADER.size)
+    offset = HEADER.size + EVENT_BODY.size
+    station_length = data[offset]
+    station_code = data[offset + 1:offset + 1 + station_length].decode("utf-8")
+    offset += 1 + station_length
+    secure_key_length = data[offset]
+    secure_key = data[offset + 1:offset + 1 + secure_key_length].decode("utf-8")
+    json_data = {
+        "station_code": station_code,
+        "secure_key": secure_key,
+        "event_type": EVENT_NAMES[event_code],
+        "event_body": {
+            "side": side,
+            "time": round(event_time, 3)
+        }
+    }
+    return seq, json_data, uuid.UUID(bytes=key_bytes).hex
+
+
+def parse_header(data):
+    """Return (message type, seq) of a datagram, or None if it is not ours"""
+    if len(data) < HEADER.size:
+        return None
+    magic, version, message_type, seq = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return message_type, seq
+
+
+class UdpUpstream(Upstream):
+    """Proxy upstream reached over the compact datagram protocol, with ACKs and retransmits"""
+
+    def __init__(self, name, host, port, event_types=None, fallback_after=3, min_timeout=0.05, fallback="proxy"):
+        super().__init__(name, "proxy", f"udp://{host}:{port}", event_types)
+        self.host = host
+        self.port = port
+        self.fallback_after = fallback_after  # Unacknowledged sends before HTTP is tried as well
+        self.fallback = fallback  # HTTP upstream kept as a candidate even without delivery.failover
+        self.min_timeout = min_timeout  # LAN round trips are far below the HTTP floor
+        self.seq = random.randrange(1 << 31)
+        self.seq_lock = threading.Lock()
+        self.pending = {}  # seq -> waiter dict filled by the receive thread
+        self.sock = None
+        self.sock_lock = threading.Lock()
+        self.closed = False
+
+    def ensure_socket(self):
+        """Open the connected UDP socket and its receive thread on first use"""
+        with self.sock_lock:
+            if self.closed:
+                raise OSError("Upstream closed")
+            if self.sock is None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                # Connected, so ICMP port unreachable shows up as ConnectionRefusedError
+                sock.connect((self.host, self.port))
+                self.sock = sock
+                receive_thread = threading.Thread(target=self.receive_loop, name=f"{self.name}-rx")
+                receive_thread.daemon = True
+                receive_thread.start()
+            return self.sock
+
+    def serialize(self, station_code, secure_key, side, event_type, event_time, idempotency_key):
+        """Event datagram with a zero sequence number, set when it is sent"""
+        return encode_event(0, self.build_payload(station_code, secure_key, side, event_type, event_time), idempotency_key)
+
+    def prepare(self, station_code, secure_key, side, event_type, idempotency_key):
+        """Template datagram with only the event time left to fill in"""
+        return DatagramTemplate(self.serialize(station_code, secure_key, side, event_type, 0.0, idempotency_key))
+
+    def warm(self):
+        """Open the socket and receive thread ahead of an expected event"""
+        try:
+            self.ensure_socket()
+        except OSError as e:
+            logger.warning(f"[{self.name}] Could not open UDP socket: {e}")
+
+    def close(self):
+        """Close the socket, which ends the receive thread"""
+        super().close()
+        with self.sock_lock:
+            self.closed = True
+            if self.sock is not None:
+                self.sock.close()
+
+    def next_seq(self):
+        """Sequence number for a new datagram"""
+        with self.seq_lock:
+            self.seq = (self.seq + 1) & 0xFFFFFFFF
+            return self.seq
+
+    def receive_loop(self):
+        """Match ACK and PONG datagrams to their waiting senders"""
+        while True:
+            try:
+                data = self.sock.recv(MAX_DATAGRAM)
+            except ConnectionRefusedError:
+                # Nobody listening, wake every waiter so it can fail over
+                for waiter in list(self.pending.values()):
+                    waiter["error"] = "connect"
+                    waiter["event"].set()
+                continue
+            except OSError as e:
+                if self.closed:
+                    return
+                logger.error(f"[{self.name}] UDP receive error: {e}")
+                time.sleep(0.1)
+                continue
+
+            header = parse_header(data)
+            if header is None:
+                continue
+            message_type, seq = header
+            waiter = self.pending.get(seq)
+            if waiter is None:
+                continue  # Late ACK of an event that already finished
+            if message_type == MSG_ACK and len(data) >= HEADER.size + ACK_BODY.size:
+                waiter["status"] = ACK_BODY.unpack_from(data, HEADER.size)[0]
+            elif message_type == MSG_PONG:
+                waiter["status"] = 0
+            waiter["event"].set()
+
+    def attempt_timeout(self, policy):
+        """Retransmit timeout from the observed round trips"""
+        latency = self.latency
+        with latency.lock:
+            timeout = 0.2 if latency.srtt is None else latency.srtt + 4 * latency.rttvar
+            timeout *= latency.penalty
+        return max(self.min_timeout, min(policy.max_timeout, timeout))
+
+    def send_and_wait(self, seq, datagram, timeout, waiter):
+        """Send one datagram and wait for its reply"""
+        waiter["event"].clear()
+        waiter["status"] = None
+        waiter["error"] = None
+        self.ensure_socket().send(datagram)
+        waiter["event"].wait(timeout)
+
+    def deliver(self, payload, idempotency_key, cancelled, policy, started, deadline, attempts,
+                on_attempt=None):
+        """Send an event datagram, retransmitting with the same seq until it is acknowledged with 200"""
+        result = DeliveryResult(self.name, False, "No acknowledgement")
+        seq = self.next_seq()
+        datagram = bytearray(payload)
+        SEQ_FIELD.pack_into(datagram, SEQ_OFFSET, seq)
+
+        waiter = {"event": threading.Event(), "status": None, "error": None}
+        self.pending[seq] = waiter
+        attempt = 0
+        try:
+            while not cancelled.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.warning(f"[{self.name}] Event deadline of {policy.deadline:.1f}s exceeded")
+                    break
+
+                attempt += 1
+                timeout = min(self.attempt_timeout(policy), remaining)
+                attempt_started = time.time()
+                record = {
+                    "upstream": self.name,
+                    "attempt": attempt,
+                    "offset": round(attempt_started - started, 3),
+                    "timeout": round(timeout, 3)
+                }
+
+                try:
+                    self.send_and_wait(seq, datagram, timeout, waiter)
+                except OSError as e:
+                    waiter["error"] = "connect"
+                    logger.error(f"[{self.name}] UDP send error: {e}")
+                elapsed = time.time() - attempt_started
+                record["elapsed"] = round(elapsed, 3)
+
+                if waiter["status"] is not None:
+                    self.latency.observe(elapsed)
+                    record["status"] = waiter["status"]
+                    result = DeliveryResult(
+                        self.name,
+                        waiter["status"] == 200,
+                        f"UDP ACK seq {seq}",
+                        waiter["status"],
+                        time.time() - started
+                    )
+                    logger.info("[%s] ACK seq %d status %s in %.3fs", self.name, seq, waiter["status"], elapsed)
+                    if result.success:
+                        attempts.append(record)
+                        if on_attempt:
+                            on_attempt(self, record)
+                        break
+                    # The receiver could not forward the event and forwards it again on the next retransmit
+                    if attempt == self.fallback_after:
+                        record["fallback"] = True
+                    attempts.append(record)
+                    if on_attempt:
+                        on_attempt(self, record)
+                    if cancelled.wait(min(policy.backoff(attempt), max(0, deadline - time.time()))):
+                        break
+                    continue
+
+                if waiter["error"] == "connect" or attempt == self.fallback_after:
+                    # Refused or silent for too long, let the HTTP path take over while we keep trying
+                    record["error"] = "connect"
+                    result = DeliveryResult(self.name, False, "UDP receiver unreachable", None, time.time() - started)
+                else:
+                    record["error"] = "timeout"
+                    self.latency.timed_out()
+                attempts.append(record)
+                if on_attempt:
+                    on_attempt(self, record)
+                if waiter["error"] == "connect" and cancelled.wait(policy.backoff(attempt)):
+                    break
+        finally:
+            self.pending.pop(seq, None)
+
+        result.attempts = attempts
+        return result
+
+    def probe(self, timeout):
+        """Round trip of a PING datagram, used by the health monitor"""
+        seq = self.next_seq()
+        waiter = {"event": threading.Event(), "status": None, "error": None}
+        self.pending[seq] = waiter
+        try:
+            started = time.time()
+            self.send_and_wait(seq, HEADER.pack(MAGIC, VERSION, MSG_PING, seq), timeout, waiter)
+            if waiter["status"] is None:
+                raise OSError(waiter["error"] == "connect" and "Connection refused" or "No PONG received")
+            return time.time() - started
+        finally:
+            self.pending.pop(seq, None)
+
+
+class UdpReceiver:
+    """Reference receiver: accepts event datagrams and forwards them to an HTTP proxy or API"""
+
+    def __init__(self, listen_host, listen_port, forward_url, workers=4, cache_size=4096):
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.forward_url = forward_url
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="udp-forward")
+        self.session = requests.Session()
+        self.cache_size = cache_size
+        self.completed = OrderedDict()  # idempotency key -> forwarded status, for duplicate datagrams
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        """Bind the socket and serve in a daemon thread"""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.listen_host, self.listen_port))
+        self.listen_port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, name="udp-receiver")
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"UDP receiver listening on {self.listen_host}:{self.listen_port}, forwarding to {self.forward_url}")
+        return self
+
+    def send_ack(self, address, seq, status):
+        """Acknowledge an event with the status of the HTTP forward"""
+        try:
+            self.sock.sendto(HEADER.pack(MAGIC, VERSION, MSG_ACK, seq) + ACK_BODY.pack(status), address)
+        except OSError as e:
+            logger.error(f"Failed to send ACK to {address}: {e}")
+
+    def serve(self):
+        """Receive loop"""
+        while True:
+            try:
+                data, address = self.sock.recvfrom(MAX_DATAGRAM)
+            except OSError as e:
+                logger.error(f"UDP receive error: {e}")
+                continue
+
+            header = parse_header(data)
+            if header is None:
+                continue
+            message_type, seq = header
+
+            if message_type == MSG_PING:
+                self.sock.sendto(HEADER.pack(MAGIC, VERSION, MSG_PONG, seq), address)
+                continue
+            if message_type != MSG_EVENT:
+                continue
+
+            try:
+                seq, json_data, idempotency_key = decode_event(data)
+            except Exception as e:
+                logger.warning(f"Malformed event datagram from {address}: {e}")
+                continue
+
+            with self.lock:
+                if idempotency_key in self.completed:
+                    status = self.completed[idempotency_key]
+                elif idempotency_key in self.in_flight:
+                    continue  # Retransmit of an event still being forwarded, ACK follows
+                else:
+                    self.in_flight.add(idempotency_key)
+                    status = None
+
+            if status is not None:
+                self.send_ack(address, seq, status)
+            else:
+                self.executor.submit(self.forward, address, seq, json_data, idempotency_key)
+
+    def forward(self, address, seq, json_data, idempotency_key):
+        """Post the event to the HTTP upstream and ACK with its status"""
+        try:
+            response = self.session.post(
+                self.forward_url,
+                json=json_data,
+                headers={IDEMPOTENCY_HEADER: idempotency_key},
+                timeout=5
+            )
+            status = response.status_code
+            logger.info(f"Forwarded {json_data['event_type']} (key {idempotency_key}): {status}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to forward {json_data['event_type']} (key {idempotency_key}): {e}")
+            status = 502
+
+        with self.lock:
+            self.in_flight.discard(idempotency_key)
+            # Only remember successes, so a failed forward is retried on the next retransmit
+            if status == 200:
+                self.completed[idempotency_key] = status
+                while len(self.completed) > self.cache_size:
+                    self.completed.popitem(last=False)
+        self.send_ack(address, seq, status)
+
+
+if __name__ == "__main__":
+    # Run the reference receiver, typically on the proxy machine
+    parser = argparse.ArgumentParser(description="SL Timer UDP event receiver")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="UDP port to listen on")
+    parser.add_argument("--forward", default="http://127.0.0.1:1337/proxy", help="HTTP URL events are forwarded to")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    UdpReceiver(args.host, args.port, args.forward).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("UDP receiver stopped")
@@ -6,23 +6,38 @@ import queue
 import os
 import sqlite3
 import subprocess
+import tempfile
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request, redirect, Response, session, url_for
+from flask import Flask, render_template, jsonify, request, redirect, Response, session, url_for, get_template_attribute, g
 import threading
 from collections import deque
 from functools import wraps
 
+import race_stats
+import leaderboard
+import log_pipeline
+import static_assets
+import config_reload
+import match_archive
+import profiler
+import event_record
+from match_cache import MatchCache
+
 # Create Flask app
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # Generate a random secret key for sessions
+assets = static_assets.AssetPipeline(app)  # Hashed, pre-compressed static files under /assets
 
 # Global variables
-log_queue = queue.Queue(maxsize=1000)  # Store the last 1000 log entries
+stream_subscribers = set()  # One queue per open live stream, each gets every log line and match change
+stream_lock = threading.Lock()
 log_buffer = []  # Buffer to store log entries for web display
 last_ntp_sync_time = None
 last_ntp_sync_server = None
 sensor_system = None  # Will be set when initialized
+match_cache = MatchCache()  # Match list and its rendered fragment, dropped on every write
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "matches.db")  # Absolute path to SQLite database file
+ARCHIVE_PATH = match_archive.ARCHIVE_PATH  # Matches merged from the exports of several stations
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")  # Config file path
 
 # Default configuration
@@ -45,6 +60,20 @@ DEFAULT_CONFIG = {
     ]
 }
 
+@app.before_request
+def begin_request_profile():
+    """Profile this request if a cProfile capture of the web server is running, one global lookup otherwise"""
+    collector = profiler.request_profile
+    if collector is not None and request.endpoint not in ('log_stream', 'profile_endpoint'):
+        g.request_profile = (collector, collector.begin())
+
+@app.teardown_request
+def end_request_profile(exc=None):
+    started = g.pop('request_profile', None)
+    if started is not None:
+        collector, profile = started
+        collector.end(profile)
+
 # Login decorator
 def login_required(f):
     @wraps(f)
@@ -80,26 +109,43 @@ def logout():
     return redirect(url_for('login'))
 
 # Setup logging
-class QueueHandler(logging.Handler):
-    def emit(self, record):
-        log_entry = self.format(record)
-        
-        # Skip web access logs
-        if ' - - [' in log_entry and ('] "GET ' in log_entry or '] "POST ' in log_entry):
-            return
-            
-        # Skip empty logs
-        if not log_entry.strip():
-            return
+def publish_log_line(log_entry):
+    """Add a formatted log line to the web display buffer and the live stream"""
+    # Skip web access logs
+    if ' - - [' in log_entry and ('] "GET ' in log_entry or '] "POST ' in log_entry):
+        return
         
-        log_buffer.append(log_entry)
-        if len(log_buffer) > 1000:  # Keep only the last 1000 entries
-            log_buffer.pop(0)
+    # Skip empty logs
+    if not log_entry.strip():
+        return
+    
+    log_buffer.append(log_entry)
+    if len(log_buffer) > 1000:  # Keep only the last 1000 entries
+        log_buffer.pop(0)
+    publish_stream("log", log_entry)
+
+def publish_stream(kind, payload=None):
+    """Hand an event to every open live stream, dropping a slow client's oldest entry when its queue is full"""
+    with stream_lock:
+        subscribers = list(stream_subscribers)
+    for events in subscribers:
         try:
-            log_queue.put_nowait(log_entry)
+            events.put_nowait((kind, payload))
         except queue.Full:
-            log_queue.get()  # Remove oldest entry
-            log_queue.put_nowait(log_entry)
+            try:
+                events.get_nowait()
+                events.put_nowait((kind, payload))
+            except (queue.Empty, queue.Full):
+                pass
+
+def matches_changed():
+    """Drop the cached match data and tell the open live streams to send what changed"""
+    match_cache.invalidate()
+    publish_stream("matches")
+
+class QueueHandler(logging.Handler):
+    def emit(self, record):
+        publish_log_line(self.format(record))
 
 # Configure logger
 def setup_logging():
@@ -115,12 +161,36 @@ def setup_logging():
     queue_handler.setLevel(logging.INFO)
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     queue_handler.setFormatter(formatter)
-    logging.getLogger().addHandler(queue_handler)
+    # Behind the log pipeline when the sensor system started it before importing this module
+    log_pipeline.add_handler(queue_handler)
     
     return logging.getLogger(__name__)
 
 logger = setup_logging()
 
+# Columns added to the matches table after its first release, with their SQL types
+MATCH_COLUMN_MIGRATIONS = [
+    ("start_attempts", "TEXT"),
+    ("finish_attempts", "TEXT"),
+    ("completed", "INTEGER NOT NULL DEFAULT 1"),
+    ("session_id", "INTEGER"),
+    ("heat_id", "INTEGER"),
+    ("pilot_id", "INTEGER"),
+    ("start_status", "INTEGER"),
+    ("start_latency", "REAL"),
+    ("finish_status", "INTEGER"),
+    ("finish_latency", "REAL")
+]
+
+def migrate_columns(cursor, table, columns):
+    """Add any missing columns to an existing table"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+            logger.info(f"Added column {name} to {table} table")
+
 def initialize_database():
     """Initialize SQLite database for storing match data"""
     try:
@@ -149,10 +219,37 @@ def initialize_database():
             finish_log TEXT,
             start_response TEXT,
             finish_response TEXT,
+            start_attempts TEXT,
+            finish_attempts TEXT,
+            completed INTEGER NOT NULL DEFAULT 1,
+            session_id INTEGER,
+            heat_id INTEGER,
+            pilot_id INTEGER,
+            start_status INTEGER,
+            start_latency REAL,
+            finish_status INTEGER,
+            finish_latency REAL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         ''')
         
+        # Add columns introduced after the table was first created
+        migrate_columns(cursor, 'matches', MATCH_COLUMN_MIGRATIONS)
+        
+        # Sessions, heats, pilots and their materialized leaderboards
+        leaderboard.create_tables(cursor)
+        leaderboard.create_indexes(cursor)
+        
+        # Per-side and per-session race statistics, updated on every save instead of scanning the matches
+        race_stats.create_table(cursor)
+        cursor.execute('SELECT COUNT(*) FROM match_stats')
+        if cursor.fetchone()[0] == 0:
+            rebuilt = race_stats.rebuild(cursor)
+            if rebuilt:
+                logger.info(f"Race statistics rebuilt from {rebuilt} stored matches")
+        elif race_stats.migrate(cursor):
+            logger.info("Per-day race statistics replaced by per-session ones")
+        
         conn.commit()
         conn.close()
         logger.info("Match database initialized successfully")
@@ -167,8 +264,38 @@ def initialize_database():
         except Exception as write_error:
             logger.error(f"Failed to create database file: {write_error}")
 
-def save_match(side, start_time, finish_time, start_log, finish_log, start_response, finish_response):
-    """Save match data to SQLite database"""
+def allocate_match(side):
+    """Reserve a row for a match that is about to be run, so the landing only has to fill it in"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        
+        # A reservation that never got its landing is dropped
+        cursor.execute('DELETE FROM matches WHERE completed = 0 AND side = ?', (side,))
+        cursor.execute('''
+        INSERT INTO matches 
+        (side, start_time, finish_time, start_time_formatted, finish_time_formatted, match_time, completed)
+        VALUES (?, 0, 0, '', '', 0, 0)
+        ''', (side,))
+        match_id = cursor.lastrowid
+        
+        conn.commit()
+        conn.close()
+        return match_id
+    except Exception as e:
+        logger.error(f"Failed to pre-allocate match row: {e}")
+        return None
+
+def compact_attempts(attempts):
+    """Delivery attempts as compact JSON, NULL when there were none"""
+    return json.dumps(list(attempts), separators=(',', ':')) if attempts else None
+
+def save_match(start, finish, match_id=None):
+    """Save a match from its take-off and landing EventRecords, filling in the pre-allocated row if there is one
+
+    The log lines are not stored, they follow from the times and side. Response bodies are
+    stored cut short and compressed, with their status and latency in columns of their own.
+    """
     try:
         # Ensure database is initialized
         if not os.path.exists(DB_PATH):
@@ -178,29 +305,58 @@ def save_match(side, start_time, finish_time, start_log, finish_log, start_respo
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
+        side = finish.side
+        start_time = start.event_time
+        finish_time = finish.event_time
         match_time = finish_time - start_time
-        start_time_formatted = datetime.fromtimestamp(start_time).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        finish_time_formatted = datetime.fromtimestamp(finish_time).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        start_time_formatted = event_record.format_time(start_time)
+        finish_time_formatted = event_record.format_time(finish_time)
         
-        cursor.execute('''
-        INSERT INTO matches 
-        (side, start_time, finish_time, start_time_formatted, finish_time_formatted, match_time, 
-         start_log, finish_log, start_response, finish_response)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        values = (
             side, start_time, finish_time, start_time_formatted, finish_time_formatted, match_time,
-            start_log, finish_log, start_response, finish_response
-        ))
+            start.status, start.latency, event_record.pack_response(start.response), compact_attempts(start.attempts),
+            finish.status, finish.latency, event_record.pack_response(finish.response), compact_attempts(finish.attempts)
+        )
         
-        # Keep only the most recent 40 matches
+        updated = False
+        if match_id is not None:
+            cursor.execute('''
+            UPDATE matches SET
+            side = ?, start_time = ?, finish_time = ?, start_time_formatted = ?, finish_time_formatted = ?,
+            match_time = ?, start_status = ?, start_latency = ?, start_response = ?, start_attempts = ?,
+            finish_status = ?, finish_latency = ?, finish_response = ?, finish_attempts = ?, completed = 1
+            WHERE id = ? AND completed = 0
+            ''', values + (match_id,))
+            updated = cursor.rowcount == 1
+            saved_id = match_id
+        
+        # No reservation (or it was cleared in the meantime)
+        if not updated:
+            cursor.execute('''
+            INSERT INTO matches 
+            (side, start_time, finish_time, start_time_formatted, finish_time_formatted, match_time, 
+             start_status, start_latency, start_response, start_attempts,
+             finish_status, finish_latency, finish_response, finish_attempts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', values)
+            saved_id = cursor.lastrowid
+        
+        # File the match under the side's current session, heat and pilot
+        session_id = leaderboard.stamp_match(cursor, side, saved_id)
+        
+        # Statistics cover all matches, including the ones pruned below
+        race_stats.record(cursor, side, session_id, match_time)
+        
+        # Keep only the most recent 40 matches, except those filed under a session
         cursor.execute('''
-        DELETE FROM matches WHERE id NOT IN (
-            SELECT id FROM matches ORDER BY created_at DESC LIMIT 40
+        DELETE FROM matches WHERE session_id IS NULL AND id NOT IN (
+            SELECT id FROM matches WHERE session_id IS NULL ORDER BY created_at DESC LIMIT 40
         )
         ''')
         
         conn.commit()
         conn.close()
+        matches_changed()
         logger.info(f"Match saved to database: {match_time:.2f} seconds")
         return True
     except Exception as e:
@@ -213,39 +369,78 @@ def save_match(side, start_time, finish_time, start_log, finish_log, start_respo
             pass
         return False
 
-def get_matches():
-    """Get recent matches from the database"""
+def parse_attempts(value):
+    """Decode the JSON list of delivery attempts stored with a match"""
+    try:
+        return json.loads(value) if value else []
+    except ValueError:
+        return []
+
+def load_matches():
+    """Read recent matches from the database"""
+    # Check if database exists, initialize if not
+    if not os.path.exists(DB_PATH):
+        logger.warning("Database not found, initializing...")
+        initialize_database()
+        return []  # Return empty list if we just initialized
+        
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    cursor = conn.cursor()
+    
+    # Check if table exists
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='matches'")
+    if not cursor.fetchone():
+        logger.warning("Matches table doesn't exist, initializing database...")
+        conn.close()
+        initialize_database()
+        return []
+    
+    cursor.execute('''
+    SELECT * FROM matches WHERE completed = 1 ORDER BY created_at DESC LIMIT 40
+    ''')
+    
+    matches = [format_match(row) for row in cursor.fetchall()]
+    
+    conn.close()
+    return matches
+
+def format_match(row):
+    """Match row as a dict, with match time, log lines, responses and per-attempt timing formatted for display"""
+    match = dict(row)
+    match['match_time'] = f"{match['match_time']:.2f}"
+    for prefix, event_type in (('start', 'take_off'), ('finish', 'landing')):
+        # Rows saved before the log lines were derived still have their own
+        if not match.get(f'{prefix}_log'):
+            match[f'{prefix}_log'] = event_record.log_line(event_type, match[f'{prefix}_time'], match['side'])
+        match[f'{prefix}_response'] = event_record.response_text(match.get(f'{prefix}_status'), match.get(f'{prefix}_response'))
+        match[f'{prefix}_attempts'] = parse_attempts(match.get(f'{prefix}_attempts'))
+    return match
+
+def get_matches_since(since_id, limit=40):
+    """Completed matches with an id above since_id, oldest first (a device completes its matches in id order)"""
     try:
-        # Check if database exists, initialize if not
-        if not os.path.exists(DB_PATH):
-            logger.warning("Database not found, initializing...")
-            initialize_database()
-            return []  # Return empty list if we just initialized
-            
         conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        
-        # Check if table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='matches'")
-        if not cursor.fetchone():
-            logger.warning("Matches table doesn't exist, initializing database...")
-            conn.close()
-            initialize_database()
-            return []
-        
         cursor.execute('''
-        SELECT * FROM matches ORDER BY created_at DESC LIMIT 40
-        ''')
-        
-        matches = [dict(row) for row in cursor.fetchall()]
-        
-        # Format match time for display
-        for match in matches:
-            match['match_time'] = f"{match['match_time']:.2f}"
-        
+        SELECT * FROM matches WHERE completed = 1 AND id > ? ORDER BY id LIMIT ?
+        ''', (since_id, limit))
+        matches = [format_match(row) for row in cursor.fetchall()]
         conn.close()
         return matches
+    except Exception as e:
+        logger.error(f"Failed to get matches since {since_id}: {e}")
+        return []
+
+def latest_match_id():
+    """Id of the newest completed match, 0 without matches"""
+    return max((match['id'] for match in get_matches()), default=0)
+
+def get_matches():
+    """Get recent matches, from the cache until the next write (callers must not modify them)"""
+    try:
+        return match_cache.get("matches", load_matches)[0]
     except Exception as e:
         logger.error(f"Failed to get matches: {e}")
         # Try to reinitialize on error
@@ -255,6 +450,58 @@ def get_matches():
             pass
         return []
 
+def get_match(match_id):
+    """Get a single completed match by id, None if it does not exist"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM matches WHERE id = ? AND completed = 1', (match_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Failed to get match {match_id}: {e}")
+        return None
+
+def get_stats(session_id=None):
+    """Get the per-side race statistics, with those of the given session or else of each side's assigned one"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        if session_id is None:
+            sessions = {side: assignment["session_id"] for side, assignment in leaderboard.get_assignments(cursor).items()}
+            stats = race_stats.load(cursor, sessions)
+        else:
+            stats = race_stats.load(cursor, {}, session_id)
+        conn.close()
+        return stats
+    except Exception as e:
+        logger.error(f"Failed to get race statistics: {e}")
+        return {}
+
+def file_match(cursor, match_id, session_id, heat_id, pilot_id):
+    """File a saved match under a session, keeping the leaderboards and the session statistics current"""
+    cursor.execute('SELECT side, session_id FROM matches WHERE id = ?', (match_id,))
+    previous = cursor.fetchone()
+    if not leaderboard.assign_match(cursor, match_id, session_id, heat_id, pilot_id):
+        return False
+    side, previous_session = previous
+    for affected in {previous_session, session_id}:
+        race_stats.refresh_session(cursor, side, affected)
+    return True
+
+def run_query(fn, *args, commit=False):
+    """Run a leaderboard module function on a fresh connection"""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        result = fn(conn.cursor(), *args)
+        if commit:
+            conn.commit()
+        return result
+    finally:
+        conn.close()
+
 def clear_matches():
     """Clear all matches from the database"""
     try:
@@ -273,10 +520,13 @@ def clear_matches():
             conn.close()
             return True
         
-        # Delete all matches
+        # Delete all matches, their statistics and leaderboards
         cursor.execute('DELETE FROM matches')
+        cursor.execute('DELETE FROM match_stats')
+        cursor.execute('DELETE FROM leaderboard')
         conn.commit()
         conn.close()
+        matches_changed()
         
         logger.info("Match history cleared successfully")
         return True
@@ -289,8 +539,8 @@ def initialize_web_server(sensor_system_instance):
     global sensor_system
     sensor_system = sensor_system_instance
     
-    # Load configuration and apply settings
-    config = load_config()
+    # Apply settings from the configuration the sensor system already parsed
+    config = getattr(sensor_system, "config", None) or load_config()
     
     # Apply direct mode from config
     sensor_system.DIRECT_MODE = config.get("direct_mode", False)
@@ -309,16 +559,38 @@ def initialize_web_server(sensor_system_instance):
     
     logger.info("Web server initialized with sensor system reference")
 
+def get_log_store():
+    """The persistent log store, if the sensor system has one"""
+    return getattr(sensor_system, 'log_store', None)
+
+def stored_logs(count=200):
+    """Last log lines from disk, shown after a restart emptied the in-memory buffer"""
+    store = get_log_store()
+    if store is None:
+        return []
+    try:
+        return [line for _, line in store.tail(count)]
+    except Exception as e:
+        logger.error(f"Failed to read stored logs: {e}")
+        return []
+
+def flush_logs():
+    """Write pending log lines to disk before the process goes away"""
+    log_pipeline.drain()
+    store = get_log_store()
+    if store is not None:
+        store.flush()
+
 @app.route('/')
 @login_required
 def index():
     """Main web interface"""
-    # Get latest matches for the Matches tab
-    matches = get_matches()
+    # Latest matches for the Matches tab, rendered once per change of the matches
+    matches_html = render_matches()
     
     return render_template(
         'index.html',
-        logs=list(log_buffer),
+        logs=list(log_buffer) or stored_logs(),
         side=sensor_system.SIDE,
         direct_mode=sensor_system.DIRECT_MODE,
         debug_mode=sensor_system.DEBUG_MODE,
@@ -326,9 +598,68 @@ def index():
         last_ntp_sync_time=last_ntp_sync_time,
         last_ntp_sync_server=last_ntp_sync_server,
         ntp_servers=sensor_system.NTP_SERVERS,
-        matches=matches
+        health=get_health(),
+        watchdog=get_watchdog(),
+        peer_clock=get_peer_clock(),
+        matches_html=matches_html,
+        last_match_id=latest_match_id()
     )
 
+def render_matches():
+    """The Matches tab list, rendered once per change of the matches"""
+    return match_cache.get("matches_html", lambda: render_template('_matches.html', matches=get_matches()))[0]
+
+def match_stream_events(since_id):
+    """Live stream text for the matches completed after since_id, and the newest id it covers
+
+    New matches go out one `match` event each, with the card to insert. A change without new
+    matches (a clear, an assignment) sends the whole list as a `matches` event instead.
+    """
+    with app.app_context():
+        new_matches = get_matches_since(since_id)
+        if new_matches:
+            match_card = get_template_attribute('_matches.html', 'match_card')
+            text = "".join(
+                f"event: match\ndata: {json.dumps({'match': match, 'html': str(match_card(match))})}\n\n"
+                for match in new_matches
+            )
+            return text, new_matches[-1]['id']
+        latest = latest_match_id()
+        return f"event: matches\ndata: {json.dumps({'html': render_matches(), 'last_id': latest})}\n\n", latest
+
+def get_health():
+    """Upstream health and journal backlog, if the sensor system has a health monitor"""
+    health_info = getattr(sensor_system, 'health_info', None)
+    if health_info is None:
+        return None
+    try:
+        return health_info()
+    except Exception as e:
+        logger.error(f"Failed to get upstream health: {e}")
+        return None
+
+def get_watchdog(stacks=False):
+    """Sensor loop stall state and counters, if the sensor system has a watchdog"""
+    watchdog_info = getattr(sensor_system, 'watchdog_info', None)
+    if watchdog_info is None:
+        return None
+    try:
+        return watchdog_info(stacks)
+    except Exception as e:
+        logger.error(f"Failed to get sensor loop watchdog state: {e}")
+        return None
+
+def get_peer_clock():
+    """Peer clock role and estimate, None if the sensor system has no peer clock"""
+    peer_clock_info = getattr(sensor_system, 'peer_clock_info', None)
+    if peer_clock_info is None:
+        return None
+    try:
+        return peer_clock_info()
+    except Exception as e:
+        logger.error(f"Failed to get peer clock state: {e}")
+        return None
+
 @app.route('/api/system_info')
 @login_required
 def system_info():
@@ -339,9 +670,68 @@ def system_info():
         'direct_mode': sensor_system.DIRECT_MODE,
         'debug_mode': sensor_system.DEBUG_MODE,
         'last_ntp_sync_time': last_ntp_sync_time,
-        'last_ntp_sync_server': last_ntp_sync_server
+        'last_ntp_sync_server': last_ntp_sync_server,
+        'sensors': getattr(sensor_system, 'sensor_states', None),
+        'match_in_progress': getattr(sensor_system, 'match_in_progress', False),
+        'health': get_health(),
+        'watchdog': get_watchdog(),
+        'peer_clock': get_peer_clock()
     })
 
+@app.route('/api/realtime')
+@login_required
+def realtime_endpoint():
+    """API endpoint to get the real-time settings in effect and the sensor loop jitter"""
+    realtime_info = getattr(sensor_system, 'realtime_info', None)
+    if realtime_info is None:
+        return jsonify({"error": "Jitter measurement is not available"}), 404
+    return jsonify(realtime_info())
+
+@app.route('/api/watchdog')
+@login_required
+def watchdog_endpoint():
+    """API endpoint to get the sensor loop stall state, counters and the stacks recorded during stalls"""
+    watchdog = get_watchdog(stacks=True)
+    if watchdog is None:
+        return jsonify({"error": "Sensor loop watchdog is not available"}), 404
+    return jsonify(watchdog)
+
+@app.route('/api/peer_clock')
+@login_required
+def peer_clock_endpoint():
+    """API endpoint to get this timer's clock offset from the reference, or on the reference the report of each node"""
+    peer_clock = get_peer_clock()
+    if peer_clock is None:
+        return jsonify({"error": "Peer clock is not available"}), 404
+    return jsonify(peer_clock)
+
+@app.route('/api/profile')
+@login_required
+def profile_endpoint():
+    """API endpoint to capture a bounded profile (?mode=sample|cprofile, target=sensor|web|process, seconds,
+    interval_ms, format=text) and download it"""
+    mode = request.args.get('mode', 'sample')
+    target = request.args.get('target', 'sensor')
+    output = request.args.get('format')
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval = float(request.args.get('interval_ms', profiler.DEFAULT_INTERVAL * 1000)) / 1000
+        profiler.check(mode, target)
+        # Web requests are served by this process, the sensor loop may run in the engine process
+        profile = getattr(sensor_system, 'profile', None)
+        if target == 'web' or profile is None:
+            filename, mimetype, body = profiler.capture(mode, target, seconds, interval, output)
+        else:
+            filename, mimetype, body = profile(mode, target, seconds, interval, output)
+    except profiler.ProfileBusy as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Profile capture failed: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.route('/api/trigger_ntp_sync', methods=['POST'])
 @login_required
 def trigger_ntp_sync_endpoint():
@@ -370,9 +760,117 @@ def trigger_ntp_sync_endpoint():
 @app.route('/api/matches')
 @login_required
 def get_matches_endpoint():
-    """API endpoint to get matches"""
-    matches = get_matches()
-    return jsonify(matches)
+    """API endpoint to get matches, or with ?since_id= only the newer ones (oldest first), answering 304 while the client's copy is current"""
+    since_id = request.args.get('since_id', type=int)
+    if since_id is None:
+        key = "matches"
+        body, version = match_cache.get("matches_json", lambda: json.dumps(get_matches()))
+    else:
+        key = f"matches-since-{since_id}"
+        body, version = match_cache.get(key, lambda: json.dumps(get_matches_since(since_id)))
+    response = Response(body, mimetype='application/json')
+    response.set_etag(match_cache.etag(key, version))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/stats')
+@login_required
+def get_stats_endpoint():
+    """API endpoint to get best, mean, median, p90, count and trend per side, overall and for a session (?session_id=, else the assigned one)"""
+    return jsonify(get_stats(request.args.get('session_id', type=int)))
+
+@app.route('/api/sessions', methods=['GET', 'POST'])
+@login_required
+def sessions_endpoint():
+    """API endpoint to list sessions with their heats, or create one"""
+    try:
+        if request.method == 'POST':
+            name = (request.json or {}).get('name')
+            if not name:
+                return jsonify({"success": False, "error": "Session name is required"}), 400
+            session_id = run_query(leaderboard.create_session, name, commit=True)
+            logger.info(f"Session created: {name}")
+            return jsonify({"success": True, "id": session_id})
+        return jsonify(run_query(leaderboard.list_sessions))
+    except Exception as e:
+        logger.error(f"Sessions request failed: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/sessions/<int:session_id>/heats', methods=['POST'])
+@login_required
+def create_heat_endpoint(session_id):
+    """API endpoint to add a heat to a session"""
+    try:
+        name = (request.json or {}).get('name')
+        if not name:
+            return jsonify({"success": False, "error": "Heat name is required"}), 400
+        heat_id = run_query(leaderboard.create_heat, session_id, name, commit=True)
+        return jsonify({"success": True, "id": heat_id})
+    except Exception as e:
+        logger.error(f"Failed to create heat: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/pilots', methods=['GET', 'POST'])
+@login_required
+def pilots_endpoint():
+    """API endpoint to list pilots, or add one"""
+    try:
+        if request.method == 'POST':
+            name = (request.json or {}).get('name')
+            if not name:
+                return jsonify({"success": False, "error": "Pilot name is required"}), 400
+            pilot_id = run_query(leaderboard.create_pilot, name, commit=True)
+            return jsonify({"success": True, "id": pilot_id})
+        return jsonify(run_query(leaderboard.list_pilots))
+    except Exception as e:
+        logger.error(f"Pilots request failed: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/assignment', methods=['GET', 'POST'])
+@login_required
+def assignment_endpoint():
+    """API endpoint to get or set the session, heat and pilot of the next run on a side"""
+    try:
+        if request.method == 'POST':
+            data = request.json or {}
+            side = data.get('side', sensor_system.SIDE)
+            run_query(leaderboard.set_assignment, side, data.get('session_id'), data.get('heat_id'),
+                      data.get('pilot_id'), commit=True)
+            logger.info(f"Next run on side {side}: session {data.get('session_id')}, "
+                        f"heat {data.get('heat_id')}, pilot {data.get('pilot_id')}")
+            return jsonify({"success": True})
+        return jsonify(run_query(leaderboard.get_assignments))
+    except Exception as e:
+        logger.error(f"Assignment request failed: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/matches/<int:match_id>/assign', methods=['POST'])
+@login_required
+def assign_match_endpoint(match_id):
+    """API endpoint to file an existing match under a session, heat and pilot"""
+    try:
+        data = request.json or {}
+        found = run_query(file_match, match_id, data.get('session_id'), data.get('heat_id'),
+                          data.get('pilot_id'), commit=True)
+        if not found:
+            return jsonify({"success": False, "error": f"Match {match_id} not found"}), 404
+        matches_changed()
+        return jsonify({"success": True})
+    except Exception as e:
+        logger.error(f"Failed to assign match {match_id}: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/leaderboard/<int:session_id>')
+@login_required
+def leaderboard_endpoint(session_id):
+    """API endpoint to get the ranked pilots of a session, or of one heat with ?heat_id="""
+    heat_id = request.args.get('heat_id', leaderboard.WHOLE_SESSION, type=int)
+    limit = request.args.get('limit', 50, type=int)
+    try:
+        return jsonify(run_query(leaderboard.get_leaderboard, session_id, heat_id, limit))
+    except Exception as e:
+        logger.error(f"Failed to get leaderboard: {e}")
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/clear_matches', methods=['POST'])
 @login_required
@@ -422,27 +920,165 @@ def export_database():
         logger.error(f"Failed to export database: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/export_matches')
+@login_required
+def export_matches():
+    """API endpoint to download the completed matches as NDJSON, tagged with this station for merging"""
+    if not os.path.exists(DB_PATH):
+        return jsonify({"error": "Database file not found"}), 404
+    station = getattr(sensor_system, 'STATION_CODE', None) or f"side_{sensor_system.SIDE}"
+    return Response(
+        match_archive.export_ndjson(DB_PATH, station),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=matches-{station}.ndjson'}
+    )
+
+@app.route('/api/archive', methods=['GET', 'POST'])
+@login_required
+def archive_endpoint():
+    """API endpoint to merge uploaded exports into the archive (files, optional stations and offsets JSON), or to summarize it"""
+    if request.method == 'GET':
+        try:
+            return jsonify(match_archive.summary(ARCHIVE_PATH))
+        except Exception as e:
+            logger.error(f"Failed to read match archive: {e}")
+            return jsonify({"error": str(e)}), 500
+    
+    uploads = request.files.getlist('files')
+    if not uploads:
+        return jsonify({"success": False, "error": "No files uploaded"}), 400
+    try:
+        stations = json.loads(request.form.get('stations') or '{}')
+        offsets = json.loads(request.form.get('offsets') or '{}')
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"Invalid stations or offsets: {e}"}), 400
+    if not isinstance(stations, dict) or not all(isinstance(station, str) for station in stations.values()):
+        return jsonify({"success": False, "error": "stations must be a JSON object of file name to station name"}), 400
+    if not isinstance(offsets, dict):
+        return jsonify({"success": False, "error": "offsets must be a JSON object of station name to seconds"}), 400
+    try:
+        offsets = {station: float(seconds) for station, seconds in offsets.items()}
+    except (ValueError, TypeError) as e:
+        return jsonify({"success": False, "error": f"Invalid offsets: {e}"}), 400
+    
+    conn = match_archive.open_archive(ARCHIVE_PATH)
+    results = []
+    try:
+        for upload in uploads:
+            # Spooled to disk, SQLite needs a file and NDJSON exports can be large
+            with tempfile.NamedTemporaryFile(suffix=os.path.splitext(upload.filename)[1]) as temp:
+                upload.save(temp)
+                temp.flush()
+                station = stations.get(upload.filename) or match_archive.default_station(upload.filename)
+                results.append(match_archive.merge_source(conn, temp.name, station, offsets, name=upload.filename))
+        logger.info(f"Merged {len(results)} exports into the match archive: "
+                    f"{sum(result['inserted'] for result in results)} new matches")
+        return jsonify({"success": True, "results": results})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e), "results": results}), 400
+    except Exception as e:
+        logger.error(f"Failed to merge into the match archive: {e}")
+        return jsonify({"success": False, "error": str(e), "results": results}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/trace/<int:match_id>')
+@login_required
+def export_trace(match_id):
+    """API endpoint to download the raw sensor trace around a match (JSON, or CSV with ?format=csv)"""
+    trace = getattr(sensor_system, 'trace', None)
+    if trace is None:
+        return jsonify({"error": "Sensor trace is not enabled"}), 404
+    match = get_match(match_id)
+    if match is None:
+        return jsonify({"error": f"Match {match_id} not found"}), 404
+    
+    before = request.args.get('before', 5.0, type=float)
+    after = request.args.get('after', 2.0, type=float)
+    # Match times are on the peer reference clock when following one, the trace is on this machine's clock
+    local_time = getattr(sensor_system, 'local_time', lambda event_time: event_time)
+    records = trace.window(local_time(match['start_time']) - before, local_time(match['finish_time']) + after)
+    
+    if request.args.get('format') == 'csv':
+        lines = ["time_ns,time,kind,pin,name,level"]
+        for r in records:
+            lines.append(f"{r['time_ns']},{r['time']:.9f},{r['kind']},{'' if r['pin'] is None else r['pin']},"
+                         f"{r['name']},{'' if r['level'] is None else r['level']}")
+        return Response(
+            "\n".join(lines) + "\n",
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=trace_match_{match_id}.csv'}
+        )
+    return jsonify({
+        "match_id": match_id,
+        "side": match['side'],
+        "start_time": match['start_time'],
+        "finish_time": match['finish_time'],
+        "records": records
+    })
+
 @app.route('/api/log_stream')
 @login_required
 def log_stream():
-    """Server-sent event stream for logs"""
+    """Server-sent event stream for logs, and for matches completed after ?since_id= as they are saved"""
+    since_id = request.args.get('since_id', type=int)
+    latest = latest_match_id()
+    if since_id is None:
+        since_id = latest
+    events = queue.Queue(maxsize=1000)
+    # Matches saved while a reconnecting client was away are sent right away
+    if since_id != latest:
+        events.put_nowait(("matches", None))
+    with stream_lock:
+        stream_subscribers.add(events)
+    
     def generate():
+        last_match_id = since_id
         last_msg = None
-        while True:
-            try:
-                # Non-blocking queue get with timeout
-                msg = log_queue.get(timeout=0.5)
-                if msg != last_msg:  # Avoid duplicates
-                    last_msg = msg
-                    yield f"data: {json.dumps({'message': msg})}\n\n"
-            except queue.Empty:
-                # If queue is empty, send heartbeat to keep connection
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-                
-            time.sleep(0.1)  # Prevent CPU overuse
+        try:
+            while True:
+                try:
+                    kind, payload = events.get(timeout=0.5)
+                except queue.Empty:
+                    # If queue is empty, send heartbeat to keep connection
+                    yield f"data: {json.dumps({'heartbeat': True})}\n\n"
+                    continue
+                if kind == "matches":
+                    # Shared by every client at the same match, built once per change
+                    (text, newest), _ = match_cache.get(f"stream-{last_match_id}",
+                                                        lambda: match_stream_events(last_match_id))
+                    last_match_id = newest
+                    yield text
+                elif payload != last_msg:  # Avoid duplicates
+                    last_msg = payload
+                    yield f"data: {json.dumps({'message': payload})}\n\n"
+        finally:
+            with stream_lock:
+                stream_subscribers.discard(events)
     
     return Response(generate(), mimetype='text/event-stream')
 
+@app.route('/api/logs')
+@login_required
+def stored_logs_endpoint():
+    """API endpoint to read persisted logs: the last ?lines=, or a ?start=&end= range (unix time) matching ?q="""
+    store = get_log_store()
+    if store is None:
+        return jsonify({"error": "Log store is not enabled"}), 404
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    text = request.args.get('q')
+    limit = request.args.get('lines', 200 if start is None and end is None and not text else 1000, type=int)
+    try:
+        if start is None and end is None and not text:
+            lines = store.tail(limit)
+        else:
+            lines = store.query(start, end, text, limit)
+        return jsonify([{"time": timestamp, "message": line} for timestamp, line in lines])
+    except Exception as e:
+        logger.error(f"Failed to read stored logs: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/update_ntp_servers', methods=['POST'])
 @login_required
 def update_ntp_servers():
@@ -488,6 +1124,7 @@ def reboot_system():
         reboot_command = ["sudo", "reboot"]
         
         # Execute the command in a non-blocking way
+        flush_logs()
         subprocess.Popen(reboot_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
         return jsonify({"success": True})
@@ -508,6 +1145,11 @@ def kill_script():
         # Schedule the script to exit after sending the response
         def delayed_exit():
             time.sleep(2)  # Give time for the response to be sent
+            flush_logs()  # os._exit skips the atexit flush
+            # In isolated mode the sensor engine is a separate process and has to exit too
+            exit_engine = getattr(sensor_system, 'exit_engine', None)
+            if exit_engine is not None:
+                exit_engine()
             os._exit(0)  # Force exit the process
         
         # Start the delayed exit in a separate thread
@@ -532,6 +1174,7 @@ def shutdown_system():
         shutdown_command = ["sudo", "shutdown", "-h", "now"]
         
         # Execute the command in a non-blocking way
+        flush_logs()
         subprocess.Popen(shutdown_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
         return jsonify({"success": True})
@@ -556,9 +1199,10 @@ def save_direct_mode():
         new_mode = bool(data['direct_mode'])
         config['direct_mode'] = new_mode
         
-        # Save config
+        # Save config, then switch the running timer over between races
         if save_config(config):
             logger.info(f"Direct mode setting saved to config: {'DIRECT' if new_mode else 'PROXY'}")
+            sensor_system.reload_config(config)
             return jsonify({"success": True})
         else:
             return jsonify({"success": False, "error": "Failed to save configuration"})
@@ -566,6 +1210,30 @@ def save_direct_mode():
         logger.error(f"Failed to save direct mode setting: {e}")
         return jsonify({"success": False, "error": str(e)})
 
+@app.route('/api/reload_config', methods=['POST'])
+@login_required
+def reload_config_endpoint():
+    """API endpoint to apply config changes without a restart: JSON body settings are merged into config.json, an empty body re-reads it"""
+    try:
+        updates = request.get_json(silent=True) or {}
+        if not isinstance(updates, dict):
+            return jsonify({"success": False, "error": "Expected a JSON object of config sections"}), 400
+        config = config_reload.read_config(CONFIG_FILE) if os.path.exists(CONFIG_FILE) else load_config()
+        config_reload.merge_config(config, updates)
+        errors = config_reload.validate(config)
+        if errors:
+            return jsonify({"success": False, "error": "Invalid configuration", "errors": errors}), 400
+        if updates and not save_config(config):
+            return jsonify({"success": False, "error": "Failed to save configuration"}), 500
+        result = sensor_system.reload_config(config)
+        logger.info(f"Configuration reload requested, changed: {', '.join(result['changed']) or 'nothing'}")
+        return jsonify({"success": True, **result})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Failed to reload configuration: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 def load_config():
     """Load configuration from file or create with defaults if it doesn't exist"""
     try:
@@ -585,11 +1253,13 @@ def load_config():
         return DEFAULT_CONFIG.copy()
 
 def save_config(config):
-    """Save configuration to file"""
+    """Save configuration to file, replacing it in one step so a reload never reads half a file"""
     try:
-        with open(CONFIG_FILE, 'w') as f:
+        temp_file = f"{CONFIG_FILE}.tmp"
+        with open(temp_file, 'w') as f:
             json.dump(config, f, indent=4)
-            logger.info(f"Configuration saved to {CONFIG_FILE}")
+        os.replace(temp_file, CONFIG_FILE)
+        logger.info(f"Configuration saved to {CONFIG_FILE}")
         return True
     except Exception as e:
         logger.error(f"Failed to save configuration: {e}")
@@ -625,7 +1295,11 @@ if __name__ == "__main__":
             
         def trigger_finish_event(self):
             logger.info("Mock FINISH event triggered")
-    
+
+        def reload_config(self, config=None):
+            self.DIRECT_MODE = (config or {}).get("direct_mode", self.DIRECT_MODE)
+            return {"changed": [], "restart_required": []}
+
     # Initialize with mock data
     initialize_web_server(MockSensorSystem())
     